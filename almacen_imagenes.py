@@ -0,0 +1,89 @@
+# almacen_imagenes.py - ALMACÉN DE IMÁGENES DIRECCIONADO POR CONTENIDO
+import hashlib
+import os
+import streamlit as st
+from cache_usuario import cache
+
+# ========== CONFIGURACIÓN ==========
+DIRECTORIO_POR_DEFECTO = os.path.join("data", "imagenes")
+PREFIJO_BUCKET = "imagenes"
+
+# ========== BACKENDS ==========
+def calcular_referencia(datos):
+    """Referencia estable de un blob: el hash SHA-256 de su contenido"""
+    return f"sha256:{hashlib.sha256(datos).hexdigest()}"
+
+class AlmacenBlobsLocal:
+    """Guarda blobs en el sistema de archivos local, repartidos en subdirectorios por hash"""
+
+    def __init__(self, directorio=DIRECTORIO_POR_DEFECTO):
+        self.directorio = directorio
+
+    def _ruta(self, referencia):
+        digest = referencia.split(":", 1)[-1]
+        return os.path.join(self.directorio, digest[:2], digest)
+
+    def existe(self, referencia):
+        return os.path.exists(self._ruta(referencia))
+
+    def guardar(self, datos, tipo_contenido="application/octet-stream"):
+        referencia = calcular_referencia(datos)
+        ruta = self._ruta(referencia)
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.tmp"
+            with open(temporal, "wb") as f:
+                f.write(datos)
+            os.replace(temporal, ruta)  # Escritura atómica: nunca queda un blob a medias
+        return referencia
+
+    def leer(self, referencia):
+        with open(self._ruta(referencia), "rb") as f:
+            return f.read()
+
+class AlmacenBlobsBucket:
+    """Guarda blobs en un bucket de Cloud Storage (Firebase Storage)"""
+
+    def __init__(self, nombre_bucket=None, prefijo=PREFIJO_BUCKET):
+        from firebase_admin import storage
+        self.bucket = storage.bucket(nombre_bucket)
+        self.prefijo = prefijo
+
+    def _blob(self, referencia):
+        digest = referencia.split(":", 1)[-1]
+        return self.bucket.blob(f"{self.prefijo}/{digest}")
+
+    def existe(self, referencia):
+        return self._blob(referencia).exists()
+
+    def guardar(self, datos, tipo_contenido="application/octet-stream"):
+        referencia = calcular_referencia(datos)
+        blob = self._blob(referencia)
+        if not blob.exists():
+            blob.upload_from_string(datos, content_type=tipo_contenido)
+        return referencia
+
+    def leer(self, referencia):
+        return self._blob(referencia).download_as_bytes()
+
+_almacen_blobs = None
+
+def obtener_almacen_blobs():
+    """Devuelve el backend configurado en secrets (IMAGENES_BACKEND = 'local' | 'bucket')"""
+    global _almacen_blobs
+    if _almacen_blobs is None:
+        backend = st.secrets.get("IMAGENES_BACKEND", os.environ.get("IMAGENES_BACKEND", "local"))
+        if backend == "bucket":
+            _almacen_blobs = AlmacenBlobsBucket(st.secrets.get("IMAGENES_BUCKET", os.environ.get("IMAGENES_BUCKET")))
+        else:
+            _almacen_blobs = AlmacenBlobsLocal(st.secrets.get("IMAGENES_DIRECTORIO", DIRECTORIO_POR_DEFECTO))
+    return _almacen_blobs
+
+# ========== IMÁGENES DE OPERACIONES ==========
+def cargar_imagen(referencia):
+    """Lee la imagen completa (con caché en memoria, el contenido nunca cambia para una referencia)"""
+    datos = cache.obtener(("imagen", referencia))
+    if datos is None:
+        datos = obtener_almacen_blobs().leer(referencia)
+        cache.guardar(("imagen", referencia), datos)
+    return datos
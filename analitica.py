@@ -0,0 +1,155 @@
+# analitica.py - NÚCLEO VECTORIZADO DE MÉTRICAS (COMPARTIDO POR DASHBOARD Y JOURNALING)
+import numpy as np
+import pandas as pd
+from trazas import trazar
+
+# ========== CONFIGURACIÓN ==========
+RESULTADO_GANADOR = 'Ganadora'
+DIMENSIONES = ['activo', 'timeframe', 'emocion_antes', 'emocion_durante', 'emocion_despues']
+
+# ========== CODIFICACIÓN ==========
+def codificar_resultado(resultado):
+    """+1 para operaciones ganadoras y -1 para el resto, sin apply fila a fila"""
+    return np.where(np.asarray(resultado, dtype=object) == RESULTADO_GANADOR, 1, -1).astype(np.int8)
+
+def codificar_categorias(valores):
+    """Códigos enteros y categorías (ordenadas, como groupby) de una columna categórica"""
+    codigos, categorias = pd.factorize(valores, sort=True)
+    return codigos, np.asarray(categorias)
+
+# ========== VERSIÓN DEL DATASET ==========
+def version_dataset(df):
+    """Huella barata del contenido: cambia si se añade, edita o borra alguna operación"""
+    total = 0
+    for columna in ('id', 'timestamp', 'fecha'):
+        if columna not in df.columns:
+            continue
+        valores = df[columna]
+        if columna != 'id':
+            # Las marcas de tiempo de Firestore llegan como objetos: se pasan a datetime64 para hashear en bloque
+            valores = pd.to_datetime(valores, format='ISO8601', errors='coerce', utc=True)
+        total += int(pd.util.hash_pandas_object(valores, index=False).sum())
+    return f"{len(df)}-{total & 0xFFFFFFFFFFFFFFFF:x}"
+
+# ========== KPIs EN UNA PASADA ==========
+def _agregar_grupo(codigos, n_categorias, ganadora, resultado_num, profit):
+    validos = codigos >= 0  # -1 = valor nulo, groupby también los descarta
+    codigos = codigos[validos]
+    grupo = {
+        'n': np.bincount(codigos, minlength=n_categorias),
+        'ganadoras': np.bincount(codigos, weights=ganadora[validos], minlength=n_categorias),
+        'resultado_sum': np.bincount(codigos, weights=resultado_num[validos], minlength=n_categorias),
+    }
+    if profit is not None:
+        grupo['profit'] = np.bincount(codigos, weights=profit[validos], minlength=n_categorias)
+    return grupo
+
+@trazar('calculo')
+def calcular_kpis(df):
+    """Calcula todos los KPIs y agregados por dimensión con arrays NumPy en una sola pasada
+
+    Devuelve un diccionario con los totales, las métricas de P&L/drawdown (si hay
+    columna profit_loss) y, en 'grupos', los contadores por activo, timeframe y emoción.
+    """
+    if df is None or df.empty:
+        return {}
+
+    total = len(df)
+    if 'resultado_num' in df.columns:
+        resultado_num = df['resultado_num'].to_numpy(dtype=np.float64)
+    elif 'resultado' in df.columns:
+        resultado_num = codificar_resultado(df['resultado'].to_numpy()).astype(np.float64)
+    else:
+        resultado_num = np.full(total, -1.0)
+    ganadora = (resultado_num > 0).astype(np.float64)
+    ganadoras = int(ganadora.sum()) if 'resultado' in df.columns or 'resultado_num' in df.columns else 0
+
+    kpis = {
+        'total': total,
+        'ganadoras': ganadoras,
+        'perdedoras': total - ganadoras,
+        'win_rate': round(ganadoras / total * 100, 2) if total > 0 else 0,
+        'grupos': {},
+    }
+
+    profit = None
+    if 'profit_loss' in df.columns and not df['profit_loss'].isnull().all():
+        profit = df['profit_loss'].to_numpy(dtype=np.float64)
+        equity = df['equity_curve'].to_numpy(dtype=np.float64) if 'equity_curve' in df.columns else np.cumsum(profit)
+        drawdowns = equity - np.maximum.accumulate(equity)
+        kpis.update({
+            'profit_total': round(float(np.nansum(profit)), 2),
+            'profit_promedio': round(float(np.nanmean(profit)), 2),
+            'profit_maximo': round(float(np.nanmax(profit)), 2),
+            'profit_minimo': round(float(np.nanmin(profit)), 2),
+            'max_drawdown': round(float(np.min(drawdowns)), 2) if len(drawdowns) > 0 else 0,
+            'drawdown_actual': round(float(drawdowns[-1]), 2) if len(drawdowns) > 0 else 0,
+        })
+
+    for dimension in DIMENSIONES:
+        if dimension not in df.columns:
+            continue
+        codigos, categorias = codificar_categorias(df[dimension])
+        if len(categorias) == 0:
+            continue
+        grupo = _agregar_grupo(codigos, len(categorias), ganadora, resultado_num, profit)
+        grupo['categorias'] = categorias
+        kpis['grupos'][dimension] = grupo
+
+    return kpis
+
+# ========== CONSULTAS SOBRE GRUPOS ==========
+def extremos_grupo(kpis, dimension, campo, media=False):
+    """(mejor, peor) categoría de una dimensión según un campo agregado (o su media por operación)"""
+    grupo = kpis.get('grupos', {}).get(dimension)
+    if grupo is None or campo not in grupo:
+        return None, None
+    presentes = grupo['n'] > 0
+    if not presentes.any():
+        return None, None
+    valores = grupo[campo][presentes]
+    if media:
+        valores = valores / grupo['n'][presentes]
+    categorias = grupo['categorias'][presentes]
+    # argmax/argmin devuelven la primera coincidencia, igual que idxmax/idxmin sobre categorías ordenadas
+    return categorias[np.argmax(valores)], categorias[np.argmin(valores)]
+
+def tasas_por_categoria(kpis, dimension):
+    """Media de resultado_num (+1/-1) por categoría en porcentaje"""
+    grupo = kpis.get('grupos', {}).get(dimension)
+    if grupo is None:
+        return {}
+    presentes = grupo['n'] > 0
+    tasas = grupo['resultado_sum'][presentes] / grupo['n'][presentes] * 100
+    return dict(zip(grupo['categorias'][presentes], tasas))
+
+# ========== REDUCCIÓN DE SERIES ==========
+def indices_lttb(x, y, n_puntos):
+    """Índices de los puntos que conserva Largest-Triangle-Three-Buckets
+
+    Reduce una serie a n_puntos manteniendo su forma visual (picos y valles); siempre
+    conserva el primer y el último punto. Si la serie ya es corta devuelve todos los índices.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_puntos >= n or n_puntos < 3:
+        return np.arange(n)
+
+    bordes = np.linspace(1, n - 1, n_puntos - 1).astype(np.int64)  # n_puntos - 2 buckets interiores
+    indices = np.empty(n_puntos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for i in range(n_puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        siguiente_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        media_x = x[fin:siguiente_fin].mean()
+        media_y = y[fin:siguiente_fin].mean()
+        # Área del triángulo (punto elegido anterior, candidato, media del bucket siguiente)
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fin] - y[anterior])
+            - (x[anterior] - x[inicio:fin]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
@@ -0,0 +1,218 @@
+# backtester.py - BACKTEST VECTORIZADO DE LAS RESTRICCIONES DEL PLAN SOBRE EL JOURNAL O SOBRE BARRAS OHLCV
+import numpy as np
+import pandas as pd
+from calculo_pl import riesgo_monetario_plan
+from trazas import trazar
+
+# ========== CONFIGURACIÓN ==========
+MEDIA_RAPIDA = 20
+MEDIA_LENTA = 50
+PERIODO_ATR = 14
+MULTIPLO_ATR_STOP = 1.5
+RATIO_RR = 2.0
+MAX_BARRAS_OPERACION = 100
+TAMANO_BLOQUE_OPERACIONES = 50_000  # operaciones resueltas a la vez (memoria acotada)
+
+ALIAS_OHLCV = {
+    'fecha': ['fecha', 'date', 'time', 'datetime', 'timestamp', 'gmt time', 'local time'],
+    'open': ['open', 'apertura', 'o'],
+    'high': ['high', 'maximo', 'máximo', 'h'],
+    'low': ['low', 'minimo', 'mínimo', 'l'],
+    'close': ['close', 'cierre', 'c'],
+}
+
+# ========== RESTRICCIONES DEL PLAN ==========
+def minutos_hora(hora):
+    """'HH:MM' -> minutos desde medianoche"""
+    horas, minutos = str(hora).split(':')[:2]
+    return int(horas) * 60 + int(minutos)
+
+def mascara_horario(fechas, hora_inicio, hora_fin):
+    """True para las marcas de tiempo dentro del horario del plan (admite horarios que cruzan medianoche)"""
+    fechas = pd.DatetimeIndex(fechas)
+    minuto = fechas.hour.to_numpy() * 60 + fechas.minute.to_numpy()
+    inicio, fin = minutos_hora(hora_inicio), minutos_hora(hora_fin)
+    if inicio <= fin:
+        return (minuto >= inicio) & (minuto < fin)
+    return (minuto >= inicio) | (minuto < fin)
+
+def mascara_limite_diario(fechas, elegibles, maximo):
+    """True para las primeras `maximo` operaciones elegibles de cada día (fechas en orden cronológico)"""
+    fechas = pd.DatetimeIndex(fechas)
+    dias = fechas.normalize().asi8
+    posiciones = np.flatnonzero(elegibles)
+    mascara = np.zeros(len(fechas), dtype=bool)
+    if len(posiciones) == 0:
+        return mascara
+    dias_elegibles = dias[posiciones]
+    # Orden dentro del día: posición menos la del primer elegible de ese día
+    nuevo_dia = np.r_[True, dias_elegibles[1:] != dias_elegibles[:-1]]
+    inicio_dia = np.maximum.accumulate(np.where(nuevo_dia, np.arange(len(posiciones)), 0))
+    rango = np.arange(len(posiciones)) - inicio_dia
+    mascara[posiciones[rango < maximo]] = True
+    return mascara
+
+def aplicar_plan(fechas, r_multiple, plan, pl_original=None):
+    """Aplica horario, límite diario y riesgo por operación del plan a una lista cronológica de operaciones
+
+    Devuelve (mascara de operaciones que el plan habría permitido, P&L con el tamaño del plan).
+    Las operaciones sin R-múltiplo conservan su P&L original.
+    """
+    r_multiple = np.asarray(r_multiple, dtype=np.float64)
+    permitidas = np.ones(len(r_multiple), dtype=bool)
+    if plan.get('hora_inicio') and plan.get('hora_fin'):
+        permitidas &= mascara_horario(fechas, plan['hora_inicio'], plan['hora_fin'])
+    if plan.get('max_operaciones_dia'):
+        permitidas = mascara_limite_diario(fechas, permitidas, int(plan['max_operaciones_dia']))
+    pl = r_multiple * riesgo_monetario_plan(plan)
+    if pl_original is not None:
+        pl = np.where(np.isnan(r_multiple), np.asarray(pl_original, dtype=np.float64), pl)
+    return permitidas, np.nan_to_num(np.where(permitidas, pl, 0.0))
+
+# ========== RESUMEN ==========
+def resumir(pl, operadas):
+    """P&L total, drawdown máximo, operaciones y win rate de una serie de P&L por operación"""
+    pl = np.asarray(pl, dtype=np.float64)
+    equity = np.cumsum(pl)
+    drawdown = equity - np.maximum.accumulate(np.r_[0.0, equity])[1:] if len(equity) else equity
+    n = int(operadas.sum())
+    return {
+        'operaciones': n,
+        'profit_total': round(float(equity[-1]), 2) if len(equity) else 0.0,
+        'max_drawdown': round(float(drawdown.min()), 2) if len(drawdown) else 0.0,
+        'win_rate': round(float((pl[operadas] > 0).sum()) / n * 100, 2) if n else 0.0,
+        'equity': equity,
+    }
+
+def _comparar(fechas, pl_base, pl_plan, permitidas):
+    base = resumir(pl_base, np.ones(len(pl_base), dtype=bool))
+    con_plan = resumir(pl_plan, permitidas)
+    return {
+        'fechas': pd.DatetimeIndex(fechas),
+        'base': base,
+        'plan': con_plan,
+        'descartadas': int((~permitidas).sum()),
+        'diferencia_profit': round(con_plan['profit_total'] - base['profit_total'], 2),
+        'diferencia_drawdown': round(con_plan['max_drawdown'] - base['max_drawdown'], 2),
+    }
+
+# ========== MODO 1: REPETIR EL JOURNAL ==========
+def _columna(df, nombre):
+    if nombre not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[nombre], errors='coerce').to_numpy(dtype=np.float64)
+
+@trazar('calculo')
+def backtest_journal(operaciones, plan):
+    """Reproduce las operaciones registradas como si se hubiera seguido el plan
+
+    Las operaciones deben tener ya los campos del motor de P&L (completar_pl). La base es
+    el P&L registrado; con el plan, cada R se valora al riesgo del plan menos su comisión.
+    """
+    df = pd.DataFrame(operaciones)
+    df['fecha'] = pd.to_datetime(df['fecha'], format='ISO8601', errors='coerce')
+    df = df.dropna(subset=['fecha']).sort_values('fecha', kind='stable')
+    fechas = df['fecha'].to_numpy()
+    pl_base = np.nan_to_num(_columna(df, 'pl'))
+    r_multiple = _columna(df, 'r_multiple')
+    permitidas, pl_plan = aplicar_plan(fechas, r_multiple, plan, pl_base)
+    pl_plan -= np.where(permitidas & ~np.isnan(r_multiple), np.nan_to_num(_columna(df, 'comision')), 0.0)
+    return _comparar(fechas, pl_base, pl_plan, permitidas)
+
+# ========== MODO 2: BARRAS OHLCV ==========
+def cargar_ohlcv(fichero, nombre):
+    """Lee un CSV o Parquet de barras y lo normaliza a fecha/open/high/low/close ordenado por fecha"""
+    barras = pd.read_parquet(fichero) if nombre.lower().endswith('.parquet') else pd.read_csv(fichero)
+    columnas = {c.lower().strip(): c for c in barras.columns}
+    renombrar = {}
+    for campo, alias in ALIAS_OHLCV.items():
+        origen = next((columnas[a] for a in alias if a in columnas), None)
+        if origen is None:
+            raise ValueError(f"Falta la columna '{campo}' en el fichero de barras")
+        renombrar[origen] = campo
+    barras = barras.rename(columns=renombrar)[list(ALIAS_OHLCV)]
+    barras['fecha'] = pd.to_datetime(barras['fecha'], errors='coerce')
+    barras = barras.dropna().sort_values('fecha').reset_index(drop=True)
+    return barras
+
+def _media_movil(valores, periodo):
+    acumulado = np.cumsum(np.r_[0.0, valores])
+    media = np.full(len(valores), np.nan)
+    media[periodo - 1:] = (acumulado[periodo:] - acumulado[:-periodo]) / periodo
+    return media
+
+def senales_cruce_medias(close, rapida=MEDIA_RAPIDA, lenta=MEDIA_LENTA):
+    """+1 cuando la media rápida cruza al alza la lenta, -1 a la baja, 0 en el resto
+
+    Las reglas de entrada del plan son texto libre: el cruce de medias es la regla
+    mecánica de referencia sobre la que se aplican las restricciones del plan.
+    """
+    diferencia = np.sign(_media_movil(close, rapida) - _media_movil(close, lenta))
+    senales = np.zeros(len(close), dtype=np.int8)
+    cruce = np.r_[False, (diferencia[1:] != diferencia[:-1]) & (diferencia[:-1] != 0) & ~np.isnan(diferencia[:-1])]
+    senales[cruce] = diferencia[cruce].astype(np.int8)
+    return senales
+
+def _atr(high, low, close, periodo=PERIODO_ATR):
+    cierre_previo = np.r_[close[0], close[:-1]]
+    rango = np.maximum(high - low, np.maximum(np.abs(high - cierre_previo), np.abs(low - cierre_previo)))
+    return _media_movil(rango, periodo)
+
+def resolver_salidas(high, low, close, entradas, direccion, stop, objetivo, max_barras=MAX_BARRAS_OPERACION):
+    """R-múltiplo de cada operación según qué toca antes, SL o TP, en las barras siguientes
+
+    Se evalúa por bloques de operaciones con ventanas de `max_barras` barras; si en la
+    misma barra se tocan ambos niveles se asume el SL (criterio conservador). Sin toque,
+    la operación se cierra al cierre de la última barra de la ventana.
+    """
+    n = len(close)
+    r_multiple = np.empty(len(entradas))
+    desplazamientos = np.arange(1, max_barras + 1)
+    for inicio in range(0, len(entradas), TAMANO_BLOQUE_OPERACIONES):
+        bloque = slice(inicio, inicio + TAMANO_BLOQUE_OPERACIONES)
+        e, d = entradas[bloque], direccion[bloque]
+        sl, tp = stop[bloque], objetivo[bloque]
+        ventana = np.minimum(e[:, None] + desplazamientos, n - 1)
+        altos, bajos = high[ventana], low[ventana]
+        largo = d[:, None] > 0
+        toca_sl = np.where(largo, bajos <= sl[:, None], altos >= sl[:, None])
+        toca_tp = np.where(largo, altos >= tp[:, None], bajos <= tp[:, None])
+        sin_sl = ~toca_sl.any(axis=1)
+        sin_tp = ~toca_tp.any(axis=1)
+        primer_sl = np.where(sin_sl, max_barras, toca_sl.argmax(axis=1))
+        primer_tp = np.where(sin_tp, max_barras, toca_tp.argmax(axis=1))
+        entrada = close[e]
+        riesgo = np.abs(entrada - sl)
+        salida_tiempo = d * (close[ventana[:, -1]] - entrada) / riesgo
+        r = np.where(primer_sl <= primer_tp, -1.0, np.abs(tp - entrada) / riesgo)
+        r_multiple[bloque] = np.where(sin_sl & sin_tp, salida_tiempo, r)
+    return r_multiple
+
+@trazar('calculo')
+def backtest_ohlcv(barras, plan, ratio_rr=RATIO_RR, multiplo_atr=MULTIPLO_ATR_STOP, max_barras=MAX_BARRAS_OPERACION):
+    """Genera operaciones con la regla de referencia sobre las barras y compara sin plan / con plan
+
+    Entrada al cierre de la barra de señal, SL a `multiplo_atr` ATR y TP a `ratio_rr` veces
+    esa distancia. La base arriesga lo mismo por operación pero sin horario ni límite diario.
+    """
+    high = barras['high'].to_numpy(dtype=np.float64)
+    low = barras['low'].to_numpy(dtype=np.float64)
+    close = barras['close'].to_numpy(dtype=np.float64)
+    fechas = barras['fecha'].to_numpy()
+
+    senales = senales_cruce_medias(close)
+    atr = _atr(high, low, close)
+    entradas = np.flatnonzero((senales != 0) & (atr > 0))
+    entradas = entradas[entradas < len(close) - 1]
+    direccion = senales[entradas].astype(np.float64)
+    distancia = multiplo_atr * atr[entradas]
+    stop = close[entradas] - direccion * distancia
+    objetivo = close[entradas] + direccion * distancia * ratio_rr
+
+    r_multiple = resolver_salidas(high, low, close, entradas, direccion, stop, objetivo, max_barras)
+    fechas_operaciones = fechas[entradas]
+    pl_base = np.nan_to_num(r_multiple * riesgo_monetario_plan(plan))
+    permitidas, pl_plan = aplicar_plan(fechas_operaciones, r_multiple, plan)
+    resultado = _comparar(fechas_operaciones, pl_base, pl_plan, permitidas)
+    resultado['barras'] = len(close)
+    return resultado
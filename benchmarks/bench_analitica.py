@@ -0,0 +1,105 @@
+# benchmarks/bench_analitica.py - COMPARATIVA DEL NÚCLEO VECTORIZADO FRENTE AL CÁLCULO CON PANDAS
+#
+# Uso: python benchmarks/bench_analitica.py
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analitica import calcular_kpis, codificar_resultado, extremos_grupo  # noqa: E402
+
+TAMANOS = [1_000, 10_000, 100_000]
+REPETICIONES = 5
+
+ACTIVOS = ["EUR/USD", "GBP/USD", "USD/JPY", "BTC/USD", "AAPL", "NAS100", "XAU/USD"]
+TIMEFRAMES = ["1m", "5m", "15m", "30m", "1H", "4H", "1D"]
+EMOCIONES = ["Confianza", "Ansiedad", "Miedo", "Euforia", "Neutral", "Indecisión"]
+
+def generar_df(n, semilla=42):
+    """DataFrame sintético con las columnas que produce procesar_datos_operaciones"""
+    rng = np.random.default_rng(semilla)
+    entrada = rng.uniform(1.0, 2.0, n)
+    riesgo = rng.uniform(0.001, 0.02, n)
+    df = pd.DataFrame({
+        "fecha": pd.date_range("2023-01-01", periods=n, freq="15min"),
+        "activo": rng.choice(ACTIVOS, n),
+        "timeframe": rng.choice(TIMEFRAMES, n),
+        "resultado": rng.choice(["Ganadora", "Perdedora"], n, p=[0.45, 0.55]),
+        "emocion_antes": rng.choice(EMOCIONES, n),
+        "emocion_durante": rng.choice(EMOCIONES, n),
+        "emocion_despues": rng.choice(EMOCIONES, n),
+        "precio_entrada": entrada,
+        "stop_loss": entrada - riesgo,
+        "take_profit": entrada + riesgo * rng.uniform(1.0, 3.0, n),
+    })
+    return df
+
+def preparar_df(df):
+    """Columnas de P&L comunes a ambos caminos (fuera del cronómetro)"""
+    df = df.copy()
+    resultado_num = np.where(df['resultado'] == 'Ganadora', 1, -1)
+    df['risk_reward_ratio'] = (df['take_profit'] - df['precio_entrada']) / (df['precio_entrada'] - df['stop_loss'])
+    df['profit_loss'] = resultado_num * df['risk_reward_ratio'] * 100
+    df['equity_curve'] = df['profit_loss'].cumsum()
+    return df
+
+def referencia_pandas(df):
+    """Cálculo previo: apply fila a fila y un groupby por cada métrica"""
+    df['resultado_num'] = df['resultado'].apply(lambda x: 1 if x == 'Ganadora' else -1)
+    equity = df['equity_curve'].values
+    drawdowns = equity - np.maximum.accumulate(equity)
+    resultado = {
+        'ganadoras': len(df[df['resultado'] == 'Ganadora']),
+        'profit_total': round(df['profit_loss'].sum(), 2),
+        'max_drawdown': round(np.min(drawdowns), 2),
+        'mejor_activo': df.groupby('activo')['profit_loss'].sum().idxmax(),
+        'mejor_activo_num': df.groupby('activo')['resultado_num'].sum().idxmax(),
+        'peor_activo_num': df.groupby('activo')['resultado_num'].sum().idxmin(),
+        'mejor_timeframe': df.groupby('timeframe')['resultado_num'].sum().idxmax(),
+    }
+    for campo in ['emocion_antes', 'emocion_durante', 'emocion_despues']:
+        resultado[f'mejor_{campo}'] = (df.groupby(campo)['resultado_num'].mean() * 100).idxmax()
+    return resultado
+
+def vectorizado(df):
+    """Mismo cálculo con el núcleo de analitica"""
+    df['resultado_num'] = codificar_resultado(df['resultado'].to_numpy())
+    kpis = calcular_kpis(df)
+    resultado = {
+        'ganadoras': kpis['ganadoras'],
+        'profit_total': kpis['profit_total'],
+        'max_drawdown': kpis['max_drawdown'],
+        'mejor_activo': extremos_grupo(kpis, 'activo', 'profit')[0],
+        'mejor_activo_num': extremos_grupo(kpis, 'activo', 'resultado_sum')[0],
+        'peor_activo_num': extremos_grupo(kpis, 'activo', 'resultado_sum')[1],
+        'mejor_timeframe': extremos_grupo(kpis, 'timeframe', 'resultado_sum')[0],
+    }
+    for campo in ['emocion_antes', 'emocion_durante', 'emocion_despues']:
+        resultado[f'mejor_{campo}'] = extremos_grupo(kpis, campo, 'resultado_sum', media=True)[0]
+    return resultado
+
+def cronometrar(funcion, df):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        funcion(df)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+def main():
+    print(f"{'operaciones':>12} {'pandas (ms)':>12} {'numpy (ms)':>12} {'speedup':>8}")
+    for n in TAMANOS:
+        df = preparar_df(generar_df(n))
+        esperado, obtenido = referencia_pandas(df), vectorizado(df)
+        if esperado != obtenido:
+            diferencias = {k: (esperado[k], obtenido[k]) for k in esperado if esperado[k] != obtenido[k]}
+            raise AssertionError(f"Resultados distintos con {n} operaciones: {diferencias}")
+        t_pandas = cronometrar(referencia_pandas, df)
+        t_numpy = cronometrar(vectorizado, df)
+        print(f"{n:>12,} {t_pandas * 1000:>12.2f} {t_numpy * 1000:>12.2f} {t_pandas / t_numpy:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
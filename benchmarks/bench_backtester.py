@@ -0,0 +1,88 @@
+# benchmarks/bench_backtester.py - RENDIMIENTO DEL BACKTEST VECTORIZADO SOBRE BARRAS OHLCV SINTÉTICAS
+#
+# Uso: python benchmarks/bench_backtester.py
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backtester import backtest_ohlcv, resolver_salidas  # noqa: E402
+
+TAMANOS = [100_000, 1_000_000, 5_000_000]
+REPETICIONES = 3
+BARRAS_VERIFICACION = 50_000
+
+PLAN = {
+    'capital': 10_000,
+    'riesgo_por_operacion': 1,
+    'hora_inicio': '08:00',
+    'hora_fin': '17:00',
+    'max_operaciones_dia': 3,
+}
+
+def generar_barras(n, semilla=42):
+    """Barras de 1 minuto con un paseo aleatorio geométrico"""
+    rng = np.random.default_rng(semilla)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, n)))
+    return pd.DataFrame({
+        'fecha': pd.date_range('2020-01-01', periods=n, freq='min'),
+        'open': np.r_[close[0], close[:-1]],
+        'high': close * (1 + np.abs(rng.normal(0, 0.0003, n))),
+        'low': close * (1 - np.abs(rng.normal(0, 0.0003, n))),
+        'close': close,
+    })
+
+def salidas_con_bucle(high, low, close, entradas, direccion, stop, objetivo, max_barras):
+    """Referencia barra a barra para verificar resolver_salidas"""
+    r_multiple = []
+    for e, d, sl, tp in zip(entradas, direccion, stop, objetivo):
+        riesgo = abs(close[e] - sl)
+        r = None
+        for i in range(e + 1, e + max_barras + 1):
+            j = min(i, len(close) - 1)
+            toca_sl = low[j] <= sl if d > 0 else high[j] >= sl
+            toca_tp = high[j] >= tp if d > 0 else low[j] <= tp
+            if toca_sl:
+                r = -1.0
+                break
+            if toca_tp:
+                r = abs(tp - close[e]) / riesgo
+                break
+        if r is None:
+            r = d * (close[min(e + max_barras, len(close) - 1)] - close[e]) / riesgo
+        r_multiple.append(r)
+    return np.array(r_multiple)
+
+def verificar():
+    barras = generar_barras(BARRAS_VERIFICACION, semilla=7)
+    high, low, close = (barras[c].to_numpy() for c in ('high', 'low', 'close'))
+    rng = np.random.default_rng(7)
+    entradas = np.sort(rng.choice(len(close) - 1, 2_000, replace=False))
+    direccion = rng.choice([-1.0, 1.0], len(entradas))
+    distancia = close[entradas] * 0.001
+    stop = close[entradas] - direccion * distancia
+    objetivo = close[entradas] + direccion * distancia * 2
+    esperado = salidas_con_bucle(high, low, close, entradas, direccion, stop, objetivo, 100)
+    obtenido = resolver_salidas(high, low, close, entradas, direccion, stop, objetivo, 100)
+    if not np.allclose(esperado, obtenido):
+        raise AssertionError(f"resolver_salidas difiere del bucle en {int((~np.isclose(esperado, obtenido)).sum())} operaciones")
+
+def main():
+    verificar()
+    print(f"{'barras':>12} {'tiempo (ms)':>12} {'barras/s':>14} {'señales':>9} {'con plan':>9}")
+    for n in TAMANOS:
+        barras = generar_barras(n)
+        tiempos = []
+        for _ in range(REPETICIONES):
+            inicio = time.perf_counter()
+            resultado = backtest_ohlcv(barras, PLAN)
+            tiempos.append(time.perf_counter() - inicio)
+        mejor = min(tiempos)
+        print(f"{n:>12,} {mejor * 1000:>12.1f} {n / mejor:>14,.0f} "
+              f"{resultado['base']['operaciones']:>9,} {resultado['plan']['operaciones']:>9,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# benchmarks/bench_clasificador_emociones.py - PRECISIÓN Y LATENCIA DEL CLASIFICADOR LOCAL FRENTE A LAS ETIQUETAS DEL LLM
+#
+# Uso: python benchmarks/bench_clasificador_emociones.py [--datos mensajes.jsonl] [--llm N]
+#
+# --datos: JSONL con {"mensaje": ..., "emocion": ...} etiquetado por el LLM (p. ej. los
+#          mensajes de usuario exportados de users/{uid}/chatbot/historial). Sin él se usa
+#          un conjunto sintético generado con plantillas.
+# --llm N: mide además la latencia real de analizar_estado_emocional en N mensajes
+#          (requiere OPENAI_API_KEY).
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clasificador_emociones import ClasificadorEmociones, UMBRAL_CONFIANZA  # noqa: E402
+
+PROPORCION_ENTRENAMIENTO = 0.8
+
+PLANTILLAS = {
+    'ansiedad': ["estoy muy nervioso con la posición abierta", "me preocupa que el precio se gire",
+                 "no paro de mirar el gráfico, estoy agobiado", "siento mucha tensión antes de la apertura"],
+    'confianza': ["me siento seguro con mi setup de hoy", "tengo claro el plan y lo voy a seguir",
+                  "estoy preparado para la sesión", "confío en mi análisis del EUR/USD"],
+    'frustracion': ["estoy harto de que me salte el stop", "otra vez la misma pérdida, qué rabia",
+                    "me frustra no poder cerrar en positivo", "estoy enfadado con el mercado"],
+    'euforia': ["increíble racha, soy imparable", "hoy me siento invencible, voy a por más",
+                "qué subidón, cinco ganadoras seguidas", "estoy eufórico con el resultado"],
+    'calma': ["estoy tranquilo, sin operaciones hoy", "me siento en paz con la pérdida de ayer",
+              "sesión relajada, todo según el plan", "estoy sereno y centrado"],
+    'neutral': ["hola, ¿qué tal?", "gracias por el consejo", "tengo una pregunta sobre el journaling",
+                "vale, lo reviso mañana"],
+    'miedo': ["tengo miedo de entrar después de la pérdida", "me da pánico abrir otra posición",
+              "no me atrevo a operar hoy", "me asusta perder la cuenta"],
+    'culpa': ["no debí mover el stop, fue culpa mía", "me arrepiento de haber entrado tarde",
+              "la cagué al no respetar el plan", "siento vergüenza por esa operación"],
+    'impulsividad': ["quiero recuperar lo perdido ya mismo", "voy a doblar el lote para compensar",
+                     "entré sin pensar en la noticia", "hice overtrading toda la mañana, no pude parar"],
+}
+# Negaciones etiquetadas con la emoción que expresan (no con la que nombran)
+PLANTILLAS['ansiedad'] += ["no estoy nada tranquilo con esta posición", "no estoy seguro de entrar, me preocupa"]
+PLANTILLAS['calma'] += ["no tengo miedo, sigo el plan con calma"]
+PLANTILLAS['miedo'] += ["no me siento seguro, me da miedo entrar"]
+
+# Deben ir siempre al LLM: el término del léxico está negado
+NEGADAS = ["no estoy nada tranquilo", "no tengo miedo", "no estoy seguro de entrar", "nunca me siento seguro",
+           "no estoy nervioso", "tampoco estoy frustrado", "ni tranquilo ni preparado"]
+# Estado declarado con un solo término: deben resolverse en local sin ejemplos del usuario
+DECLARADAS = [("estoy tranquilo", 'calma'), ("me siento muy ansioso", 'ansiedad'), ("tengo miedo", 'miedo'),
+              ("estoy frustrado", 'frustracion'), ("me siento confiado", 'confianza')]
+# Usos de palabras de trading que antes coincidían con raíces demasiado amplias
+AMBIGUAS = ["veo un doble techo en el EURUSD", "claro, lo miro mañana", "abrí cuenta en OKX ayer",
+            "el precio va a recuperar el soporte", "¿es seguro operar en noticias?"]
+
+RELLENO = ["", "hoy", "en el NAS100", "con el oro", "esta mañana", "después del cierre", "otra sesión más"]
+
+def generar_datos(n, semilla=42):
+    """Mensajes sintéticos etiquetados a partir de plantillas (sustituto de las etiquetas del LLM)"""
+    rng = random.Random(semilla)
+    emociones = list(PLANTILLAS)
+    datos = []
+    for _ in range(n):
+        emocion = rng.choice(emociones)
+        mensaje = f"{rng.choice(PLANTILLAS[emocion])} {rng.choice(RELLENO)}".strip()
+        datos.append({'mensaje': mensaje, 'emocion': emocion})
+    return datos
+
+def cargar_datos(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+def evaluar(clasificador, datos):
+    aciertos = cubiertos = aciertos_cubiertos = 0
+    latencias = []
+    for fila in datos:
+        inicio = time.perf_counter()
+        estado, confianza = clasificador.clasificar(fila['mensaje'])
+        latencias.append(time.perf_counter() - inicio)
+        correcto = estado['emocion_principal'] == fila['emocion']
+        aciertos += correcto
+        if confianza >= UMBRAL_CONFIANZA:
+            cubiertos += 1
+            aciertos_cubiertos += correcto
+    latencias.sort()
+    return {
+        'mensajes': len(datos),
+        'precision_total': round(aciertos / len(datos) * 100, 2),
+        'cobertura': round(cubiertos / len(datos) * 100, 2),
+        'precision_sobre_umbral': round(aciertos_cubiertos / cubiertos * 100, 2) if cubiertos else None,
+        'latencia_media_ms': round(sum(latencias) / len(latencias) * 1000, 4),
+        'latencia_p95_ms': round(latencias[int(len(latencias) * 0.95)] * 1000, 4),
+    }
+
+def resueltas_en_local(clasificador, mensajes):
+    """Mensajes que superan el umbral (no llegan al LLM) con la emoción asignada"""
+    resueltas = []
+    for mensaje in mensajes:
+        estado, confianza = clasificador.clasificar(mensaje)
+        if confianza >= UMBRAL_CONFIANZA:
+            resueltas.append((mensaje, estado['emocion_principal'], confianza))
+    return resueltas
+
+def medir_llm(datos, n):
+    from chatbot import analizar_estado_emocional
+    aciertos, latencias = 0, []
+    for fila in datos[:n]:
+        inicio = time.perf_counter()
+        estado = analizar_estado_emocional(fila['mensaje'])
+        latencias.append(time.perf_counter() - inicio)
+        aciertos += estado['emocion_principal'] == fila['emocion']
+    latencias.sort()
+    return {
+        'mensajes': len(latencias),
+        'acuerdo_con_etiquetas': round(aciertos / len(latencias) * 100, 2),
+        'latencia_media_ms': round(sum(latencias) / len(latencias) * 1000, 1),
+        'latencia_p95_ms': round(latencias[int(len(latencias) * 0.95)] * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datos')
+    parser.add_argument('--llm', type=int, default=0)
+    args = parser.parse_args()
+
+    datos = cargar_datos(args.datos) if args.datos else generar_datos(2000)
+    random.Random(0).shuffle(datos)
+    corte = int(len(datos) * PROPORCION_ENTRENAMIENTO)
+    entrenamiento, prueba = datos[:corte], datos[corte:]
+
+    solo_lexico = evaluar(ClasificadorEmociones(), prueba)
+    entrenado = evaluar(
+        ClasificadorEmociones().entrenar((f['mensaje'], f['emocion']) for f in entrenamiento), prueba
+    )
+    print(f"Umbral de confianza: {UMBRAL_CONFIANZA}  |  entrenamiento: {len(entrenamiento)}  prueba: {len(prueba)}")
+    print(json.dumps({'solo_lexico': solo_lexico, 'lexico_mas_naive_bayes': entrenado}, indent=2, ensure_ascii=False))
+
+    modelo = ClasificadorEmociones().entrenar((f['mensaje'], f['emocion']) for f in entrenamiento)
+    for nombre, mensajes in (('negadas', NEGADAS), ('ambiguas', AMBIGUAS)):
+        resueltas = resueltas_en_local(modelo, mensajes)
+        print(f"{nombre}: {len(resueltas)}/{len(mensajes)} resueltas en local (esperado: 0)")
+        for mensaje, emocion, confianza in resueltas:
+            print(f"  {mensaje!r} -> {emocion} ({confianza})")
+    # Usuario sin mensajes etiquetados: el caso habitual, solo cuenta el léxico
+    resueltas = resueltas_en_local(ClasificadorEmociones(), [m for m, _ in DECLARADAS])
+    correctas = sum(1 for mensaje, emocion, _ in resueltas if (mensaje, emocion) in DECLARADAS)
+    print(f"declaradas sin ejemplos: {correctas}/{len(DECLARADAS)} resueltas en local con la emoción esperada "
+          f"(esperado: {len(DECLARADAS)})")
+    if args.llm:
+        print(json.dumps({'llm': medir_llm(prueba, args.llm)}, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
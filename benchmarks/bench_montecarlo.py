@@ -0,0 +1,50 @@
+# benchmarks/bench_montecarlo.py - LATENCIA DE LA SIMULACIÓN MONTE CARLO (OBJETIVO: < 1 s CON 100k TRAYECTORIAS)
+#
+# Uso: python benchmarks/bench_montecarlo.py [--procesos N]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from montecarlo import simular, TRAYECTORIAS  # noqa: E402
+
+OPERACIONES_MES = [5, 20, 60, 300]
+REPETICIONES = 3
+PRESUPUESTO = 1.0  # segundos
+
+def generar_r(n=500, semilla=42):
+    """R-múltiplos sintéticos: 45% ganadoras entre 1R y 3R, el resto pierde 1R"""
+    rng = np.random.default_rng(semilla)
+    return np.where(rng.random(n) < 0.45, rng.uniform(1.0, 3.0, n), -1.0)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--procesos', type=int, default=1)
+    args = parser.parse_args()
+
+    r = generar_r()
+    # Mismo resultado con cualquier número de procesos: cada bloque tiene su propia semilla
+    if args.procesos > 1:
+        secuencial = simular(r, 10_000, 100, 5, 20, trayectorias=30_000)
+        paralelo = simular(r, 10_000, 100, 5, 20, trayectorias=30_000, procesos=args.procesos)
+        if secuencial['riesgo_ruina'] != paralelo['riesgo_ruina'] or \
+                secuencial['drawdown_percentiles'] != paralelo['drawdown_percentiles']:
+            raise AssertionError("La simulación en paralelo no reproduce la secuencial")
+
+    print(f"{'ops/mes':>8} {'operaciones':>12} {'tiempo (ms)':>12} {'ruina %':>8} {'DD P95':>10}")
+    for ops_mes in OPERACIONES_MES:
+        tiempos = []
+        for _ in range(REPETICIONES):
+            inicio = time.perf_counter()
+            resultado = simular(r, 10_000, 100, 5, ops_mes, trayectorias=TRAYECTORIAS, procesos=args.procesos)
+            tiempos.append(time.perf_counter() - inicio)
+        mejor = min(tiempos)
+        aviso = "" if mejor < PRESUPUESTO else "  <-- fuera de presupuesto"
+        print(f"{ops_mes:>8} {resultado['operaciones_horizonte']:>12} {mejor * 1000:>12.1f} "
+              f"{resultado['riesgo_ruina']:>8} {resultado['drawdown_percentiles'][95]:>10,.0f}{aviso}")
+
+if __name__ == "__main__":
+    main()
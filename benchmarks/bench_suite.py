@@ -0,0 +1,242 @@
+# benchmarks/bench_suite.py - SUITE DE RENDIMIENTO DE EXTREMO A EXTREMO CON FIRESTORE EN MEMORIA Y LLM SIMULADO
+#
+# Mide la carga de operaciones, el DataFrame, las métricas, el análisis del journal, los gráficos y el
+# chat a 100, 1k, 10k y 100k operaciones, y guarda el resultado en JSON para comparar entre commits.
+#
+# Uso: python benchmarks/bench_suite.py [--escalas 100,1000] [--repeticiones N] [--latencia-firestore S]
+#                                       [--latencia-llm S] [--salida fichero.json]
+#      python benchmarks/bench_suite.py --comparar base.json [nuevo.json]
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import types
+from datetime import datetime
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, DIRECTORIO)
+from firestore_falso import ClienteFirestoreFalso  # noqa: E402
+from llm_falso import ClienteLLMFalso  # noqa: E402
+from generador_sintetico import generar_operaciones, generar_historial_chat, generar_plan, SEMILLA  # noqa: E402
+
+ESCALAS = [100, 1_000, 10_000, 100_000]
+REPETICIONES = 3
+MENSAJES_CHAT = 2_000          # mensajes guardados por usuario (solo se leen los últimos LIMITE_HISTORIAL)
+UMBRAL_REGRESION = 1.10        # en --comparar, se marca un paso un 10% más lento que la base
+DIRECTORIO_RESULTADOS = os.path.join(DIRECTORIO, 'resultados')
+
+# ========== ENTORNO ==========
+def instalar_firestore_falso(latencia):
+    """Sustituye firebase_config antes de importar la app: todos los `from firebase_config import db` ven el falso"""
+    db = ClienteFirestoreFalso(latencia=latencia)
+    modulo = types.ModuleType('firebase_config')
+    modulo.db = db
+    modulo.auth_instance = None
+    modulo.firebase_initialized = True
+    sys.modules['firebase_config'] = modulo
+    return db
+
+def sembrar_usuario(db, user_id, n):
+    """Operaciones con P&L y cumplimiento ya guardados (como tras usar la app), agregados, plan e historial de chat"""
+    from calculo_pl import completar_pl, riesgo_monetario_plan
+    from cumplimiento_plan import PlanCompilado, evaluar_historial
+    from metricas_incrementales import reconstruir_agregados
+
+    plan = generar_plan()
+    operaciones = generar_operaciones(n)
+    completar_pl(operaciones, riesgo_monetario_plan(plan))
+    evaluar_historial(operaciones, PlanCompilado(plan))
+
+    usuario = f"users/{user_id}"
+    db.sembrar(f"{usuario}/operaciones", operaciones)
+    db.sembrar(f"{usuario}/estadisticas", [{**reconstruir_agregados(operaciones), 'id': 'agregados'}])
+    db.sembrar(f"{usuario}/trading_plan", [{**plan, 'id': 'plan_actual'}])
+    db.sembrar(f"{usuario}/chat_mensajes", generar_historial_chat(MENSAJES_CHAT))
+
+def version_codigo():
+    """Commit actual (con '-sucio' si hay cambios sin confirmar) para etiquetar los resultados"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        cambios = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ('-sucio' if cambios else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+# ========== MEDICIÓN ==========
+def medir(funcion, repeticiones, preparar=None):
+    """Tiempos en ms de `repeticiones` llamadas; `preparar` se ejecuta antes de cada una sin medirse"""
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'min_ms': round(min(tiempos), 3),
+        'mediana_ms': round(statistics.median(tiempos), 3),
+        'max_ms': round(max(tiempos), 3),
+        'repeticiones': repeticiones,
+    }
+
+def medir_escala(n, repeticiones, db):
+    from dashboard import (cargar_operaciones_usuario, procesar_datos_operaciones, calcular_metricas_avanzadas,
+                           crear_grafico_equity_curve, crear_grafico_distribucion_resultados,
+                           crear_grafico_rendimiento_temporal)
+    from journaling import analizar_operaciones_avanzado, guardar_operacion_firebase, eliminar_operacion_firebase
+    from sincronizacion_operaciones import descartar_almacen
+    from chatbot import cargar_historial_chat, responder_en_una_llamada
+    from cache_usuario import invalidar_documento
+
+    user_id = f"bench-{n}"
+    sembrar_usuario(db, user_id, n)
+    pasos = {}
+    rpcs = db.rpcs
+
+    # Carga: en frío descarga la colección completa; en caliente solo copia y ordena el almacén local
+    pasos['cargar_operaciones_usuario_frio'] = medir(
+        lambda: cargar_operaciones_usuario(user_id), repeticiones, preparar=lambda: descartar_almacen(user_id))
+    pasos['cargar_operaciones_usuario_caliente'] = medir(lambda: cargar_operaciones_usuario(user_id), repeticiones)
+    operaciones = cargar_operaciones_usuario(user_id)
+    if len(operaciones) != n:
+        raise AssertionError(f"Se esperaban {n} operaciones y se cargaron {len(operaciones)}")
+
+    pasos['procesar_datos_operaciones'] = medir(lambda: procesar_datos_operaciones(operaciones), repeticiones)
+    df = procesar_datos_operaciones(operaciones)
+    pasos['calcular_metricas_avanzadas'] = medir(lambda: calcular_metricas_avanzadas(df), repeticiones)
+    pasos['analizar_operaciones_avanzado'] = medir(lambda: analizar_operaciones_avanzado(operaciones), repeticiones)
+
+    # Figuras: construcción y serialización a dict, lo mismo que hace obtener_grafico sin caché
+    for nombre, crear in (('grafico_equity', crear_grafico_equity_curve),
+                          ('grafico_distribucion', crear_grafico_distribucion_resultados),
+                          ('grafico_temporal', crear_grafico_rendimiento_temporal)):
+        pasos[nombre] = medir(lambda: crear(df).to_dict(), repeticiones)
+
+    # Guardado: transacción de la operación y los agregados (alta, edición y baja con su lápida)
+    nueva = generar_operaciones(1, semilla=SEMILLA + 3)[0]
+    nueva.pop('timestamp')
+    coleccion = f"users/{user_id}/operaciones"
+    pasos['guardar_operacion_nueva'] = medir(lambda: guardar_operacion_firebase(user_id, dict(nueva)), repeticiones)
+    editada = operaciones[0]['id']
+    pasos['guardar_operacion_edicion'] = medir(
+        lambda: guardar_operacion_firebase(user_id, {'resumen': "Edición del benchmark"}, editada), repeticiones)
+    # Se borran operaciones dadas de alta por la app (no sembradas) para que los agregados cuadren
+    borrables = []
+    def preparar_baja():
+        antes = set(db._almacen[coleccion])
+        guardar_operacion_firebase(user_id, dict(nueva))
+        borrables.extend(set(db._almacen[coleccion]) - antes)
+    pasos['eliminar_operacion'] = medir(
+        lambda: eliminar_operacion_firebase(user_id, borrables.pop()), repeticiones, preparar=preparar_baja)
+    agregados = db.document(f"users/{user_id}/estadisticas/agregados").get().to_dict()
+    if agregados is None or agregados['total'] != n + repeticiones:
+        raise AssertionError(f"Los agregados no reflejan las {repeticiones} altas del paso de guardado")
+
+    # Chat: últimos mensajes desde Firestore y una respuesta del coach con el LLM simulado
+    pasos['cargar_historial_chat'] = medir(
+        lambda: cargar_historial_chat(user_id), repeticiones,
+        preparar=lambda: invalidar_documento('historial_chat', user_id))
+    historial = cargar_historial_chat(user_id)
+    perfil = {'estado_actual': 'neutral', 'patrones': [], 'mantras_personalizados': []}
+    pasos['responder_en_una_llamada'] = medir(
+        lambda: responder_en_una_llamada("Hoy he vuelto a mover el stop", historial, perfil), repeticiones)
+
+    return {'operaciones': n, 'rpcs_firestore': db.rpcs - rpcs, 'pasos': pasos}
+
+def ejecutar(args):
+    db = instalar_firestore_falso(args.latencia_firestore)
+    import cliente_llm
+    import pandas as pd
+    cliente_llm._cliente = ClienteLLMFalso(latencia=args.latencia_llm)
+
+    resultado = {
+        'commit': version_codigo(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'parametros': {
+            'semilla': SEMILLA,
+            'repeticiones': args.repeticiones,
+            'latencia_firestore': args.latencia_firestore,
+            'latencia_llm': args.latencia_llm,
+            'mensajes_chat': MENSAJES_CHAT,
+        },
+        'escalas': {},
+    }
+    for n in args.escalas:
+        print(f"Midiendo {n:,} operaciones...", flush=True)
+        resultado['escalas'][str(n)] = medir_escala(n, args.repeticiones, db)
+    return resultado
+
+# ========== INFORMES ==========
+def imprimir(resultado):
+    print(f"\nCommit {resultado['commit']} · {resultado['fecha']}")
+    for n, escala in resultado['escalas'].items():
+        print(f"\n{int(n):,} operaciones ({escala['rpcs_firestore']} RPCs de Firestore)")
+        print(f"  {'paso':<38} {'mín (ms)':>10} {'mediana (ms)':>13}")
+        for paso, tiempos in escala['pasos'].items():
+            print(f"  {paso:<38} {tiempos['min_ms']:>10.1f} {tiempos['mediana_ms']:>13.1f}")
+
+def comparar(base, nuevo):
+    """Mediana de cada paso frente a la base; devuelve cuántos pasos empeoran más del umbral"""
+    print(f"\n{base['commit']} -> {nuevo['commit']}")
+    print(f"  {'escala':>8} {'paso':<38} {'base (ms)':>10} {'nuevo (ms)':>11} {'ratio':>7}")
+    regresiones = 0
+    for n, escala in nuevo['escalas'].items():
+        pasos_base = base['escalas'].get(n, {}).get('pasos', {})
+        for paso, tiempos in escala['pasos'].items():
+            if paso not in pasos_base:
+                continue
+            antes, despues = pasos_base[paso]['mediana_ms'], tiempos['mediana_ms']
+            ratio = despues / antes if antes > 0 else float('inf')
+            aviso = "  <-- más lento" if ratio > UMBRAL_REGRESION else ""
+            regresiones += bool(aviso)
+            print(f"  {int(n):>8,} {paso:<38} {antes:>10.1f} {despues:>11.1f} {ratio:>7.2f}{aviso}")
+    return regresiones
+
+def _leer(ruta):
+    with open(ruta, encoding='utf-8') as fichero:
+        return json.load(fichero)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--escalas', type=lambda s: [int(x) for x in s.split(',')], default=ESCALAS)
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--latencia-firestore', type=float, default=0.0, help="segundos por RPC")
+    parser.add_argument('--latencia-llm', type=float, default=0.0, help="segundos por llamada")
+    parser.add_argument('--salida', help="fichero JSON (por defecto benchmarks/resultados/<commit>.json)")
+    parser.add_argument('--comparar', nargs='+', metavar='JSON',
+                        help="base.json para comparar con esta ejecución, o base.json nuevo.json sin ejecutar")
+    args = parser.parse_args()
+
+    if args.comparar and len(args.comparar) == 2:
+        sys.exit(1 if comparar(_leer(args.comparar[0]), _leer(args.comparar[1])) else 0)
+
+    resultado = ejecutar(args)
+    imprimir(resultado)
+    salida = args.salida or os.path.join(DIRECTORIO_RESULTADOS, f"{resultado['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as fichero:
+        json.dump(resultado, fichero, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+    if args.comparar:
+        sys.exit(1 if comparar(_leer(args.comparar[0]), resultado) else 0)
+
+if __name__ == "__main__":
+    main()
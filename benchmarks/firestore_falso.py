@@ -0,0 +1,321 @@
+# benchmarks/firestore_falso.py - CLIENTE DE FIRESTORE EN MEMORIA PARA LOS BENCHMARKS (SIN RED NI CREDENCIALES)
+#
+# Cubre la parte del API que usa la app: colecciones y documentos anidados, get/set/update/delete,
+# where/order_by/limit/start_after/stream, batch, transaction, get_all y los centinelas
+# SERVER_TIMESTAMP e Increment.
+# Cada llamada que en Firestore sería un RPC puede esperar `latencia` segundos para simular la red.
+import itertools
+import os
+import time
+from datetime import datetime, timezone
+
+try:
+    from google.cloud.firestore_v1 import transforms
+except ImportError:
+    transforms = None
+
+OPERADORES = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+def _nuevo_id():
+    return os.urandom(10).hex()
+
+def _campo(datos, ruta):
+    """Valor de un campo por ruta con puntos ('conteos.calma'); None si no existe"""
+    for parte in ruta.split('.'):
+        if not isinstance(datos, dict) or parte not in datos:
+            return None
+        datos = datos[parte]
+    return datos
+
+def _resolver(valor, anterior, ahora):
+    """Sustituye los centinelas de Firestore por su valor (marca de tiempo del commit, suma...)"""
+    if transforms is not None:
+        if valor is transforms.SERVER_TIMESTAMP:
+            return ahora
+        if isinstance(valor, transforms.Increment):
+            return (anterior if isinstance(anterior, (int, float)) else 0) + valor.value
+    if isinstance(valor, dict):
+        previo = anterior if isinstance(anterior, dict) else {}
+        return {k: _resolver(v, previo.get(k), ahora) for k, v in valor.items()}
+    return valor
+
+def _fusionar(destino, datos, ahora):
+    """set(merge=True): mezcla recursiva de diccionarios"""
+    for clave, valor in datos.items():
+        if isinstance(valor, dict) and isinstance(destino.get(clave), dict):
+            _fusionar(destino[clave], valor, ahora)
+        else:
+            destino[clave] = _resolver(valor, destino.get(clave), ahora)
+
+def _ahora():
+    return datetime.now(timezone.utc)
+
+# ========== SNAPSHOTS ==========
+class InstantaneaFalsa:
+    """DocumentSnapshot: to_dict() devuelve una copia, como la deserialización real"""
+
+    def __init__(self, referencia, datos):
+        self.reference = referencia
+        self.id = referencia.id
+        self._datos = datos
+
+    @property
+    def exists(self):
+        return self._datos is not None
+
+    def to_dict(self):
+        return dict(self._datos) if self._datos is not None else None
+
+    def get(self, campo):
+        return _campo(self._datos or {}, campo)
+
+# ========== REFERENCIAS ==========
+class DocumentoFalso:
+    def __init__(self, cliente, coleccion, doc_id):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self.id = doc_id
+        self.path = f"{coleccion}/{doc_id}"
+
+    @property
+    def parent(self):
+        return ColeccionFalsa(self._cliente, self._coleccion)
+
+    def collection(self, nombre):
+        return ColeccionFalsa(self._cliente, f"{self.path}/{nombre}")
+
+    def _datos(self):
+        return self._cliente._almacen.get(self._coleccion, {}).get(self.id)
+
+    def get(self, transaction=None, **kwargs):
+        self._cliente._esperar()
+        return InstantaneaFalsa(self, self._datos())
+
+    def set(self, datos, merge=False):
+        self._cliente._esperar()
+        self._cliente._aplicar([('set', self, datos, merge)])
+
+    def update(self, datos):
+        self._cliente._esperar()
+        self._cliente._aplicar([('update', self, datos, False)])
+
+    def create(self, datos):
+        if self._datos() is not None:
+            raise ValueError(f"El documento {self.path} ya existe")
+        self.set(datos)
+
+    def delete(self):
+        self._cliente._esperar()
+        self._cliente._aplicar([('delete', self, None, False)])
+
+class ConsultaFalsa:
+    def __init__(self, cliente, coleccion, filtros=(), orden=(), limite=None, despues_de=None):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self._filtros = list(filtros)
+        self._orden = list(orden)
+        self._limite = limite
+        self._despues_de = despues_de
+
+    def _copiar(self, **cambios):
+        estado = {'filtros': self._filtros, 'orden': self._orden, 'limite': self._limite,
+                  'despues_de': self._despues_de, **cambios}
+        return ConsultaFalsa(self._cliente, self._coleccion, **estado)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copiar(filtros=self._filtros + [(field_path, OPERADORES[op_string], value)])
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copiar(orden=self._orden + [(field_path, direction == 'DESCENDING')])
+
+    def limit(self, n):
+        return self._copiar(limite=n)
+
+    def start_after(self, instantanea):
+        return self._copiar(despues_de=instantanea.id)
+
+    def _resultados(self):
+        documentos = self._cliente._almacen.get(self._coleccion, {})
+        filas = [(doc_id, datos) for doc_id, datos in documentos.items()
+                 if all(op(_campo(datos, campo), valor) for campo, op, valor in self._filtros)]
+        # Como en Firestore, order_by deja fuera los documentos sin ese campo
+        filas = [fila for fila in filas if all(_campo(fila[1], campo) is not None for campo, _ in self._orden)]
+        # Orden estable de la última clave a la primera; sin orden, por id
+        filas.sort(key=lambda fila: fila[0])
+        for campo, descendente in reversed(self._orden):
+            filas.sort(key=lambda fila: _campo(fila[1], campo), reverse=descendente)
+        if self._despues_de is not None:
+            ids = [doc_id for doc_id, _ in filas]
+            filas = filas[ids.index(self._despues_de) + 1:] if self._despues_de in ids else []
+        if self._limite is not None:
+            filas = filas[:self._limite]
+        return filas
+
+    def stream(self, transaction=None, **kwargs):
+        self._cliente._esperar()
+        for doc_id, datos in self._resultados():
+            yield InstantaneaFalsa(DocumentoFalso(self._cliente, self._coleccion, doc_id), datos)
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream())
+
+class ColeccionFalsa(ConsultaFalsa):
+    def __init__(self, cliente, ruta):
+        super().__init__(cliente, ruta)
+        self.id = ruta.rsplit('/', 1)[-1]
+        self.path = ruta
+
+    def document(self, doc_id=None):
+        return DocumentoFalso(self._cliente, self.path, doc_id or _nuevo_id())
+
+    def add(self, datos):
+        referencia = self.document()
+        referencia.set(datos)
+        return _ahora(), referencia
+
+# ========== ESCRITURAS AGRUPADAS ==========
+class LoteFalso:
+    """WriteBatch: las escrituras se aplican juntas en commit()"""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._escrituras = []
+
+    def set(self, referencia, datos, merge=False):
+        self._escrituras.append(('set', referencia, datos, merge))
+
+    def update(self, referencia, datos):
+        self._escrituras.append(('update', referencia, datos, False))
+
+    def delete(self, referencia):
+        self._escrituras.append(('delete', referencia, None, False))
+
+    def commit(self):
+        self._cliente._esperar()
+        self._cliente._aplicar(self._escrituras)
+        self._escrituras = []
+
+    def __len__(self):
+        return len(self._escrituras)
+
+class TransaccionFalsa(LoteFalso):
+    """Transaction con la interfaz que usa @firestore.transactional (_begin, _commit, _rollback...)
+
+    Las escrituras se acumulan y se aplican juntas al confirmar, como en LoteFalso. En memoria
+    no hay contención, así que el commit nunca aborta ni se reintenta.
+    """
+
+    def __init__(self, cliente, max_attempts=5, read_only=False):
+        super().__init__(cliente)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _begin(self, retry_id=None):
+        if self.in_progress:
+            raise ValueError("La transacción ya está en curso")
+        self._cliente._esperar()
+        self._id = _nuevo_id().encode()
+
+    def _clean_up(self):
+        self._escrituras = []
+        self._id = None
+
+    def _rollback(self):
+        if not self.in_progress:
+            raise ValueError("No hay ninguna transacción en curso")
+        self._cliente._esperar()
+        self._clean_up()
+
+    def _commit(self):
+        if not self.in_progress:
+            raise ValueError("No hay ninguna transacción en curso")
+        self.commit()
+        self._clean_up()
+        return []
+
+# ========== CLIENTE ==========
+class ClienteFirestoreFalso:
+    """Sustituto de firestore.client() con los documentos en diccionarios {colección: {id: datos}}"""
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.rpcs = 0
+        self._almacen = {}
+        self._reloj = itertools.count()
+
+    def _esperar(self):
+        self.rpcs += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _aplicar(self, escrituras):
+        ahora = _ahora()
+        for tipo, referencia, datos, merge in escrituras:
+            coleccion = self._almacen.setdefault(referencia._coleccion, {})
+            if tipo == 'delete':
+                coleccion.pop(referencia.id, None)
+            elif tipo == 'set' and not merge:
+                coleccion[referencia.id] = _resolver(datos, None, ahora)
+            elif tipo == 'set':
+                _fusionar(coleccion.setdefault(referencia.id, {}), datos, ahora)
+            else:
+                if referencia.id not in coleccion:
+                    raise KeyError(f"No existe el documento {referencia.path}")
+                documento = coleccion[referencia.id]
+                for ruta, valor in datos.items():
+                    *padres, hoja = ruta.split('.')
+                    destino = documento
+                    for parte in padres:
+                        destino = destino.setdefault(parte, {})
+                    destino[hoja] = _resolver(valor, destino.get(hoja), ahora)
+
+    def collection(self, nombre):
+        return ColeccionFalsa(self, nombre)
+
+    def document(self, ruta):
+        coleccion, doc_id = ruta.rsplit('/', 1)
+        return DocumentoFalso(self, coleccion, doc_id)
+
+    def batch(self):
+        return LoteFalso(self)
+
+    def get_all(self, referencias, field_paths=None, transaction=None):
+        self._esperar()
+        for referencia in referencias:
+            yield InstantaneaFalsa(referencia, referencia._datos())
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return TransaccionFalsa(self, max_attempts, read_only)
+
+    # ========== CARGA DIRECTA ==========
+    def sembrar(self, ruta_coleccion, documentos):
+        """Inserta documentos sin pasar por escrituras ni latencia; devuelve sus ids"""
+        coleccion = self._almacen.setdefault(ruta_coleccion, {})
+        ids = []
+        for datos in documentos:
+            datos = dict(datos)
+            doc_id = datos.pop('id', None) or f"{next(self._reloj):012d}"
+            coleccion[doc_id] = datos
+            ids.append(doc_id)
+        return ids
@@ -0,0 +1,140 @@
+# benchmarks/generador_sintetico.py - DATOS SINTÉTICOS DETERMINISTAS: OPERACIONES, HISTORIALES DE CHAT Y PLANES
+#
+# Misma semilla y tamaño -> mismos documentos, para que las mediciones sean comparables entre commits.
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# ========== CONFIGURACIÓN ==========
+SEMILLA = 20240601
+FECHA_INICIO = datetime(2022, 1, 3, 8, 0)
+ACTIVOS = ['EURUSD', 'GBPUSD', 'USDJPY', 'XAUUSD', 'US30', 'NAS100', 'BTCUSD', 'AUDUSD']
+PRECIO_BASE = {'EURUSD': 1.1, 'GBPUSD': 1.27, 'USDJPY': 145.0, 'XAUUSD': 1950.0,
+               'US30': 34000.0, 'NAS100': 15000.0, 'BTCUSD': 30000.0, 'AUDUSD': 0.66}
+TIMEFRAMES = ['M1', 'M5', 'M15', 'H1', 'H4', 'D1']
+EMOCIONES = ["Confianza", "Ansiedad", "Miedo", "Euforia", "Neutral", "Indecisión"]
+EMOCIONES_CHAT = ['ansiedad', 'confianza', 'frustracion', 'euforia', 'calma', 'neutral', 'miedo']
+WIN_RATE = 0.45
+OPERACIONES_DIA = 4                  # media; con historiales grandes sube para no pasar de DIAS_MAXIMOS
+DIAS_MAXIMOS = 750                   # ~3 años hábiles (un historial de 100k es de importación/scalping)
+FRACCION_SALIDAS_PARCIALES = 0.05    # operaciones con salidas parciales (ruta escalar del motor de P&L)
+
+FRASES_USUARIO = [
+    "Hoy he roto mi plan otra vez y he entrado sin confirmación",
+    "Me siento muy seguro después de tres ganadoras seguidas",
+    "No puedo dejar de mirar el gráfico aunque ya cerré la operación",
+    "Moví el stop loss porque pensé que el precio volvería",
+    "Estoy tranquilo, he seguido todas las reglas del plan",
+]
+FRASES_ASISTENTE = [
+    "Vamos a separar la decisión del resultado: ¿la entrada cumplía tu plan?",
+    "Anota qué sentiste antes de la entrada y qué regla se saltó.",
+    "Reduce el tamaño durante las próximas cinco operaciones y revisa el checklist.",
+]
+
+def _utc(fecha):
+    return fecha.replace(tzinfo=timezone.utc)
+
+# ========== OPERACIONES ==========
+def generar_operaciones(n, semilla=SEMILLA):
+    """n operaciones con la forma del formulario del journal, en orden cronológico
+
+    Incluyen 'timestamp' (el cursor de la sincronización incremental) pero no los campos
+    del motor de P&L ni de cumplimiento: el harness los completa como lo haría la app.
+    """
+    rng = np.random.default_rng(semilla)
+    # Separación entre operaciones dentro de un horario de 10 h; a partir de cierto tamaño, más densas
+    por_dia = max(OPERACIONES_DIA, n / DIAS_MAXIMOS)
+    minutos = np.cumsum(rng.exponential(600 / por_dia, n)).astype(np.int64)
+    activos = rng.choice(len(ACTIVOS), n)
+    timeframes = rng.choice(len(TIMEFRAMES), n)
+    emociones = rng.choice(len(EMOCIONES), (n, 3))
+    cortos = rng.random(n) < 0.4
+    ganadoras = rng.random(n) < WIN_RATE
+    ruido = rng.normal(0, 0.02, n)
+    distancia_sl = rng.uniform(0.002, 0.01, n)
+    rr = rng.choice([1.0, 1.5, 2.0, 2.5, 3.0], n)
+    comisiones = np.round(rng.uniform(0, 5, n), 2)
+    parciales = rng.random(n) < FRACCION_SALIDAS_PARCIALES
+
+    operaciones = []
+    for i in range(n):
+        activo = ACTIVOS[activos[i]]
+        entrada = PRECIO_BASE[activo] * (1 + float(ruido[i]))
+        direccion = -1 if cortos[i] else 1
+        stop = entrada * (1 - direccion * float(distancia_sl[i]))
+        objetivo = entrada + direccion * float(rr[i]) * abs(entrada - stop)
+        # Solo minutos de 08:00 a 18:00 de lunes a viernes
+        dias, minuto = divmod(int(minutos[i]), 600)
+        semanas, dia_semana = divmod(dias, 5)
+        fecha = FECHA_INICIO + timedelta(days=semanas * 7 + dia_semana, minutes=minuto)
+        salidas = []
+        if parciales[i]:
+            salidas = [{'precio': round(entrada + direccion * abs(objetivo - entrada) / 2, 6), 'fraccion': 0.5}]
+        operaciones.append({
+            'fecha': fecha.isoformat(),
+            'activo': activo,
+            'timeframe': TIMEFRAMES[timeframes[i]],
+            'precio_entrada': round(entrada, 6),
+            'stop_loss': round(stop, 6),
+            'take_profit': round(objetivo, 6),
+            'resultado': 'Ganadora' if ganadoras[i] else 'Perdedora',
+            'tipo': 'Corto' if cortos[i] else 'Largo',
+            'precio_cierre': None,
+            'comision': float(comisiones[i]),
+            'salidas': salidas,
+            'resumen': f"Operación sintética {i} en {activo}",
+            'leccion_aprendida': "Respetar el plan",
+            'emocion_antes': EMOCIONES[emociones[i, 0]],
+            'emocion_durante': EMOCIONES[emociones[i, 1]],
+            'emocion_despues': EMOCIONES[emociones[i, 2]],
+            'timestamp': _utc(fecha),
+        })
+    return operaciones
+
+# ========== HISTORIAL DE CHAT ==========
+def generar_historial_chat(n, semilla=SEMILLA):
+    """n mensajes alternos usuario/asistente con el formato que guarda el chatbot ('creado' incluido)"""
+    rng = np.random.default_rng(semilla + 1)
+    emociones = rng.choice(len(EMOCIONES_CHAT), n)
+    frases_usuario = rng.choice(len(FRASES_USUARIO), n)
+    frases_asistente = rng.choice(len(FRASES_ASISTENTE), n)
+    mensajes = []
+    for i in range(n):
+        creado = FECHA_INICIO + timedelta(minutes=3 * i)
+        emocion = EMOCIONES_CHAT[emociones[i]]
+        if i % 2 == 0:
+            mensaje = {'tipo': 'usuario', 'mensaje': FRASES_USUARIO[frases_usuario[i]], 'emocion': emocion,
+                       'fuente_emocion': 'local'}
+        else:
+            mensaje = {'tipo': 'asistente', 'mensaje': FRASES_ASISTENTE[frases_asistente[i]],
+                       'emocion_detectada': emocion}
+        mensaje['timestamp'] = creado.strftime("%H:%M")
+        mensaje['creado'] = _utc(creado)
+        mensajes.append(mensaje)
+    return mensajes
+
+# ========== PLAN ==========
+def generar_plan(semilla=SEMILLA):
+    """Plan de trading con los campos del asistente de estrategia_maestra"""
+    rng = np.random.default_rng(semilla + 2)
+    favoritos = sorted(rng.choice(ACTIVOS, 4, replace=False).tolist())
+    return {
+        'estilo': 'Day Trading',
+        'experiencia': 'Intermedio',
+        'capital': 10_000,
+        'riesgo_por_operacion': 1.0,
+        'max_operaciones_dia': 3,
+        'rr_minimo': 1.5,
+        'hora_inicio': '09:00',
+        'hora_fin': '17:00',
+        'mercados': ['Forex', 'Índices'],
+        'pares_favoritos': favoritos,
+        'objetivo_mensual': 5,
+        'desafios_psicologicos': ['Overtrading', 'Miedo a perder'],
+        'reglas_entrada': ["Entrar solo a favor de la tendencia de H1"],
+        'reglas_salida': ["TP: 2:1 risk-reward ratio mínimo"],
+        'gestion_riesgo': ["Máximo 1% de riesgo por operación"],
+        'fecha_creacion': FECHA_INICIO.isoformat(),
+        'activo': True,
+    }
@@ -0,0 +1,55 @@
+# benchmarks/llm_falso.py - CLIENTE LLM SIMULADO CON LATENCIA CONFIGURABLE (MISMA FORMA QUE EL SDK DE OPENAI)
+#
+# Se instala en cliente_llm._cliente: las llamadas recorren el semáforo, los reintentos, las métricas y
+# las trazas reales, pero la respuesta llega tras `latencia` segundos (y `latencia_token` por fragmento).
+import json
+import time
+from types import SimpleNamespace
+
+RESPUESTA_COACH = {
+    'estado': {
+        'emocion_principal': 'ansiedad',
+        'intensidad': 6,
+        'necesita_ayuda_urgente': False,
+        'palabras_clave': ['plan', 'stop'],
+        'tipo_problema': 'disciplina',
+    },
+    'respuesta': "Separa la decisión del resultado: revisa si la entrada cumplía tu plan y anota qué sentiste.",
+}
+TEXTO_LIBRE = "Análisis simulado: mantén el riesgo por operación y revisa las operaciones fuera de horario."
+
+def _uso(mensajes, texto):
+    # ~4 caracteres por token, suficiente para que las métricas tengan valores realistas
+    prompt = sum(len(str(m.get('content', ''))) for m in mensajes) // 4
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=len(texto) // 4)
+
+class _Completions:
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def create(self, model, messages, stream=False, **parametros):
+        self._cliente.llamadas += 1
+        time.sleep(self._cliente.latencia)
+        json_pedido = (parametros.get('response_format') or {}).get('type') == 'json_object'
+        texto = json.dumps(RESPUESTA_COACH, ensure_ascii=False) if json_pedido else TEXTO_LIBRE
+        if stream:
+            return self._fragmentos(messages, texto)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=texto))],
+            usage=_uso(messages, texto),
+        )
+
+    def _fragmentos(self, mensajes, texto):
+        for palabra in texto.split(' '):
+            time.sleep(self._cliente.latencia_token)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=palabra + ' '))], usage=None)
+        yield SimpleNamespace(choices=[], usage=_uso(mensajes, texto))
+
+class ClienteLLMFalso:
+    """Sustituto de OpenAI(): client.chat.completions.create(...) con latencia fija"""
+
+    def __init__(self, latencia=0.0, latencia_token=0.0):
+        self.latencia = latencia
+        self.latencia_token = latencia_token
+        self.llamadas = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
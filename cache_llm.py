@@ -0,0 +1,147 @@
+# cache_llm.py - CACHÉ PERSISTENTE DE RESPUESTAS DEL LLM (SQLITE, TTL Y LÍMITE DE TAMAÑO)
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import streamlit as st
+
+# ========== CONFIGURACIÓN ==========
+RUTA_POR_DEFECTO = os.path.join("data", "cache_llm.sqlite3")
+TTL_POR_DEFECTO = 7 * 24 * 3600      # segundos
+MAX_BYTES = 64 * 1024 * 1024         # tamaño máximo de las respuestas almacenadas
+INTERVALO_PODA = 100                 # escrituras entre comprobaciones de tamaño
+
+# ========== CLAVES ==========
+def calcular_clave(modelo, mensajes, parametros):
+    """Clave de caché: hash del modelo, los mensajes y los parámetros de generación"""
+    serializado = json.dumps(
+        {'modelo': modelo, 'mensajes': mensajes, 'parametros': parametros},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+# ========== ALMACÉN ==========
+class CacheLLM:
+    """Respuestas del modelo persistidas en SQLite con expiración y desalojo por último acceso"""
+
+    def __init__(self, ruta=RUTA_POR_DEFECTO, ttl=TTL_POR_DEFECTO, max_bytes=MAX_BYTES):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS respuestas (
+                clave TEXT PRIMARY KEY,
+                modelo TEXT,
+                respuesta TEXT NOT NULL,
+                tamano INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acceso ON respuestas (ultimo_acceso)")
+        self._conexion.commit()
+
+    def obtener(self, clave):
+        """Respuesta vigente para la clave o None"""
+        ahora = time.time()
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT respuesta, creado FROM respuestas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or ahora - fila[1] > self.ttl:
+                if fila is not None:
+                    self._conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                    self._conexion.commit()
+                self.fallos += 1
+                return None
+            self._conexion.execute("UPDATE respuestas SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave))
+            self._conexion.commit()
+            self.aciertos += 1
+            return fila[0]
+
+    def guardar(self, clave, modelo, respuesta):
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, modelo, respuesta, tamano, creado, ultimo_acceso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (clave, modelo, respuesta, len(respuesta.encode('utf-8')), ahora, ahora)
+            )
+            self._escrituras += 1
+            if self._escrituras % INTERVALO_PODA == 0:
+                self._podar(ahora)
+            self._conexion.commit()
+
+    def _podar(self, ahora):
+        """Elimina lo expirado y, si se supera el tamaño máximo, lo menos usado recientemente"""
+        self._conexion.execute("DELETE FROM respuestas WHERE creado < ?", (ahora - self.ttl,))
+        total = self._conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        exceso = total - self.max_bytes
+        liberado = 0
+        claves = []
+        for clave, tamano in self._conexion.execute("SELECT clave, tamano FROM respuestas ORDER BY ultimo_acceso"):
+            claves.append((clave,))
+            liberado += tamano
+            if liberado >= exceso:
+                break
+        self._conexion.executemany("DELETE FROM respuestas WHERE clave = ?", claves)
+
+    def estadisticas(self):
+        with self._lock:
+            entradas, total = self._conexion.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM respuestas"
+            ).fetchone()
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': round(self.aciertos / consultas * 100, 2) if consultas else 0.0,
+            'entradas': entradas,
+            'bytes': total,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def obtener_cache_llm():
+    """Instancia única por proceso (ruta configurable con LLM_CACHE_PATH)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            ruta = st.secrets.get("LLM_CACHE_PATH", os.environ.get("LLM_CACHE_PATH", RUTA_POR_DEFECTO))
+            _cache = CacheLLM(ruta)
+        return _cache
+
+# ========== PASARELA ==========
+def completar_con_cache(modelo, mensajes, generar, validar=None, cache=None, **parametros):
+    """Devuelve la respuesta cacheada para (modelo, mensajes, parámetros) o la genera con `generar()`
+
+    `validar` (opcional) recibe el texto y debe lanzar excepción si no es utilizable;
+    así una respuesta mal formada no queda cacheada.
+    """
+    cache = cache or obtener_cache_llm()
+    clave = calcular_clave(modelo, mensajes, parametros)
+    respuesta = cache.obtener(clave)
+    if respuesta is not None:
+        return respuesta
+    respuesta = generar()
+    if validar is not None:
+        validar(respuesta)
+    cache.guardar(clave, modelo, respuesta)
+    return respuesta
+
+def estadisticas_cache_llm():
+    return obtener_cache_llm().estadisticas()
@@ -0,0 +1,121 @@
+# cache_usuario.py - CACHÉ COMPARTIDA POR PROCESO (LRU + TTL + LÍMITE DE MEMORIA)
+import copy
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# ========== CONFIGURACIÓN ==========
+MAX_ENTRADAS = 2000
+MAX_BYTES = 256 * 1024 * 1024  # 256 MB aproximados
+TTL_POR_DEFECTO = 15 * 60  # segundos
+
+_AUSENTE = object()
+
+# ========== ESTIMACIÓN DE TAMAÑO ==========
+def estimar_tamano(valor, _profundidad=0):
+    """Estimación aproximada (en bytes) de la memoria que ocupa un valor"""
+    if hasattr(valor, 'estimar_tamano'):
+        return valor.estimar_tamano()
+    tamano = sys.getsizeof(valor)
+    if _profundidad > 6:
+        return tamano
+    if isinstance(valor, dict):
+        for k, v in valor.items():
+            tamano += estimar_tamano(k, _profundidad + 1) + estimar_tamano(v, _profundidad + 1)
+    elif isinstance(valor, (list, tuple, set)):
+        for v in valor:
+            tamano += estimar_tamano(v, _profundidad + 1)
+    return tamano
+
+# ========== CACHÉ ==========
+class CacheLRU:
+    """Caché clave/valor con expiración por TTL y desalojo LRU por número de entradas y memoria"""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS, max_bytes=MAX_BYTES, ttl=TTL_POR_DEFECTO):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # clave -> (valor, expira, tamano)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _quitar(self, clave):
+        _, _, tamano = self._entradas.pop(clave)
+        self._bytes -= tamano
+
+    def obtener(self, clave, por_defecto=None):
+        """Devuelve el valor vigente de la clave (y la marca como usada recientemente)"""
+        with self._lock:
+            entrada = self._entradas.get(clave, _AUSENTE)
+            if entrada is _AUSENTE:
+                self.fallos += 1
+                return por_defecto
+            valor, expira, _ = entrada
+            if expira < time.monotonic():
+                self._quitar(clave)
+                self.fallos += 1
+                return por_defecto
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def contiene(self, clave):
+        return self.obtener(clave, _AUSENTE) is not _AUSENTE
+
+    def guardar(self, clave, valor, ttl=None):
+        """Guarda (o reemplaza) un valor y desaloja lo necesario para respetar los límites"""
+        tamano = estimar_tamano(valor)
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            if tamano > self.max_bytes:
+                return
+            expira = time.monotonic() + (ttl if ttl is not None else self.ttl)
+            self._entradas[clave] = (valor, expira, tamano)
+            self._bytes += tamano
+            while self._entradas and (len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes):
+                self._quitar(next(iter(self._entradas)))
+
+    def invalidar(self, clave):
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+
+    def invalidar_usuario(self, user_id):
+        """Elimina todas las entradas de un usuario (claves con forma (tipo, user_id, ...))"""
+        with self._lock:
+            for clave in [c for c in self._entradas if isinstance(c, tuple) and len(c) > 1 and c[1] == user_id]:
+                self._quitar(clave)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
+
+# Instancia única para todo el proceso (compartida entre sesiones y páginas)
+cache = CacheLRU()
+
+# ========== AYUDANTES PARA DOCUMENTOS DE USUARIO ==========
+def leer_documento(tipo, user_id, cargar):
+    """Lee un documento de usuario desde la caché o lo carga con `cargar()` si no está vigente"""
+    clave = (tipo, user_id)
+    valor = cache.obtener(clave, _AUSENTE)
+    if valor is _AUSENTE:
+        valor = cargar()
+        cache.guardar(clave, valor)
+    # Copia para que las mutaciones del llamador no alteren la caché antes de guardar
+    return copy.deepcopy(valor)
+
+def escribir_documento(tipo, user_id, valor):
+    """Actualiza la caché tras una escritura confirmada (write-through)"""
+    cache.guardar((tipo, user_id), copy.deepcopy(valor))
+
+def invalidar_documento(tipo, user_id):
+    cache.invalidar((tipo, user_id))
@@ -0,0 +1,178 @@
+# calculo_pl.py - CÁLCULO DE P&L SIN DEPENDENCIAS DE FIREBASE: R-MÚLTIPLOS, TAMAÑO DE POSICIÓN, SALIDAS PARCIALES Y COMISIONES
+import math
+import numpy as np
+import pandas as pd
+
+# ========== CONFIGURACIÓN ==========
+VERSION_PL = 2  # 2: TP sin validar (0 o al otro lado de la entrada) ya no se usa como salida
+RIESGO_POR_DEFECTO = 100.0  # $ por R cuando no hay plan (misma escala que la antigua simulación RR x 100)
+
+# ========== TAMAÑO DE POSICIÓN ==========
+def riesgo_monetario_plan(plan):
+    """Importe arriesgado por operación según el plan: capital x riesgo_por_operacion %"""
+    try:
+        riesgo = float(plan['capital']) * float(plan['riesgo_por_operacion']) / 100
+    except (TypeError, KeyError, ValueError):
+        return RIESGO_POR_DEFECTO
+    return riesgo if riesgo > 0 else RIESGO_POR_DEFECTO
+
+def parsear_salidas(texto):
+    """'1.1050:50, 1.1100:50' -> [{'precio': 1.105, 'fraccion': 0.5}, ...]; lanza ValueError si no es válido"""
+    salidas = []
+    for parte in (texto or '').replace(';', ',').split(','):
+        if not parte.strip():
+            continue
+        precio, _, porcentaje = parte.partition(':')
+        salida = {'precio': float(precio), 'fraccion': float(porcentaje) / 100}
+        if salida['precio'] <= 0 or not 0 < salida['fraccion'] <= 1:
+            raise ValueError(f"Salida parcial no válida: {parte.strip()}")
+        salidas.append(salida)
+    if sum(s['fraccion'] for s in salidas) > 1 + 1e-9:
+        raise ValueError("Las salidas parciales suman más del 100%")
+    return salidas
+
+# ========== CÁLCULO POR OPERACIÓN ==========
+def _float(valor):
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return math.nan
+    return valor
+
+def _direccion(operacion):
+    return -1.0 if operacion.get('tipo') == 'Corto' else 1.0
+
+def precio_salida_efectivo(operacion):
+    """Precio medio de salida ponderado por las salidas parciales
+
+    El resto de la posición sale en precio_cierre o, si no se registró, en el TP
+    (ganadora) o el SL (perdedora), como en el cálculo anterior. Un TP a 0 (valor por
+    defecto del formulario) o al otro lado de la entrada no es una salida: queda en NaN.
+    """
+    final = _float(operacion.get('precio_cierre'))
+    if not final > 0:
+        if operacion.get('resultado') == 'Ganadora':
+            objetivo = _float(operacion.get('take_profit'))
+            entrada = _float(operacion.get('precio_entrada'))
+            final = objetivo if objetivo > 0 and _direccion(operacion) * (objetivo - entrada) > 0 else math.nan
+        else:
+            final = _float(operacion.get('stop_loss'))
+    salidas = operacion.get('salidas') or []
+    if not salidas:
+        return final
+    parcial = sum(s['fraccion'] for s in salidas)
+    importe = sum(s['precio'] * s['fraccion'] for s in salidas)
+    if parcial >= 1:
+        return importe / parcial
+    return importe + (1 - parcial) * final
+
+def calcular_pl_operacion(operacion, riesgo_monetario=None):
+    """Campos de P&L de una operación (se guardan en el documento al registrarla)
+
+    R = dirección x (salida - entrada) / |entrada - SL|; el P&L es R x riesgo monetario
+    menos comisiones. Si el broker aporta el resultado neto (profit_real) se usa ese.
+    Sin un SL válido, o sin cierre y con un TP que no sirve de salida, el R-múltiplo queda
+    en NaN y el P&L en 0 menos comisiones (salvo profit_real).
+    """
+    riesgo_monetario = riesgo_monetario or RIESGO_POR_DEFECTO
+    entrada = _float(operacion.get('precio_entrada'))
+    stop = _float(operacion.get('stop_loss'))
+    # Un SL a 0 (p. ej. operaciones importadas sin stop) no define riesgo
+    riesgo_unidad = abs(entrada - stop) if stop > 0 else math.nan
+    direccion = _direccion(operacion)
+
+    r_multiple = math.nan
+    if riesgo_unidad > 0:
+        r_multiple = direccion * (precio_salida_efectivo(operacion) - entrada) / riesgo_unidad
+    comision = _float(operacion.get('comision'))
+    comision = comision if comision == comision else 0.0
+
+    profit_real = _float(operacion.get('profit_real'))
+    if profit_real == profit_real:
+        pl = profit_real
+    else:
+        pl = (r_multiple * riesgo_monetario if r_multiple == r_multiple else 0.0) - comision
+
+    return {
+        'r_multiple': round(r_multiple, 4) if r_multiple == r_multiple else None,
+        'pl': round(pl, 2),
+        'riesgo_monetario': round(riesgo_monetario, 2),
+        'tamano_posicion': round(riesgo_monetario / riesgo_unidad, 6) if riesgo_unidad > 0 else None,
+        'version_pl': VERSION_PL,
+    }
+
+def pl_operacion(operacion):
+    """P&L guardado en la operación o, si es anterior al motor, calculado con su riesgo o el de por defecto"""
+    if operacion.get('version_pl') == VERSION_PL and operacion.get('pl') is not None:
+        return float(operacion['pl'])
+    return calcular_pl_operacion(operacion, operacion.get('riesgo_monetario'))['pl']
+
+# ========== CÁLCULO VECTORIZADO ==========
+def _columna(df, nombre):
+    if nombre not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[nombre], errors='coerce').to_numpy(dtype=np.float64)
+
+def calcular_pl_vectorizado(df, riesgo_monetario):
+    """Mismos campos que calcular_pl_operacion para todas las filas de un DataFrame, con arrays NumPy
+
+    Las filas que ya guardan riesgo_monetario lo conservan; riesgo_monetario solo cubre las que no.
+    """
+    guardado = _columna(df, 'riesgo_monetario')
+    riesgo_monetario = np.where(guardado > 0, guardado, riesgo_monetario)
+    entrada = _columna(df, 'precio_entrada')
+    stop = _columna(df, 'stop_loss')
+    ganadora = (df['resultado'] == 'Ganadora').to_numpy() if 'resultado' in df.columns else np.zeros(len(df), bool)
+    direccion = np.where((df['tipo'] == 'Corto').to_numpy(), -1.0, 1.0) if 'tipo' in df.columns else np.ones(len(df))
+
+    salida = _columna(df, 'precio_cierre')
+    objetivo = _columna(df, 'take_profit')
+    objetivo_valido = (objetivo > 0) & (direccion * (objetivo - entrada) > 0)
+    salida = np.where(salida > 0, salida, np.where(ganadora, np.where(objetivo_valido, objetivo, np.nan), stop))
+    if 'salidas' in df.columns:
+        # Las salidas parciales son listas: solo esas filas pasan por el cálculo escalar
+        con_salidas = df['salidas'].map(lambda s: isinstance(s, list) and len(s) > 0).to_numpy()
+        for i in np.flatnonzero(con_salidas):
+            salida[i] = precio_salida_efectivo(df.iloc[i].to_dict())
+
+    riesgo_unidad = np.abs(entrada - stop)
+    valido = (stop > 0) & (riesgo_unidad > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_multiple = np.where(valido, direccion * (salida - entrada) / riesgo_unidad, np.nan)
+        tamano = np.where(valido, riesgo_monetario / riesgo_unidad, np.nan)
+    comision = np.nan_to_num(_columna(df, 'comision'))
+    profit_real = _columna(df, 'profit_real')
+    pl = np.where(np.isnan(profit_real), np.nan_to_num(r_multiple * riesgo_monetario) - comision, profit_real)
+
+    return pd.DataFrame({
+        'r_multiple': np.round(r_multiple, 4),
+        'pl': np.round(pl, 2),
+        'riesgo_monetario': np.round(riesgo_monetario, 2),
+        'tamano_posicion': np.round(tamano, 6),
+        'version_pl': VERSION_PL,
+    }, index=df.index)
+
+# ========== OPERACIONES SIN P&L GUARDADO ==========
+def completar_pl(operaciones, riesgo_monetario):
+    """Añade en memoria los campos de P&L a las operaciones que no los tienen (cálculo vectorizado)
+
+    Devuelve [(id, campos)] de las completadas para persistirlas con motor_pl.persistir_pl.
+    """
+    pendientes = [op for op in operaciones if op.get('version_pl') != VERSION_PL]
+    if not pendientes:
+        return []
+    campos = calcular_pl_vectorizado(pd.DataFrame(pendientes), riesgo_monetario)
+    resultado = []
+    for operacion, fila in zip(pendientes, campos.to_dict('records')):
+        # Tipos nativos de Python (Firestore no serializa enteros de NumPy) y None en lugar de NaN
+        fila = {
+            'r_multiple': None if math.isnan(fila['r_multiple']) else float(fila['r_multiple']),
+            'pl': float(fila['pl']),
+            'riesgo_monetario': float(fila['riesgo_monetario']),
+            'tamano_posicion': None if math.isnan(fila['tamano_posicion']) else float(fila['tamano_posicion']),
+            'version_pl': VERSION_PL,
+        }
+        operacion.update(fila)
+        if operacion.get('id'):
+            resultado.append((operacion['id'], fila))
+    return resultado
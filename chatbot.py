@@ -1,51 +1,119 @@
 # chatbot.py - VERSIÓN MEJORADA Y CORREGIDA
 import streamlit as st
-import openai
 import json
-from datetime import datetime
+import re
+from contextlib import closing
+from datetime import datetime, timedelta
 import random
-import time
 from firebase_config import db
-import os
+from cache_usuario import leer_documento, escribir_documento, invalidar_documento
+from escrituras import LoteEscrituras
+from cliente_llm import completar, completar_stream
+from resumen_emocional import (registrar_emocion, reconstruir_resumen, resumen_reconstruido, cargar_resumen_emocional,
+                               conteos_totales, ahora_utc)
+from clasificador_emociones import obtener_clasificador, UMBRAL_CONFIANZA, FUENTE_LLM, FUENTE_LOCAL
 import pandas as pd
 import plotly.express as px
 
+# ========== SISTEMA DE MEMORIA Y CONTEXTO ==========
+# Cada mensaje es un documento de users/{uid}/chat_mensajes ordenado por 'creado':
+# guardar es un append O(1) y el historial reciente se lee con una consulta limitada.
+COLECCION_MENSAJES = 'chat_mensajes'
+LIMITE_HISTORIAL = 20
 
-# Configuración segura de API key
-openai.api_key = st.secrets.get("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY"))
+def _mensajes_ref(user_id):
+    return db.collection('users').document(user_id).collection(COLECCION_MENSAJES)
+
+def _migrar_historial_antiguo(user_id):
+    """Copia el documento único chatbot/historial (formato anterior) a documentos por mensaje"""
+    doc_ref = db.collection('users').document(user_id).collection('chatbot').document('historial')
+    doc = doc_ref.get()
+    if not doc.exists:
+        return []
+    datos = doc.to_dict()
+    conversaciones = datos.get('conversaciones', [])
+    if not conversaciones or datos.get('migrado'):
+        return []
+    try:
+        base = datetime.fromisoformat(datos.get('ultima_actualizacion'))
+    except (TypeError, ValueError):
+        base = ahora_utc()
+    batch = db.batch()
+    for i, mensaje in enumerate(conversaciones):
+        # Se conserva el orden original con marcas de tiempo consecutivas
+        batch.set(_mensajes_ref(user_id).document(), {
+            **mensaje, 'creado': base - timedelta(microseconds=len(conversaciones) - i)
+        })
+    batch.update(doc_ref, {'migrado': True})
+    batch.commit()
+    return conversaciones[-LIMITE_HISTORIAL:]
+
+def _leer_historial_chat(user_id, limite=LIMITE_HISTORIAL):
+    consulta = _mensajes_ref(user_id).order_by('creado', direction='DESCENDING').limit(limite)
+    mensajes = [doc.to_dict() for doc in consulta.stream()]
+    if not mensajes:
+        return _migrar_historial_antiguo(user_id)
+    mensajes.reverse()
+    for mensaje in mensajes:
+        mensaje.pop('creado', None)
+    return mensajes
 
-# ========== SISTEMA DE MEMORIA Y CONTEXTO ==========
 def cargar_historial_chat(user_id):
-    """Carga el historial de conversación del usuario"""
+    """Carga los últimos mensajes de la conversación (desde la caché compartida si está vigente)"""
     try:
-        doc_ref = db.collection('users').document(user_id).collection('chatbot').document('historial')
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict().get('conversaciones', [])
-        return []
+        return leer_documento('historial_chat', user_id, lambda: _leer_historial_chat(user_id))
     except Exception as e:
         st.error(f"Error al cargar historial: {str(e)}")
         return []
 
-def guardar_historial_chat(user_id, conversaciones):
-    """Guarda el historial de conversación"""
+def guardar_turno_chat(user_id, mensajes, historial, perfil):
+    """Guarda en un único batch los mensajes nuevos, sus conteos emocionales y el perfil
+
+    `historial` ya debe incluir los mensajes nuevos; la caché se actualiza tras el commit.
+    """
     try:
-        doc_ref = db.collection('users').document(user_id).collection('chatbot').document('historial')
-        doc_ref.set({
-            'conversaciones': conversaciones[-20:],  # Mantener sólo las últimas 20 interacciones
-            'ultima_actualizacion': datetime.now().isoformat()
-        })
+        ahora = ahora_utc()
+        with LoteEscrituras() as lote:
+            for i, mensaje in enumerate(mensajes):
+                lote.set(_mensajes_ref(user_id).document(), {**mensaje, 'creado': ahora + timedelta(microseconds=i)})
+                if mensaje.get('tipo') == 'usuario':
+                    registrar_emocion(user_id, mensaje.get('emocion'), ahora, escritor=lote)
+            lote.set(_perfil_ref(user_id), perfil)
+            lote.al_confirmar(lambda: escribir_documento('historial_chat', user_id, historial[-LIMITE_HISTORIAL:]))
+            lote.al_confirmar(lambda: escribir_documento('perfil_emocional', user_id, perfil))
+            lote.al_confirmar(lambda: invalidar_documento('resumen_emocional', user_id))
+        return True
     except Exception as e:
         st.error(f"Error al guardar historial: {str(e)}")
+        return False
+
+def obtener_resumen_emocional(user_id):
+    """Conteos diarios y semanales; la primera vez se reconstruyen a partir de todos los mensajes guardados
+
+    Se decide por el marcador y no por si hay conteos: un usuario antiguo que chatea antes
+    de abrir las estadísticas ya tiene periodos, pero sin sus mensajes anteriores.
+    """
+    try:
+        if not resumen_reconstruido(user_id):
+            reconstruir_resumen(user_id, [doc.to_dict() for doc in _mensajes_ref(user_id).stream()])
+        return cargar_resumen_emocional(user_id)
+    except Exception as e:
+        st.error(f"Error al cargar estadísticas emocionales: {str(e)}")
+        return {'diario': [], 'semanal': []}
+
+def _perfil_ref(user_id):
+    return db.collection('users').document(user_id).collection('chatbot').document('perfil_emocional')
+
+def _leer_perfil_emocional(user_id):
+    doc = _perfil_ref(user_id).get()
+    if doc.exists:
+        return doc.to_dict()
+    return {'estado_actual': 'neutral', 'patrones': [], 'mantras_personalizados': []}
 
 def cargar_perfil_emocional(user_id):
-    """Carga el perfil emocional del usuario"""
+    """Carga el perfil emocional del usuario (desde la caché compartida si está vigente)"""
     try:
-        doc_ref = db.collection('users').document(user_id).collection('chatbot').document('perfil_emocional')
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()
-        return {'estado_actual': 'neutral', 'patrones': [], 'mantras_personalizados': []}
+        return leer_documento('perfil_emocional', user_id, lambda: _leer_perfil_emocional(user_id))
     except Exception as e:
         st.error(f"Error al cargar perfil emocional: {str(e)}")
         return {'estado_actual': 'neutral', 'patrones': [], 'mantras_personalizados': []}
@@ -53,10 +121,12 @@ def cargar_perfil_emocional(user_id):
 def guardar_perfil_emocional(user_id, perfil):
     """Guarda el perfil emocional del usuario"""
     try:
-        doc_ref = db.collection('users').document(user_id).collection('chatbot').document('perfil_emocional')
-        doc_ref.set(perfil)
+        _perfil_ref(user_id).set(perfil)
+        escribir_documento('perfil_emocional', user_id, perfil)
+        return True
     except Exception as e:
         st.error(f"Error al guardar perfil emocional: {str(e)}")
+        return False
 
 # ========== MANTRAS Y RECORDATORIOS ==========
 MANTRAS_PREDETERMINADOS = [
@@ -94,6 +164,49 @@ RECORDATORIOS_TEMPORALES = {
 }
 
 # ========== DETECCIÓN EMOCIONAL MEJORADA ==========
+EMOCIONES_VALIDAS = ['ansiedad', 'confianza', 'frustracion', 'euforia', 'calma', 'neutral', 'miedo', 'culpa', 'impulsividad']
+TIPOS_PROBLEMA = ['riesgo', 'disciplina', 'perdida', 'ganancia', 'overtrading', 'ansiedad', 'general']
+
+def estado_emocional_neutral():
+    return {
+        "emocion_principal": "neutral",
+        "intensidad": 5,
+        "necesita_ayuda_urgente": False,
+        "palabras_clave": [],
+        "tipo_problema": "general"
+    }
+
+def validar_estado_emocional(estado):
+    """Comprueba el esquema del estado emocional y lo normaliza; lanza ValueError si no es válido"""
+    if not isinstance(estado, dict):
+        raise ValueError("El estado emocional debe ser un objeto JSON")
+    emocion = str(estado.get('emocion_principal', '')).strip().lower()
+    if emocion not in EMOCIONES_VALIDAS:
+        raise ValueError(f"Emoción no reconocida: {emocion}")
+    try:
+        intensidad = int(estado.get('intensidad'))
+    except (TypeError, ValueError):
+        raise ValueError("La intensidad debe ser un número entre 1 y 10")
+    palabras = estado.get('palabras_clave', [])
+    if not isinstance(palabras, list):
+        raise ValueError("palabras_clave debe ser una lista")
+    tipo = str(estado.get('tipo_problema', 'general')).strip().lower()
+    return {
+        "emocion_principal": emocion,
+        "intensidad": min(10, max(1, intensidad)),
+        "necesita_ayuda_urgente": bool(estado.get('necesita_ayuda_urgente', False)),
+        "palabras_clave": [str(p) for p in palabras],
+        "tipo_problema": tipo if tipo in TIPOS_PROBLEMA else 'general'
+    }
+
+def clasificar_localmente(user_id, historial, texto):
+    """Estado emocional del clasificador local si supera el umbral de confianza; None si hay que consultar al LLM"""
+    try:
+        estado, confianza = obtener_clasificador(user_id, historial).clasificar(texto)
+        return estado if confianza >= UMBRAL_CONFIANZA else None
+    except Exception as e:
+        return None
+
 def analizar_estado_emocional(texto):
     """Analiza el estado emocional del texto usando IA - Versión mejorada"""
     try:
@@ -112,36 +225,26 @@ def analizar_estado_emocional(texto):
         Sé preciso y analítico. El trader necesita ayuda real.
         """
 
-        respuesta = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Eres un analista emocional experto en trading. Responde solo con JSON válido y preciso."},
-                {"role": "user", "content": prompt}
-            ],
+        mensajes = [
+            {"role": "system", "content": "Eres un analista emocional experto en trading. Responde solo con JSON válido y preciso."},
+            {"role": "user", "content": prompt}
+        ]
+        # Los mensajes cortos se repiten mucho ("estoy nervioso"): la clasificación se cachea
+        contenido = completar(
+            mensajes,
             temperature=0.2,  # Menor temperatura para más precisión
-            max_tokens=200
+            max_tokens=200,
+            validar=lambda t: validar_estado_emocional(json.loads(t))
         )
         
-        return json.loads(respuesta["choices"][0]["message"]["content"])
+        return validar_estado_emocional(json.loads(contenido))
     except Exception as e:
-        return {
-            "emocion_principal": "neutral",
-            "intensidad": 5,
-            "necesita_ayuda_urgente": False,
-            "palabras_clave": [],
-            "tipo_problema": "general"
-        }
+        return estado_emocional_neutral()
 
 # ========== RESPUESTAS INTELIGENTES MEJORADAS ==========
-def generar_respuesta_emocional(user_input, estado_emocional, historial, perfil_emocional):
-    """Genera una respuesta psicológica apropiada - Versión mejorada"""
-    
-    # Actualizar perfil emocional
-    perfil_emocional['estado_actual'] = estado_emocional['emocion_principal']
-    perfil_emocional['ultima_actualizacion'] = datetime.now().isoformat()
-    
-    # Construir contexto detallado para la IA
-    contexto = f"""
+def _construir_contexto_coach(user_input, estado_emocional, historial):
+    """Prompt de sistema del coach con el estado emocional y el historial reciente"""
+    return f"""
     Eres Dr. Trading, un coach psicológico especializado EXCLUSIVAMENTE en traders profesionales. 
     
     CONTEXTO ACTUAL:
@@ -171,29 +274,223 @@ def generar_respuesta_emocional(user_input, estado_emocional, historial, perfil_
     El usuario dijo: "{user_input}"
     """
 
+def _respuesta_fallback(estado_emocional):
+    # Respuesta de fallback MUCHO más útil
+    return f"""🔍 **Análisis de tu situación:** Detecto {estado_emocional['emocion_principal']} de intensidad {estado_emocional['intensidad']}/10.
+
+🚀 **Acciones inmediatas:**
+1. Detén toda operación por hoy
+2. Revisa tu journaling de las últimas 3 operaciones
+3. Programa una revisión de tu plan de trading
+
+💡 **Recordatorio clave:** '{random.choice(MANTRAS_PREDETERMINADOS)}'
+
+¿Qué regla específica de tu plan crees que se vio comprometida?"""
+
+def _actualizar_perfil(perfil_emocional, estado_emocional):
+    perfil_emocional['estado_actual'] = estado_emocional['emocion_principal']
+    perfil_emocional['ultima_actualizacion'] = datetime.now().isoformat()
+
+def generar_respuesta_emocional(user_input, estado_emocional, historial, perfil_emocional):
+    """Genera una respuesta psicológica apropiada - Versión mejorada"""
+    
+    # Actualizar perfil emocional
+    _actualizar_perfil(perfil_emocional, estado_emocional)
+    contexto = _construir_contexto_coach(user_input, estado_emocional, historial)
+
     try:
-        respuesta = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
+        # Respuesta conversacional: depende del historial, no se cachea
+        return completar(
+            [
                 {"role": "system", "content": contexto},
                 {"role": "user", "content": user_input}
             ],
             temperature=0.8,
-            max_tokens=400
+            max_tokens=400,
+            usar_cache=False
         )
-        return respuesta["choices"][0]["message"]["content"]
     except Exception as e:
-        # Respuesta de fallback MUCHO más útil
-        return f"""🔍 **Análisis de tu situación:** Detecto {estado_emocional['emocion_principal']} de intensidad {estado_emocional['intensidad']}/10.
+        return _respuesta_fallback(estado_emocional)
 
-🚀 **Acciones inmediatas:**
-1. Detén toda operación por hoy
-2. Revisa tu journaling de las últimas 3 operaciones
-3. Programa una revisión de tu plan de trading
+def generar_respuesta_emocional_stream(user_input, estado_emocional, historial, perfil_emocional):
+    """Igual que generar_respuesta_emocional pero entrega la respuesta token a token"""
+    _actualizar_perfil(perfil_emocional, estado_emocional)
+    contexto = _construir_contexto_coach(user_input, estado_emocional, historial)
 
-💡 **Recordatorio clave:** '{random.choice(MANTRAS_PREDETERMINADOS)}'
+    recibido = False
+    try:
+        with closing(completar_stream(
+            [
+                {"role": "system", "content": contexto},
+                {"role": "user", "content": user_input}
+            ],
+            temperature=0.8,
+            max_tokens=400
+        )) as tokens:
+            for token in tokens:
+                recibido = True
+                yield token
+    except Exception as e:
+        if not recibido:
+            yield _respuesta_fallback(estado_emocional)
+        else:
+            yield "\n\n⚠️ _La respuesta se interrumpió. Inténtalo de nuevo en unos segundos._"
 
-¿Qué regla específica de tu plan crees que se vio comprometida?"""
+# ========== LLAMADA ÚNICA: EMOCIÓN + RESPUESTA ==========
+LLAMADA_UNICA = True  # False = clasificación bloqueante y después respuesta en streaming (dos llamadas)
+
+def _construir_contexto_unificado(historial):
+    """Prompt de sistema para clasificar la emoción y responder en la misma llamada"""
+    return f"""
+    Eres Dr. Trading, un coach psicológico especializado EXCLUSIVAMENTE en traders profesionales.
+
+    HISTORIAL RECIENTE:
+    {json.dumps(historial[-3:] if historial else 'Sin historial reciente', ensure_ascii=False)}
+
+    Analiza el último mensaje del trader y responde SOLO con JSON válido con esta forma:
+    {{
+        "estado": {{
+            "emocion_principal": "{'|'.join(EMOCIONES_VALIDAS)}",
+            "intensidad": 1-10,
+            "necesita_ayuda_urgente": true/false,
+            "palabras_clave": ["lista", "de", "palabras"],
+            "tipo_problema": "{'|'.join(TIPOS_PROBLEMA)}"
+        }},
+        "respuesta": "tu respuesta al trader"
+    }}
+
+    LA RESPUESTA DEBE INCLUIR:
+    - Análisis psicológico PROFESIONAL del problema, coherente con la emoción detectada
+    - 2-3 acciones CONCRETAS y prácticas para resolverlo
+    - Un framework específico para manejar esta situación
+    - Máximo 2 párrafos, extremadamente conciso pero útil
+    - Lenguaje profesional pero accesible
+    - Incluye un mantra relevante si aplica
+    """
+
+def _validar_respuesta_unificada(texto):
+    datos = json.loads(texto)
+    if not isinstance(datos, dict):
+        raise ValueError("La respuesta debe ser un objeto JSON")
+    respuesta = datos.get('respuesta')
+    if not isinstance(respuesta, str) or not respuesta.strip():
+        raise ValueError("Falta el texto de la respuesta")
+    return validar_estado_emocional(datos.get('estado')), respuesta.strip()
+
+def responder_en_una_llamada(user_input, historial, perfil_emocional):
+    """Clasifica la emoción y genera la respuesta del coach con una sola llamada JSON
+
+    Devuelve (estado_emocional, respuesta); lanza excepción si la llamada falla o
+    el JSON no cumple el esquema, para que el llamador use las dos llamadas clásicas.
+    """
+    contenido = completar(
+        [
+            {"role": "system", "content": _construir_contexto_unificado(historial)},
+            {"role": "user", "content": user_input}
+        ],
+        temperature=0.7,
+        max_tokens=600,
+        response_format={"type": "json_object"},
+        usar_cache=False,
+        validar=_validar_respuesta_unificada
+    )
+    estado_emocional, respuesta = _validar_respuesta_unificada(contenido)
+    _actualizar_perfil(perfil_emocional, estado_emocional)
+    return estado_emocional, respuesta
+
+class ExtractorCampoJSON:
+    """Extrae en streaming el texto de un campo de tipo string de un objeto JSON que llega por fragmentos
+
+    agregar() devuelve el texto decodificado del campo que ya ha llegado y no se había
+    devuelto; las secuencias de escape partidas entre fragmentos se esperan al siguiente.
+    """
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, campo):
+        self.patron = re.compile(r'"%s"\s*:\s*"' % re.escape(campo))
+        self.buffer = ''
+        self.posicion = None   # inicio del valor pendiente de decodificar en el buffer
+        self.terminado = False
+
+    def agregar(self, fragmento):
+        self.buffer += fragmento
+        if self.terminado:
+            return ''
+        if self.posicion is None:
+            encontrado = self.patron.search(self.buffer)
+            if not encontrado:
+                return ''
+            self.posicion = encontrado.end()
+        texto, i = [], self.posicion
+        while i < len(self.buffer):
+            caracter = self.buffer[i]
+            if caracter == '"':
+                self.terminado = True
+                break
+            if caracter != '\\':
+                texto.append(caracter)
+                i += 1
+                continue
+            if i + 1 >= len(self.buffer):
+                break
+            codigo = self.buffer[i + 1]
+            if codigo == 'u':
+                if i + 6 > len(self.buffer):
+                    break
+                unidad = int(self.buffer[i + 2:i + 6], 16)
+                if 0xD800 <= unidad < 0xDC00:
+                    # Emojis y demás caracteres fuera del BMP llegan como pareja de sustitutos
+                    if i + 12 > len(self.buffer):
+                        break
+                    baja = int(self.buffer[i + 8:i + 12], 16)
+                    unidad = 0x10000 + ((unidad - 0xD800) << 10) + (baja - 0xDC00)
+                    i += 6
+                texto.append(chr(unidad))
+                i += 6
+            else:
+                texto.append(self.ESCAPES.get(codigo, codigo))
+                i += 2
+        self.posicion = i
+        return ''.join(texto)
+
+def responder_en_una_llamada_stream(user_input, historial, perfil_emocional, turno):
+    """Como responder_en_una_llamada, pero entrega el campo 'respuesta' a medida que llega
+
+    El estado emocional (que el modelo escribe antes que la respuesta) se deja en
+    turno['estado'] al terminar. Si la llamada falla antes del primer fragmento de la
+    respuesta o el JSON no es válido, se recurre a las dos llamadas clásicas (también
+    en streaming).
+    """
+    extractor = ExtractorCampoJSON('respuesta')
+    emitido = False
+    try:
+        with closing(completar_stream(
+            [
+                {"role": "system", "content": _construir_contexto_unificado(historial)},
+                {"role": "user", "content": user_input}
+            ],
+            temperature=0.7,
+            max_tokens=600,
+            response_format={"type": "json_object"}
+        )) as fragmentos:
+            for fragmento in fragmentos:
+                texto = extractor.agregar(fragmento)
+                if texto:
+                    emitido = True
+                    yield texto
+        estado_emocional, _ = _validar_respuesta_unificada(extractor.buffer)
+    except Exception as e:
+        if emitido:
+            # La respuesta ya está en pantalla: solo falta la emoción
+            yield "\n\n⚠️ _La respuesta se interrumpió. Inténtalo de nuevo en unos segundos._"
+            turno['estado'] = analizar_estado_emocional(user_input)
+            _actualizar_perfil(perfil_emocional, turno['estado'])
+            return
+        turno['estado'] = analizar_estado_emocional(user_input)
+        yield from generar_respuesta_emocional_stream(user_input, turno['estado'], historial, perfil_emocional)
+        return
+    turno['estado'] = estado_emocional
+    _actualizar_perfil(perfil_emocional, estado_emocional)
 
 # ========== SISTEMA DE RECORDATORIOS MEJORADO ==========
 def obtener_recordatorio_contextual(user_id):
@@ -317,45 +614,55 @@ def mostrar_chatbot_trading():
     user_input = st.chat_input("¿Cómo te sientes o en qué necesitas apoyo?")
     
     if user_input:
-        # Analizar estado emocional
-        with st.spinner("🔍 Analizando tu estado emocional..."):
-            estado_emocional = analizar_estado_emocional(user_input)
-            time.sleep(1)  # Pequeña pausa para mejor UX
+        fuente_emocion = FUENTE_LLM
+        # Los mensajes obvios se clasifican en local y solo se llama al LLM para responder
+        estado_emocional = clasificar_localmente(user_id, historial, user_input)
+        if estado_emocional is not None:
+            fuente_emocion = FUENTE_LOCAL
+        elif not LLAMADA_UNICA:
+            with st.spinner("🔍 Analizando tu estado emocional..."):
+                estado_emocional = analizar_estado_emocional(user_input)
         
-        # Guardar mensaje del usuario
+        # Mostrar mensaje del usuario (la emoción se completa al terminar si la detecta la llamada única)
         mensaje_usuario = {
             'tipo': 'usuario',
             'mensaje': user_input,
             'timestamp': datetime.now().strftime("%H:%M"),
-            'emocion': estado_emocional['emocion_principal']
+            'emocion': estado_emocional['emocion_principal'] if estado_emocional else None,
+            'fuente_emocion': fuente_emocion
         }
-        historial.append(mensaje_usuario)
-        
-        # Mostrar mensaje del usuario
         with st.chat_message("user"):
             st.write(user_input)
-            st.caption(f"⌚ {mensaje_usuario['timestamp']} • 🎭 {estado_emocional['emocion_principal'].capitalize()}")
-        
-        # Generar y mostrar respuesta MEJORADA
-        with st.spinner("💭 Analizando la mejor estrategia para ayudarte..."):
-            respuesta = generar_respuesta_emocional(user_input, estado_emocional, historial, perfil_emocional)
-            time.sleep(1)  # Pequeña pausa para mejor UX
-        
-        mensaje_asistente = {
-            'tipo': 'asistente',
-            'mensaje': respuesta,
-            'timestamp': datetime.now().strftime("%H:%M"),
-            'emocion_detectada': estado_emocional['emocion_principal']
-        }
-        historial.append(mensaje_asistente)
+            pie_usuario = st.empty()
         
+        # Generar y mostrar respuesta MEJORADA a medida que llegan los tokens
         with st.chat_message("assistant"):
-            st.write(respuesta)
+            if estado_emocional is None:
+                # Emoción y respuesta en una sola llamada, mostrando la respuesta según llega
+                turno = {}
+                # closing: un rerun o una desconexión a mitad del stream libera la llamada al momento
+                with closing(responder_en_una_llamada_stream(user_input, historial, perfil_emocional, turno)) as stream:
+                    respuesta = st.write_stream(stream)
+                estado_emocional = turno['estado']
+                mensaje_usuario['emocion'] = estado_emocional['emocion_principal']
+                historial.append(mensaje_usuario)
+            else:
+                historial.append(mensaje_usuario)
+                with closing(generar_respuesta_emocional_stream(user_input, estado_emocional, historial,
+                                                                perfil_emocional)) as stream:
+                    respuesta = st.write_stream(stream)
+            mensaje_asistente = {
+                'tipo': 'asistente',
+                'mensaje': respuesta,
+                'timestamp': datetime.now().strftime("%H:%M"),
+                'emocion_detectada': estado_emocional['emocion_principal']
+            }
             st.caption(f"⌚ {mensaje_asistente['timestamp']} • 🎯 Basado en tu estado emocional")
+        pie_usuario.caption(f"⌚ {mensaje_usuario['timestamp']} • 🎭 {estado_emocional['emocion_principal'].capitalize()}")
+        historial.append(mensaje_asistente)
         
-        # Guardar historial y perfil actualizado
-        guardar_historial_chat(user_id, historial)
-        guardar_perfil_emocional(user_id, perfil_emocional)
+        # Guardar los mensajes del turno y el perfil actualizado en un solo batch
+        guardar_turno_chat(user_id, [mensaje_usuario, mensaje_asistente], historial, perfil_emocional)
         st.rerun()  # Forzar actualización para mostrar nuevos mensajes
     
     # ========== SECCIÓN 3: HERRAMIENTAS RÁPIDAS MEJORADAS ==========
@@ -447,23 +754,24 @@ def mostrar_chatbot_trading():
     
     # ========== SECCIÓN 4: PANEL DE ESTADÍSTICAS EMOCIONALES ==========
     with st.expander("📊 Estadísticas Emocionales (Haz clic para ver)"):
-        if historial:
-            # Analizar patrones emocionales
-            emociones = [msg.get('emocion', 'neutral') for msg in historial if msg['tipo'] == 'usuario']
-            if emociones:
-                from collections import Counter
-                conteo_emociones = Counter(emociones)
-                
+        resumen = obtener_resumen_emocional(user_id)
+        if resumen['semanal']:
+            granularidad = st.radio("Periodo", ["Semanal", "Diario"], horizontal=True, key="granularidad_emociones")
+            periodos = resumen['semanal'] if granularidad == "Semanal" else resumen['diario']
+            conteo_emociones = conteos_totales(periodos)
+            if conteo_emociones:
                 st.subheader("📈 Tu Perfil Emocional en Trading")
                 
                 col_graf, col_stats = st.columns([2, 1])
                 
                 with col_graf:
-                    # Gráfico de emociones
-                    df_emociones = pd.DataFrame.from_dict(conteo_emociones, orient='index').reset_index()
-                    df_emociones.columns = ['Emoción', 'Frecuencia']
-                    fig = px.bar(df_emociones, x='Emoción', y='Frecuencia', 
-                                title='Distribución de Estados Emocionales',
+                    # Evolución de las emociones por periodo
+                    df_emociones = pd.DataFrame([
+                        {'Periodo': p['periodo'], 'Emoción': emocion, 'Frecuencia': n}
+                        for p in periodos for emocion, n in p.get('conteos', {}).items()
+                    ])
+                    fig = px.bar(df_emociones, x='Periodo', y='Frecuencia',
+                                title='Evolución de Estados Emocionales',
                                 color='Emoción')
                     st.plotly_chart(fig)
                 
@@ -476,7 +784,7 @@ def mostrar_chatbot_trading():
                 emocion_comun = conteo_emociones.most_common(1)[0][0]
                 recomendaciones = {
                     "ansiedad": "🧘 Considera practicar meditación 10 min antes de trading",
-                    "frustración": "📝 Establece expectativas más realistas sobre drawdowns",
+                    "frustracion": "📝 Establece expectativas más realistas sobre drawdowns",
                     "euforia": "⚠️ Cuidado con overconfidence - mantén tu risk management",
                     "miedo": "🛡️ Trabaja en tamaño de posición gradual (scaling in)",
                     "neutral": "✅ Buen equilibrio emocional - mantén tu disciplina",
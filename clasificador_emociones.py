@@ -0,0 +1,235 @@
+# clasificador_emociones.py - CLASIFICADOR LOCAL DE EMOCIONES (LÉXICO + NAIVE BAYES) PARA EVITAR LLAMADAS AL LLM
+import math
+import re
+import unicodedata
+from collections import Counter
+from cache_usuario import cache, estimar_tamano
+
+# ========== CONFIGURACIÓN ==========
+UMBRAL_CONFIANZA = 0.80     # por debajo se consulta al LLM
+PESO_LEXICO = 3             # pseudo-ejemplos que aporta cada término del léxico
+TECHO_UNA_COINCIDENCIA = 0.70  # confianza máxima con un solo término suelto del léxico y sin ejemplos propios
+MIN_EJEMPLOS_EMOCION = 5    # ejemplos etiquetados del usuario que respaldan una única coincidencia
+VENTANA_NEGACION = 3        # palabras antes de un término en las que se busca un negador
+VENTANA_DECLARACION = 3     # palabras antes de un término en las que se busca "estoy", "me siento"...
+SUAVIZADO = 0.1             # suavizado de Lidstone
+FUENTE_LLM = 'llm'
+FUENTE_LOCAL = 'local'
+
+# Raíces normalizadas (minúsculas y sin tildes); se comparan como prefijo de cada palabra
+LEXICO = {
+    'ansiedad': ['ansie', 'ansios', 'nervios', 'inquiet', 'preocup', 'agobi', 'estres', 'angusti', 'tension', 'intranquil'],
+    'confianza': ['confia', 'me siento segur', 'estoy segur', 'convencid', 'tengo claro', 'preparad', 'decidid',
+                  'disciplinad'],
+    'frustracion': ['frustr', 'harto', 'rabia', 'enfad', 'molest', 'cabread', 'impoten', 'otra vez', 'siempre pierdo'],
+    'euforia': ['eufori', 'increible', 'brutal', 'imparable', 'invencible', 'millonari', 'on fire', 'subidon', 'emocionad'],
+    'calma': ['tranquil', 'calma', 'sereno', 'relajad', 'en paz', 'centrad', 'equilibr'],
+    'neutral': ['hola', 'buenas', 'gracias', 'vale', 'que tal', 'pregunta'],
+    'miedo': ['miedo', 'asust', 'panico', 'terror', 'temo', 'aterr', 'no me atrevo', 'paraliz'],
+    'culpa': ['culpa', 'arrepent', 'verguenza', 'no debi', 'fallo mio', 'la cague', 'error mio'],
+    'impulsividad': ['impuls', 'sin pensar', 'revancha', 'recuperar lo perdido', 'recuperar perdidas', 'venganza',
+                     'all in', 'doblar', 'doble lote', 'duplicar', 'overtrad', 'no pude parar'],
+}
+
+# "no estoy nada tranquilo", "no tengo miedo": el término aparece pero expresa lo contrario
+NEGADORES = {'no', 'nunca', 'nada', 'ni', 'tampoco'}
+
+# "estoy tranquilo", "me siento muy nervioso": el usuario declara su estado, un solo término basta
+DECLARACIONES = ['estoy', 'estuve', 'ando', 'sigo', 'me siento', 'me senti', 'me noto', 'siento', 'tengo']
+
+INTENSIFICADORES = ['muy', 'demasiado', 'much', 'totalmente', 'super', 'extrem', 'fatal', 'horrible', 'nunca', 'siempre']
+
+# Mensajes que nunca se resuelven en local: la evaluación de urgencia la hace el LLM
+URGENTES = ['suicid', 'matarme', 'no puedo mas', 'arruinad', 'todo mi dinero', 'deuda', 'prestamo', 'hipoteca', 'quiero morir']
+
+TIPOS_POR_EMOCION = {
+    'ansiedad': 'ansiedad',
+    'miedo': 'riesgo',
+    'frustracion': 'perdida',
+    'culpa': 'disciplina',
+    'impulsividad': 'overtrading',
+    'euforia': 'ganancia',
+}
+
+# ========== TEXTO ==========
+def normalizar_texto(texto):
+    """Minúsculas, sin tildes y con los signos de puntuación convertidos en espacios"""
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9ñ!?\s]", " ", texto)
+
+def tokenizar(texto):
+    """Palabras y bigramas del texto normalizado"""
+    palabras = re.findall(r"[a-z0-9ñ]+", normalizar_texto(texto))
+    return palabras + [f"{a} {b}" for a, b in zip(palabras, palabras[1:])]
+
+def coincidencias_lexico(texto):
+    """Número de raíces del léxico presentes en el texto, por emoción"""
+    normalizado = ' ' + ' '.join(re.findall(r"[a-z0-9ñ]+", normalizar_texto(texto)))
+    return {
+        emocion: sum(1 for raiz in raices if ' ' + raiz in normalizado)
+        for emocion, raices in LEXICO.items()
+    }
+
+def _apariciones(palabras):
+    """(emoción, raíz, posición de su primera palabra) de cada término del léxico en la lista de palabras"""
+    for emocion, raices in LEXICO.items():
+        for raiz in raices:
+            *inicio, final = raiz.split()
+            n = len(inicio)
+            for i in range(len(palabras) - n):
+                if palabras[i:i + n] == inicio and palabras[i + n].startswith(final):
+                    yield emocion, raiz, i
+
+def terminos_negados(texto):
+    """Términos del léxico precedidos por un negador a menos de VENTANA_NEGACION palabras, por emoción"""
+    palabras = re.findall(r"[a-z0-9ñ]+", normalizar_texto(texto))
+    negados = Counter()
+    for emocion, _, i in _apariciones(palabras):
+        if NEGADORES & set(palabras[max(0, i - VENTANA_NEGACION):i]):
+            negados[emocion] += 1
+    return negados
+
+def terminos_declarados(texto):
+    """Términos del léxico con los que el usuario declara su estado ("estoy tranquilo"), por emoción"""
+    palabras = re.findall(r"[a-z0-9ñ]+", normalizar_texto(texto))
+    declarados = Counter()
+    for emocion, raiz, i in _apariciones(palabras):
+        previas = ' ' + ' '.join(palabras[max(0, i - VENTANA_DECLARACION):i]) + ' '
+        if any(raiz.startswith(d + ' ') or f' {d} ' in previas for d in DECLARACIONES):
+            declarados[emocion] += 1
+    return declarados
+
+def caracteristicas(texto):
+    """Tokens del texto más un marcador 'lex:<emoción>' por cada término del léxico encontrado"""
+    marcadores = [
+        f"lex:{emocion}"
+        for emocion, n in coincidencias_lexico(texto).items()
+        for _ in range(n)
+    ]
+    return tokenizar(texto) + marcadores
+
+def _estimar_intensidad(texto, coincidencias):
+    normalizado = normalizar_texto(texto)
+    intensidad = 4 + min(3, coincidencias) + sum(1 for p in INTENSIFICADORES if p in normalizado)
+    intensidad += min(2, texto.count('!'))
+    return max(1, min(10, intensidad))
+
+# ========== MODELO ==========
+class ClasificadorEmociones:
+    """Naive Bayes multinomial sobre palabras y bigramas, sembrado con el léxico"""
+
+    def __init__(self):
+        self.conteos = {emocion: Counter() for emocion in LEXICO}
+        self.documentos = Counter()
+        self.n_ejemplos = 0
+        self._tamano = 0
+        self._sembrar_lexico()
+        self._preparar()
+
+    def _sembrar_lexico(self):
+        for emocion, raices in LEXICO.items():
+            self.conteos[emocion][f"lex:{emocion}"] += PESO_LEXICO * len(raices)
+            self.documentos[emocion] += 1
+
+    def entrenar(self, ejemplos):
+        """Añade ejemplos (texto, emoción); las emociones desconocidas se ignoran"""
+        for texto, emocion in ejemplos:
+            if emocion not in self.conteos:
+                continue
+            self.conteos[emocion].update(caracteristicas(texto))
+            self.documentos[emocion] += 1
+            self.n_ejemplos += 1
+        self._preparar()
+        return self
+
+    def _preparar(self):
+        self._vocabulario = set()
+        for conteo in self.conteos.values():
+            self._vocabulario.update(conteo)
+        self._tamano_vocabulario = max(1, len(self._vocabulario))
+        self._tamano = estimar_tamano(self.conteos)
+        total_documentos = sum(self.documentos.values())
+        self._log_prior = {e: math.log(self.documentos[e] / total_documentos) for e in self.conteos}
+        self._log_denominador = {
+            e: math.log(sum(c.values()) + SUAVIZADO * self._tamano_vocabulario)
+            for e, c in self.conteos.items()
+        }
+
+    def estimar_tamano(self):
+        return self._tamano
+
+    def probabilidades(self, texto):
+        """Probabilidad posterior de cada emoción"""
+        # Tokens nunca vistos en ninguna clase no discriminan: se omiten
+        tokens = [t for t in caracteristicas(texto) if t in self._vocabulario]
+        puntuaciones = {}
+        for emocion, conteo in self.conteos.items():
+            puntuacion = self._log_prior[emocion]
+            for token in tokens:
+                puntuacion += math.log(conteo.get(token, 0) + SUAVIZADO) - self._log_denominador[emocion]
+            puntuaciones[emocion] = puntuacion
+        maximo = max(puntuaciones.values())
+        exponenciales = {e: math.exp(p - maximo) for e, p in puntuaciones.items()}
+        total = sum(exponenciales.values())
+        return {e: v / total for e, v in exponenciales.items()}
+
+    def clasificar(self, texto):
+        """Estado emocional con el formato de analizar_estado_emocional y su confianza
+
+        La confianza es la probabilidad posterior de la emoción elegida, pero vale 0 si
+        el mensaje no contiene ningún término del léxico de esa emoción, si alguno está
+        negado o si menciona algo potencialmente urgente: en esos casos decide el LLM. Un
+        único término suelto no basta para superar el umbral salvo que el usuario lo use
+        para declarar su estado ("estoy tranquilo") o tenga ejemplos propios de esa emoción.
+        """
+        normalizado = normalizar_texto(texto)
+        coincidencias = coincidencias_lexico(texto)
+        probabilidades = self.probabilidades(texto)
+        emocion = max(probabilidades, key=probabilidades.get)
+        confianza = probabilidades[emocion]
+        if coincidencias[emocion] == 0 or terminos_negados(texto) or any(u in normalizado for u in URGENTES):
+            confianza = 0.0
+        elif coincidencias[emocion] == 1 and self.documentos[emocion] - 1 < MIN_EJEMPLOS_EMOCION \
+                and not terminos_declarados(texto)[emocion]:
+            confianza = min(confianza, TECHO_UNA_COINCIDENCIA)
+        palabras_clave = [
+            raiz for raiz in LEXICO[emocion] if ' ' + raiz in ' ' + ' '.join(re.findall(r"[a-z0-9ñ]+", normalizado))
+        ]
+        estado = {
+            "emocion_principal": emocion,
+            "intensidad": _estimar_intensidad(texto, coincidencias[emocion]),
+            "necesita_ayuda_urgente": False,
+            "palabras_clave": palabras_clave,
+            "tipo_problema": TIPOS_POR_EMOCION.get(emocion, 'general'),
+        }
+        return estado, round(confianza, 4)
+
+# ========== EJEMPLOS Y CACHÉ POR USUARIO ==========
+def ejemplos_desde_historial(historial):
+    """(mensaje, emoción) de los mensajes del usuario etiquetados por el LLM
+
+    Los clasificados en local se excluyen para no reentrenar el modelo con sus propias predicciones.
+    """
+    return [
+        (msg['mensaje'], msg['emocion'])
+        for msg in historial or []
+        if msg.get('tipo') == 'usuario' and msg.get('emocion') and msg.get('mensaje')
+        and msg.get('fuente_emocion', FUENTE_LLM) == FUENTE_LLM
+    ]
+
+def obtener_clasificador(user_id, historial):
+    """Clasificador del usuario; se reentrena solo cuando cambian sus ejemplos etiquetados
+
+    Vive en la caché compartida (LRU + TTL + memoria), así que los modelos de usuarios
+    inactivos se desalojan en vez de acumularse en el proceso.
+    """
+    ejemplos = ejemplos_desde_historial(historial)
+    huella = hash(tuple(ejemplos))
+    clave = ('clasificador_emociones', user_id)
+    guardado = cache.obtener(clave)
+    if guardado is not None and guardado[0] == huella:
+        return guardado[1]
+    clasificador = ClasificadorEmociones().entrenar(ejemplos)
+    cache.guardar(clave, (huella, clasificador))
+    return clasificador
@@ -0,0 +1,193 @@
+# cliente_llm.py - CLIENTE ÚNICO DEL LLM: POOL HTTP, REINTENTOS, CONCURRENCIA Y MÉTRICAS
+import os
+import random
+import threading
+import time
+from collections import deque
+import httpx
+import streamlit as st
+from dotenv import load_dotenv
+from openai import OpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from cache_llm import completar_con_cache
+from trazas import span
+
+load_dotenv()
+
+# ========== CONFIGURACIÓN ==========
+MODELO_POR_DEFECTO = "gpt-3.5-turbo"
+TIMEOUT_CONEXION = 5.0      # segundos
+TIMEOUT_LECTURA = 60.0      # segundos
+MAX_CONEXIONES = 20
+MAX_CONEXIONES_VIVAS = 10
+MAX_REINTENTOS = 4
+ESPERA_BASE = 0.5           # segundos
+ESPERA_MAXIMA = 8.0         # segundos
+MAX_LLAMADAS_CONCURRENTES = 8
+MAX_REGISTROS_METRICAS = 1000
+
+# ========== CLIENTE ==========
+_cliente = None
+_cliente_lock = threading.Lock()
+_semaforo = threading.BoundedSemaphore(MAX_LLAMADAS_CONCURRENTES)
+
+def obtener_cliente():
+    """Cliente OpenAI compartido con un pool de conexiones HTTP reutilizables"""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("⚠️ No se encontró la API key. Define OPENAI_API_KEY en tu .env o en secrets.toml")
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=MAX_CONEXIONES, max_keepalive_connections=MAX_CONEXIONES_VIVAS),
+                timeout=httpx.Timeout(TIMEOUT_LECTURA, connect=TIMEOUT_CONEXION),
+            )
+            # Los reintentos los gestiona este módulo (con jitter y métricas), no el SDK
+            _cliente = OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+        return _cliente
+
+# ========== MÉTRICAS ==========
+class MetricasLLM:
+    """Registro en memoria de latencia y tokens por llamada"""
+
+    def __init__(self, maximo=MAX_REGISTROS_METRICAS):
+        self.registros = deque(maxlen=maximo)
+        self._lock = threading.Lock()
+
+    def registrar(self, **registro):
+        with self._lock:
+            self.registros.append(registro)
+
+    def resumen(self):
+        with self._lock:
+            registros = list(self.registros)
+        if not registros:
+            return {'llamadas': 0}
+        latencias = sorted(r['latencia'] for r in registros)
+        return {
+            'llamadas': len(registros),
+            'errores': sum(1 for r in registros if not r['ok']),
+            'reintentos': sum(r['reintentos'] for r in registros),
+            'latencia_media': round(sum(latencias) / len(latencias), 3),
+            'latencia_p95': round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 3),
+            'tokens_prompt': sum(r['tokens_prompt'] for r in registros),
+            'tokens_respuesta': sum(r['tokens_respuesta'] for r in registros),
+        }
+
+metricas = MetricasLLM()
+
+# ========== REINTENTOS ==========
+def _es_reintentable(error):
+    if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+def _espera(intento):
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(ESPERA_MAXIMA, ESPERA_BASE * (2 ** intento)))
+
+def _llamar(modelo, mensajes, **parametros):
+    """Llamada al API con límite de concurrencia, reintentos en 429/5xx y registro de métricas"""
+    cliente = obtener_cliente()
+    with _semaforo, span('chat.completions', 'llm', modelo=modelo) as atributos:
+        intento = 0
+        inicio = time.perf_counter()
+        while True:
+            try:
+                respuesta = cliente.chat.completions.create(model=modelo, messages=mensajes, **parametros)
+                uso = respuesta.usage
+                atributos.update(reintentos=intento, tokens_prompt=uso.prompt_tokens if uso else 0,
+                                 tokens_respuesta=uso.completion_tokens if uso else 0)
+                metricas.registrar(
+                    modelo=modelo, ok=True, reintentos=intento,
+                    latencia=time.perf_counter() - inicio,
+                    tokens_prompt=uso.prompt_tokens if uso else 0,
+                    tokens_respuesta=uso.completion_tokens if uso else 0,
+                )
+                return respuesta.choices[0].message.content
+            except Exception as e:
+                if intento < MAX_REINTENTOS and _es_reintentable(e):
+                    time.sleep(_espera(intento))
+                    intento += 1
+                    continue
+                metricas.registrar(
+                    modelo=modelo, ok=False, reintentos=intento,
+                    latencia=time.perf_counter() - inicio,
+                    tokens_prompt=0, tokens_respuesta=0,
+                )
+                raise
+
+# ========== API PÚBLICA ==========
+def completar(mensajes, modelo=MODELO_POR_DEFECTO, usar_cache=True, validar=None, **parametros):
+    """Completa un chat y devuelve el texto; pasa por la caché de respuestas salvo usar_cache=False
+
+    Los parámetros adicionales (temperature, max_tokens, response_format...) se envían
+    tal cual al API y forman parte de la clave de caché.
+    """
+    if not usar_cache:
+        respuesta = _llamar(modelo, mensajes, **parametros)
+        if validar is not None:
+            validar(respuesta)
+        return respuesta
+    return completar_con_cache(
+        modelo, mensajes,
+        lambda: _llamar(modelo, mensajes, **parametros),
+        validar=validar, **parametros
+    )
+
+def completar_stream(mensajes, modelo=MODELO_POR_DEFECTO, **parametros):
+    """Genera el texto de la respuesta a medida que llegan los tokens (sin caché)
+
+    Los reintentos solo se aplican antes del primer token: una vez empezado el
+    stream, un error se propaga al consumidor.
+    """
+    cliente = obtener_cliente()
+    # Si Streamlit abandona el generador (rerun o desconexión) el hueco del semáforo y la conexión
+    # se liberan en el finally al cerrarlo, no cuando lo recoja el recolector de basura
+    _semaforo.acquire()
+    stream = None
+    try:
+        # El span no pasa a ser el activo: entre fragmentos el control vuelve a la página
+        with span('chat.completions.stream', 'llm', anidar=False, modelo=modelo) as atributos:
+            intento = 0
+            inicio = time.perf_counter()
+            while True:
+                try:
+                    stream = cliente.chat.completions.create(
+                        model=modelo, messages=mensajes, stream=True,
+                        stream_options={"include_usage": True}, **parametros
+                    )
+                    break
+                except Exception as e:
+                    if intento < MAX_REINTENTOS and _es_reintentable(e):
+                        time.sleep(_espera(intento))
+                        intento += 1
+                        continue
+                    metricas.registrar(
+                        modelo=modelo, ok=False, reintentos=intento,
+                        latencia=time.perf_counter() - inicio,
+                        tokens_prompt=0, tokens_respuesta=0,
+                    )
+                    raise
+
+            uso, ok = None, False
+            try:
+                for fragmento in stream:
+                    if fragmento.usage is not None:
+                        uso = fragmento.usage
+                    if fragmento.choices and fragmento.choices[0].delta.content:
+                        yield fragmento.choices[0].delta.content
+                ok = True
+            finally:
+                atributos.update(reintentos=intento, tokens_prompt=uso.prompt_tokens if uso else 0,
+                                 tokens_respuesta=uso.completion_tokens if uso else 0)
+                metricas.registrar(
+                    modelo=modelo, ok=ok, reintentos=intento,
+                    latencia=time.perf_counter() - inicio,
+                    tokens_prompt=uso.prompt_tokens if uso else 0,
+                    tokens_respuesta=uso.completion_tokens if uso else 0,
+                )
+    finally:
+        if stream is not None:
+            stream.close()
+        _semaforo.release()
@@ -0,0 +1,173 @@
+# cumplimiento_plan.py - CUMPLIMIENTO DEL PLAN: REGLAS PRECOMPILADAS EVALUADAS EN CADA OPERACIÓN AL GUARDARLA
+import re
+from collections import Counter
+from datetime import datetime
+from firebase_admin import firestore
+from firebase_config import db
+from cache_usuario import cache, invalidar_documento
+from escrituras import LoteEscrituras, MAX_OPERACIONES_LOTE
+from metricas_incrementales import agregados_ref
+from sincronizacion_operaciones import notificar_escritura
+from backtester import minutos_hora
+
+# ========== CONFIGURACIÓN ==========
+VERSION_CUMPLIMIENTO = 1
+PATRON_RR = re.compile(r'(\d+(?:[.,]\d+)?)\s*:\s*1')  # "TP: 2:1 risk-reward ratio mínimo"
+
+MOTIVOS = {
+    'horario': "Fuera del horario del plan",
+    'activo': "Activo fuera de los favoritos del plan",
+    'limite_diario': "Supera el máximo de operaciones por día",
+    'rr_minimo': "R:R por debajo del mínimo del plan",
+}
+
+def normalizar_activo(activo):
+    """'eur/usd', 'EURUSD', 'EUR-USD' -> 'EURUSD'"""
+    return re.sub(r'[^A-Z0-9]', '', str(activo or '').upper())
+
+def rr_minimo_plan(plan):
+    """R:R mínimo del plan: el campo rr_minimo o, en planes anteriores, el 'N:1' de sus reglas de salida/riesgo"""
+    if plan.get('rr_minimo'):
+        return float(plan['rr_minimo'])
+    for regla in plan.get('reglas_salida', []) + plan.get('gestion_riesgo', []):
+        encontrado = PATRON_RR.search(str(regla))
+        if encontrado:
+            return float(encontrado.group(1).replace(',', '.'))
+    return None
+
+def _minuto_operacion(operacion):
+    try:
+        fecha = datetime.fromisoformat(str(operacion.get('fecha')))
+    except ValueError:
+        return None
+    return fecha.hour * 60 + fecha.minute
+
+def _dia_operacion(operacion):
+    return str(operacion.get('fecha', ''))[:10]
+
+def firma_plan(plan):
+    """Campos del plan de los que dependen las reglas: si cambian, el plan se recompila"""
+    return (plan.get('fecha_creacion'), plan.get('hora_inicio'), plan.get('hora_fin'),
+            tuple(plan.get('pares_favoritos', [])), plan.get('max_operaciones_dia'), plan.get('rr_minimo'),
+            tuple(plan.get('reglas_salida', [])), tuple(plan.get('gestion_riesgo', [])))
+
+# ========== PLAN COMPILADO ==========
+class PlanCompilado:
+    """Reglas del plan convertidas una sola vez en predicados rápidos sobre una operación
+
+    Cada predicado recibe la operación y cuántas operaciones del mismo día la preceden,
+    y devuelve True si la incumple. Las reglas que el plan no define no se comprueban.
+    """
+
+    def __init__(self, plan):
+        self.plan_id = plan.get('fecha_creacion')
+        self.firma = firma_plan(plan)
+        self.reglas = []
+
+        if plan.get('hora_inicio') and plan.get('hora_fin'):
+            inicio, fin = minutos_hora(plan['hora_inicio']), minutos_hora(plan['hora_fin'])
+
+            def fuera_de_horario(op, previas):
+                minuto = _minuto_operacion(op)
+                if minuto is None:
+                    return False
+                # Un horario que cruza la medianoche deja fuera el tramo [fin, inicio)
+                return not inicio <= minuto < fin if inicio <= fin else fin <= minuto < inicio
+
+            self.reglas.append(('horario', fuera_de_horario))
+
+        favoritos = {normalizar_activo(p) for p in plan.get('pares_favoritos', [])} - {''}
+        if favoritos:
+            self.reglas.append(('activo', lambda op, previas: normalizar_activo(op.get('activo')) not in favoritos))
+
+        if plan.get('max_operaciones_dia'):
+            maximo = int(plan['max_operaciones_dia'])
+            self.reglas.append(('limite_diario', lambda op, previas: previas >= maximo))
+
+        rr_minimo = rr_minimo_plan(plan)
+        if rr_minimo:
+            self.reglas.append(('rr_minimo', lambda op, previas: not _rr_planificado(op) >= rr_minimo))
+
+    def evaluar(self, operacion, previas_dia=0):
+        """Campos de cumplimiento que se guardan en la operación"""
+        infracciones = [codigo for codigo, incumple in self.reglas if incumple(operacion, previas_dia)]
+        return {
+            'cumple_plan': not infracciones,
+            'infracciones': infracciones,
+            'motivo_incumplimiento': '; '.join(MOTIVOS[c] for c in infracciones) or None,
+            'plan_evaluado': self.plan_id,
+            'version_cumplimiento': VERSION_CUMPLIMIENTO,
+        }
+
+    def estimar_tamano(self):
+        return 1024
+
+def _rr_planificado(operacion):
+    """R:R planificado ((TP - entrada) en la dirección de la operación / |entrada - SL|)
+
+    NaN, que cuenta como incumplimiento, sin SL o TP válidos: un TP a 0 (sin objetivo en el
+    formulario o el extracto) o al otro lado de la entrada no define beneficio planificado.
+    """
+    try:
+        entrada, stop = float(operacion['precio_entrada']), float(operacion['stop_loss'])
+        objetivo = float(operacion['take_profit'])
+    except (KeyError, TypeError, ValueError):
+        return float('nan')
+    if stop <= 0 or objetivo <= 0 or entrada == stop:
+        return float('nan')
+    direccion = -1.0 if operacion.get('tipo') == 'Corto' else 1.0
+    beneficio = direccion * (objetivo - entrada)
+    if beneficio <= 0:
+        return float('nan')
+    return beneficio / abs(entrada - stop)
+
+def obtener_plan_compilado(user_id, plan):
+    """Plan compilado del usuario, reutilizado entre guardados mientras sus reglas no cambien"""
+    if not plan:
+        return None
+    guardado = cache.obtener(('plan_compilado', user_id))
+    if guardado is not None and guardado.firma == firma_plan(plan):
+        return guardado
+    compilado = PlanCompilado(plan)
+    cache.guardar(('plan_compilado', user_id), compilado)
+    return compilado
+
+def operaciones_previas_dia(operaciones, operacion, operacion_id=None):
+    """Operaciones del mismo día anteriores a `operacion` ('fecha' ISO: el orden de texto es el cronológico)"""
+    dia, fecha = _dia_operacion(operacion), str(operacion.get('fecha', ''))
+    return sum(1 for op in operaciones
+               if op.get('id') != operacion_id and _dia_operacion(op) == dia and str(op.get('fecha', '')) < fecha)
+
+# ========== OPERACIONES SIN EVALUAR ==========
+def evaluar_historial(operaciones, compilado):
+    """Evalúa en orden cronológico las operaciones que no tienen campos de cumplimiento
+
+    Las ya evaluadas cuentan para el límite diario pero conservan su resultado (se
+    evaluaron con el plan vigente al guardarlas). Devuelve [(id, campos)].
+    """
+    por_dia = Counter()
+    pendientes = []
+    for operacion in sorted(operaciones, key=lambda op: str(op.get('fecha', ''))):
+        dia = _dia_operacion(operacion)
+        if operacion.get('version_cumplimiento') != VERSION_CUMPLIMIENTO:
+            campos = compilado.evaluar(operacion, por_dia[dia])
+            operacion.update(campos)
+            if operacion.get('id'):
+                pendientes.append((operacion['id'], campos))
+        por_dia[dia] += 1
+    return pendientes
+
+def guardar_cumplimiento(user_id, pendientes):
+    """Guarda los campos de cumplimiento calculados y fuerza la reconstrucción de los agregados"""
+    if not pendientes:
+        return
+    operaciones_ref = db.collection('users').document(user_id).collection('operaciones')
+    for inicio in range(0, len(pendientes), MAX_OPERACIONES_LOTE):
+        with LoteEscrituras() as lote:
+            for operacion_id, campos in pendientes[inicio:inicio + MAX_OPERACIONES_LOTE]:
+                lote.update(operaciones_ref.document(operacion_id),
+                            {**campos, 'timestamp': firestore.SERVER_TIMESTAMP})
+    # Los buckets de cumplimiento de los agregados ya no cuadran: el dashboard los reconstruye
+    agregados_ref(user_id).delete()
+    invalidar_documento('agregados', user_id)
+    notificar_escritura(user_id)
@@ -7,31 +7,35 @@ from plotly.subplots import make_subplots
 import numpy as np
 from datetime import datetime, timedelta
 from firebase_config import db
-import openai
-import os
-from openai import OpenAI
-client = OpenAI()
-
-# Configuración de API (usa variables de entorno)
-openai.api_key = st.secrets.get("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY"))
+from sincronizacion_operaciones import obtener_operaciones, contar_operaciones
+from metricas_incrementales import (leer_agregados, guardar_agregados, reconstruir_agregados,
+                                    metricas_desde_agregados, resumen_cumplimiento, VERSION_AGREGADOS,
+                                    CAMPOS_EMOCIONES)
+from cache_usuario import cache, leer_documento, escribir_documento
+from analitica import (calcular_kpis, codificar_resultado, extremos_grupo, tasas_por_categoria,
+                       indices_lttb, version_dataset)
+from trabajos_ia import obtener_analisis, calcular_huella, reintentar_analisis
+from cliente_llm import completar
+from calculo_pl import (calcular_pl_vectorizado, completar_pl, riesgo_monetario_plan,
+                        RIESGO_POR_DEFECTO, VERSION_PL)
+from motor_pl import persistir_pl
+from estrategia_maestra import cargar_plan_trading
+from exportacion import obtener_exportacion, formatos_disponibles, FORMATOS
+from trazas import trazar, span
+from montecarlo import (simular, r_multiples, operaciones_por_mes, MIN_OPERACIONES, UMBRAL_RUINA,
+                        MESES_HORIZONTE, PERCENTILES_BANDAS)
+from cumplimiento_plan import obtener_plan_compilado, evaluar_historial, guardar_cumplimiento, MOTIVOS
 
 # ========== FUNCIONES DE DATOS ==========
 def cargar_operaciones_usuario(user_id):
-    """Carga las operaciones del usuario desde Firebase"""
+    """Carga las operaciones del usuario desde el almacén local sincronizado"""
     try:
-        operaciones = []
-        docs = db.collection('users').document(user_id).collection('operaciones').stream()
-        
-        for doc in docs:
-            op_data = doc.to_dict()
-            op_data['id'] = doc.id
-            operaciones.append(op_data)
-            
-        return operaciones
+        return obtener_operaciones(user_id)
     except Exception as e:
         st.error(f"Error al cargar operaciones: {str(e)}")
         return []
 
+@trazar('dataframe')
 def procesar_datos_operaciones(operaciones):
     """Convierte las operaciones en DataFrame y calcula métricas"""
     if not operaciones:
@@ -41,90 +45,141 @@ def procesar_datos_operaciones(operaciones):
     
     # Convertir y limpiar datos
     if 'fecha' in df.columns:
-        df['fecha'] = pd.to_datetime(df['fecha'])
+        # ISO8601 admite fechas con y sin microsegundos (operaciones importadas antes de unificar el formato)
+        df['fecha'] = pd.to_datetime(df['fecha'], format='ISO8601')
         df = df.sort_values('fecha')
     
     # Calcular métricas de rendimiento
     if all(col in df.columns for col in ['resultado', 'precio_entrada', 'stop_loss', 'take_profit']):
-        # Calcular P&L simulado (si no hay campo real)
-        df['resultado_num'] = df['resultado'].apply(lambda x: 1 if x == 'Ganadora' else -1)
-        df['risk_reward_ratio'] = (df['take_profit'] - df['precio_entrada']) / (df['precio_entrada'] - df['stop_loss'])
+        df['resultado_num'] = codificar_resultado(df['resultado'].to_numpy())
+        # R:R planificado, independiente de la dirección; sin SL válido queda en NaN
+        riesgo_unidad = (df['precio_entrada'] - df['stop_loss']).abs()
+        df['risk_reward_ratio'] = ((df['take_profit'] - df['precio_entrada']).abs() / riesgo_unidad).where((riesgo_unidad > 0) & (df['stop_loss'] > 0))
         
-        # Calcular equity curve (simulada)
-        df['profit_loss'] = df['resultado_num'] * df['risk_reward_ratio'] * 100  # Simulación
+        # P&L guardado por el motor de P&L; las filas sin él se calculan con el riesgo por defecto
+        sin_pl = df['version_pl'] != VERSION_PL if 'version_pl' in df.columns else pd.Series(True, index=df.index)
+        if sin_pl.any():
+            df.loc[sin_pl, 'pl'] = calcular_pl_vectorizado(df[sin_pl], RIESGO_POR_DEFECTO)['pl']
+        df['profit_loss'] = df['pl'].astype(float)
         df['equity_curve'] = df['profit_loss'].cumsum()
     
     return df
 
 # ========== MÉTRICAS Y KPIs ==========
+@trazar('calculo')
 def calcular_metricas_avanzadas(df):
-    """Calcula métricas avanzadas de trading"""
+    """Calcula métricas avanzadas de trading (núcleo vectorizado de analitica)"""
     if df is None or df.empty:
         return {}
     
+    kpis = calcular_kpis(df)
     metricas = {}
     
     # =====================
     # MÉTRICAS BÁSICAS
     # =====================
-    total_ops = len(df)
-    ganadoras = 0
-    perdedoras = 0
-    win_rate = 0
-
-    if 'resultado' in df.columns:
-        ganadoras = len(df[df['resultado'] == 'Ganadora'])
-        perdedoras = total_ops - ganadoras
-        win_rate = (ganadoras / total_ops * 100) if total_ops > 0 else 0
-
-    metricas['total_operaciones'] = total_ops
-    metricas['operaciones_ganadoras'] = ganadoras
-    metricas['operaciones_perdedoras'] = perdedoras
-    metricas['win_rate'] = round(win_rate, 2)
+    metricas['total_operaciones'] = kpis['total']
+    metricas['operaciones_ganadoras'] = kpis['ganadoras'] if 'resultado' in df.columns else 0
+    metricas['operaciones_perdedoras'] = kpis['perdedoras'] if 'resultado' in df.columns else 0
+    metricas['win_rate'] = kpis['win_rate'] if 'resultado' in df.columns else 0
 
     # =====================
     # MÉTRICAS AVANZADAS
     # =====================
-    if 'profit_loss' in df.columns and not df['profit_loss'].isnull().all():
-        metricas['profit_total'] = round(df['profit_loss'].sum(), 2)
-        metricas['profit_promedio'] = round(df['profit_loss'].mean(), 2) if total_ops > 0 else 0
-        metricas['profit_maximo'] = round(df['profit_loss'].max(), 2) if total_ops > 0 else 0
-        metricas['profit_minimo'] = round(df['profit_loss'].min(), 2) if total_ops > 0 else 0
-
-        # Drawdown calculation
-        equity_curve = df['equity_curve'].values if 'equity_curve' in df.columns else df['profit_loss'].cumsum().values
-        roll_max = np.maximum.accumulate(equity_curve)
-        drawdowns = equity_curve - roll_max
-        metricas['max_drawdown'] = round(np.min(drawdowns), 2) if len(drawdowns) > 0 else 0
-        metricas['drawdown_actual'] = round(drawdowns[-1], 2) if len(drawdowns) > 0 else 0
+    for clave in ['profit_total', 'profit_promedio', 'profit_maximo', 'profit_minimo', 'max_drawdown', 'drawdown_actual']:
+        if clave in kpis:
+            metricas[clave] = kpis[clave]
 
     # =====================
     # MÉTRICAS POR ACTIVO
     # =====================
-    if 'activo' in df.columns and 'profit_loss' in df.columns:
-        metricas_activo = df.groupby('activo').agg({
-            'resultado': (lambda x: (x == 'Ganadora').mean() * 100) if 'resultado' in df.columns else (lambda x: 0),
-            'profit_loss': 'sum'
-        }).rename(columns={'resultado': 'win_rate_activo', 'profit_loss': 'profit_activo'})
-
-        metricas['mejor_activo'] = metricas_activo['profit_activo'].idxmax() if not metricas_activo.empty else "N/A"
-        metricas['peor_activo'] = metricas_activo['profit_activo'].idxmin() if not metricas_activo.empty else "N/A"
+    mejor, peor = extremos_grupo(kpis, 'activo', 'profit')
+    if mejor is not None:
+        metricas['mejor_activo'] = mejor
+        metricas['peor_activo'] = peor
 
     # =====================
     # MÉTRICAS EMOCIONALES
     # =====================
-    emociones_campos = ['emocion_antes', 'emocion_durante', 'emocion_despues']
-    for campo in emociones_campos:
-        if campo in df.columns and 'resultado_num' in df.columns:
-            emociones_stats = df.groupby(campo)['resultado_num'].mean() * 100
-            if not emociones_stats.empty:
-                metricas[f'mejor_emocion_{campo}'] = emociones_stats.idxmax()
-                metricas[f'peor_emocion_{campo}'] = emociones_stats.idxmin()
+    if 'resultado_num' in df.columns:
+        for campo in ['emocion_antes', 'emocion_durante', 'emocion_despues']:
+            mejor, peor = extremos_grupo(kpis, campo, 'resultado_sum', media=True)
+            if mejor is not None:
+                metricas[f'mejor_emocion_{campo}'] = mejor
+                metricas[f'peor_emocion_{campo}'] = peor
 
     return metricas
 
+def completar_pl_usuario(user_id, operaciones):
+    """Calcula con el riesgo del plan el P&L de las operaciones que aún no lo tienen y lo guarda en segundo plano"""
+    try:
+        riesgo = riesgo_monetario_plan(cargar_plan_trading(user_id))
+        persistir_pl(user_id, completar_pl(operaciones, riesgo))
+    except Exception as e:
+        st.warning(f"No se pudo completar el P&L de operaciones antiguas: {str(e)}")
+
+class DatosUsuario:
+    """Operaciones y DataFrame del usuario, cargados solo cuando una sección necesita filas"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._operaciones = None
+        self._df = None
+
+    @property
+    def operaciones(self):
+        if self._operaciones is None:
+            with st.spinner("Cargando tus operaciones..."):
+                self._operaciones = cargar_operaciones_usuario(self.user_id)
+                completar_pl_usuario(self.user_id, self._operaciones)
+        return self._operaciones
+
+    @property
+    def df(self):
+        if self._df is None and self.operaciones:
+            self._df = procesar_datos_operaciones(self.operaciones)
+        return self._df
+
+def agregados_vigentes(user_id, agregados):
+    """Los agregados valen si son exactos y su total coincide con el almacén local (si ya está cargado)
+
+    Las escrituras de la app los mantienen en la misma transacción o los borran, así que sin
+    almacén en este proceso se confía en el documento en vez de descargar el historial.
+    """
+    if not agregados or agregados.get('version') != VERSION_AGREGADOS or not agregados.get('exacto'):
+        return False
+    total = contar_operaciones(user_id)
+    return total is None or total == agregados.get('total')
+
+def cargar_metricas_usuario(user_id, datos):
+    """KPIs y agregados desde el documento de agregados; si falta o no es exacto se recalcula desde el historial"""
+    try:
+        agregados = leer_documento('agregados', user_id, lambda: leer_agregados(user_id))
+        if agregados_vigentes(user_id, agregados):
+            return metricas_desde_agregados(agregados), agregados
+        if not datos.operaciones:
+            return {}, None
+        
+        # Ruta de verificación: cálculo completo y reconstrucción del documento de agregados
+        metricas = calcular_metricas_avanzadas(datos.df)
+        agregados = reconstruir_agregados(datos.operaciones)
+        guardar_agregados(user_id, agregados)
+        escribir_documento('agregados', user_id, agregados)
+        return metricas, agregados
+    except Exception as e:
+        st.warning(f"No se pudieron usar las métricas agregadas: {str(e)}")
+        return calcular_metricas_avanzadas(datos.df), None
+
 
 # ========== VISUALIZACIONES ==========
+PUNTOS_MAXIMOS_GRAFICO = 2000  # ~ ancho en píxeles de un gráfico a pantalla completa
+
+def _reducir_serie(x, y):
+    """Serie reducida con LTTB para no enviar decenas de miles de puntos al navegador"""
+    x_num = x.astype('int64') if np.issubdtype(x.dtype, np.datetime64) else x
+    indices = indices_lttb(x_num, y, PUNTOS_MAXIMOS_GRAFICO)
+    return x.iloc[indices], y.iloc[indices]
+
 def crear_grafico_equity_curve(df):
     """Crea gráfico de curva de equity con drawdown"""
     if df is None or 'equity_curve' not in df.columns:
@@ -134,15 +189,17 @@ def crear_grafico_equity_curve(df):
                        vertical_spacing=0.1, subplot_titles=('Curva de Equity', 'Drawdown'))
     
     # Equity curve
-    fig.add_trace(go.Scatter(x=df['fecha'], y=df['equity_curve'], 
+    x_equity, y_equity = _reducir_serie(df['fecha'], df['equity_curve'])
+    fig.add_trace(go.Scatter(x=x_equity, y=y_equity, 
                            mode='lines', name='Equity', line=dict(color='#4A5A3D')),
                  row=1, col=1)
     
-    # Drawdown calculation
+    # Drawdown calculation (sobre la serie completa; se reduce por separado para conservar sus mínimos)
     roll_max = np.maximum.accumulate(df['equity_curve'])
     drawdown = df['equity_curve'] - roll_max
+    x_drawdown, y_drawdown = _reducir_serie(df['fecha'], drawdown)
     
-    fig.add_trace(go.Scatter(x=df['fecha'], y=drawdown, 
+    fig.add_trace(go.Scatter(x=x_drawdown, y=y_drawdown, 
                            mode='lines', name='Drawdown', fill='tozeroy', 
                            line=dict(color='#FF6B6B')),
                  row=2, col=1)
@@ -228,24 +285,44 @@ def crear_grafico_rendimiento_temporal(df):
     
     return fig
 
+def obtener_grafico(user_id, nombre, datos, version, crear):
+    """Figura (como dict de Plotly) memoizada por usuario, gráfico y versión del dataset
+
+    El DataFrame solo se construye si la figura no está en caché.
+    """
+    clave = ('grafico', user_id, nombre)
+    guardado = cache.obtener(clave)
+    if guardado is not None and guardado[0] == version:
+        return guardado[1]
+    df = datos.df
+    with span(nombre, 'grafico'):
+        fig = crear(df)
+        figura = fig.to_dict() if fig is not None else None
+    cache.guardar(clave, (version, figura))
+    return figura
+
 # ========== ANÁLISIS CON IA ==========
-def generar_analisis_ia(metricas, df):
-    """Genera análisis inteligente con IA"""
-    if not metricas or df is None:
-        return "No hay suficientes datos para generar análisis."
-    
-    try:
-        resumen_metricas = "\n".join([f"{k}: {v}" for k, v in metricas.items()])
-        
-        emociones_analysis = ""
-        emociones_campos = ['emocion_antes', 'emocion_durante', 'emocion_despues']
-        for campo in emociones_campos:
-            if campo in df.columns:
-                emoc_stats = df.groupby(campo)['resultado_num'].mean() * 100
-                emociones_analysis += f"\nEmociones {campo}:\n" + "\n".join([f"  {emoc}: {rate:.1f}% win rate" 
-                                                                           for emoc, rate in emoc_stats.items()])
-        
-        prompt = f"""
+def tasas_emociones(agregados=None, df=None):
+    """Win rate (media de resultado_num en %) por emoción, desde los agregados o desde el DataFrame"""
+    if agregados is not None:
+        return {campo: {emoc: (2 * b['ganadoras'] - b['n']) / b['n'] * 100 for emoc, b in sorted(buckets.items())}
+                for campo, buckets in agregados.get('emociones', {}).items() if buckets}
+    kpis = calcular_kpis(df)
+    return {campo: tasas_por_categoria(kpis, campo)
+            for campo in CAMPOS_EMOCIONES if campo in df.columns}
+
+def construir_prompt_analisis_ia(metricas, tasas):
+    """Construye el prompt del análisis a partir de las métricas y las estadísticas emocionales"""
+    resumen_metricas = "\n".join([f"{k}: {v}" for k, v in metricas.items()])
+    
+    emociones_analysis = ""
+    for campo in CAMPOS_EMOCIONES:
+        if campo in tasas:
+            emoc_stats = tasas[campo]
+            emociones_analysis += f"\nEmociones {campo}:\n" + "\n".join([f"  {emoc}: {rate:.1f}% win rate" 
+                                                                       for emoc, rate in emoc_stats.items()])
+    
+    return f"""
         Como analista experto en trading, analiza estas métricas y proporciona insights accionables:
 
         MÉTRICAS PRINCIPALES:
@@ -263,22 +340,35 @@ def generar_analisis_ia(metricas, df):
 
         Sé conciso, profesional y enfocado en insights accionables. Responde en español.
         """
-        
-        respuesta = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Eres un analista cuantitativo experto en psicología del trading"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=600
-        )
-        
-        return respuesta.choices[0].message.content
+
+def consultar_analisis_ia(prompt):
+    """Llama al modelo con el prompt del análisis (lanza excepción si falla)"""
+    mensajes = [
+        {"role": "system", "content": "Eres un analista cuantitativo experto en psicología del trading"},
+        {"role": "user", "content": prompt}
+    ]
+    return completar(mensajes, temperature=0.7, max_tokens=600)
+
+def generar_analisis_ia(metricas, df):
+    """Genera análisis inteligente con IA (llamada síncrona)"""
+    if not metricas or df is None:
+        return "No hay suficientes datos para generar análisis."
     
+    try:
+        return consultar_analisis_ia(construir_prompt_analisis_ia(metricas, tasas_emociones(df=df)))
     except Exception as e:
         return f"Error en análisis IA: {str(e)}"
 
+def obtener_analisis_ia(user_id, metricas, agregados, datos):
+    """Último análisis guardado al instante; se regenera en segundo plano solo si cambian los datos"""
+    if not metricas:
+        return {'texto': "No hay suficientes datos para generar análisis.", 'estado': 'vigente', 'error': None}
+    
+    tasas = tasas_emociones(agregados=agregados) if agregados is not None else tasas_emociones(df=datos.df)
+    prompt = construir_prompt_analisis_ia(metricas, tasas)
+    # El prompt contiene todas las métricas que alimentan el análisis: es su huella
+    return obtener_analisis(user_id, 'dashboard', calcular_huella(prompt), lambda: consultar_analisis_ia(prompt))
+
 # ========== INTERFAZ PRINCIPAL ==========
 def mostrar_dashboard_personalizado():
     st.title("📊 Dashboard Personalizado")
@@ -290,13 +380,12 @@ def mostrar_dashboard_personalizado():
     
     user_id = st.session_state.user['uid']
     
-    # Cargar datos
+    # Cargar datos: las métricas salen del documento de agregados; las filas solo si una sección las pide
+    datos = DatosUsuario(user_id)
     with st.spinner("Cargando y analizando tus operaciones..."):
-        operaciones = cargar_operaciones_usuario(user_id)
-        df = procesar_datos_operaciones(operaciones)
-        metricas = calcular_metricas_avanzadas(df)
+        metricas, agregados = cargar_metricas_usuario(user_id, datos)
     
-    if not operaciones:
+    if not metricas:
         st.info("""
         ## 🚀 Bienvenido a tu Dashboard Personalizado
         
@@ -339,39 +428,42 @@ def mostrar_dashboard_personalizado():
     # ========== SECCIÓN 2: GRÁFICOS INTERACTIVOS ==========
     st.header("📊 Visualización de Datos")
     
-    tab1, tab2, tab3 = st.tabs(["Curva de Equity", "Distribución", "Rendimiento Temporal"])
-    
-    with tab1:
-        fig_equity = crear_grafico_equity_curve(df)
-        if fig_equity:
-            st.plotly_chart(fig_equity, use_container_width=True)
-        else:
-            st.info("Agrega más operaciones para ver la curva de equity")
-    
-    with tab2:
-        fig_dist = crear_grafico_distribucion_resultados(df)
-        if fig_dist:
-            st.plotly_chart(fig_dist, use_container_width=True)
-        else:
-            st.info("Datos insuficientes para gráficos de distribución")
-    
-    with tab3:
-        fig_temp = crear_grafico_rendimiento_temporal(df)
-        if fig_temp:
-            st.plotly_chart(fig_temp, use_container_width=True)
-        else:
-            st.info("Datos insuficientes para análisis temporal")
+    # st.tabs ejecuta el contenido de todas las pestañas: con un selector solo se construye el gráfico visible
+    graficos = {
+        "Curva de Equity": (crear_grafico_equity_curve, "Agrega más operaciones para ver la curva de equity"),
+        "Distribución": (crear_grafico_distribucion_resultados, "Datos insuficientes para gráficos de distribución"),
+        "Rendimiento Temporal": (crear_grafico_rendimiento_temporal, "Datos insuficientes para análisis temporal"),
+    }
+    seleccion = st.radio("Gráfico", list(graficos), horizontal=True,
+                         label_visibility="collapsed", key="grafico_dashboard")
+    crear, mensaje_vacio = graficos[seleccion]
+    version = agregados['revision'] if agregados is not None else version_dataset(datos.df)
+    figura = obtener_grafico(user_id, seleccion, datos, version, crear)
+    if figura:
+        st.plotly_chart(figura, use_container_width=True)
+    else:
+        st.info(mensaje_vacio)
     
     # ========== SECCIÓN 3: ANÁLISIS DETALLADO ==========
     st.header("🧠 Análisis Inteligente con IA")
     
     with st.expander("🔍 Insights Detallados", expanded=True):
-        analisis_ia = generar_analisis_ia(metricas, df)
-        st.markdown(f"""
-        <div style='background-color: #2E2E2E; padding: 20px; border-radius: 10px; border-left: 4px solid #C9A34E;'>
-        {analisis_ia}
-        </div>
-        """, unsafe_allow_html=True)
+        analisis_ia = obtener_analisis_ia(user_id, metricas, agregados, datos)
+        if analisis_ia['texto']:
+            st.markdown(f"""
+            <div style='background-color: #2E2E2E; padding: 20px; border-radius: 10px; border-left: 4px solid #C9A34E;'>
+            {analisis_ia['texto']}
+            </div>
+            """, unsafe_allow_html=True)
+        if analisis_ia['estado'] == 'actualizando':
+            st.caption("🔄 Tus operaciones cambiaron: actualizando el análisis en segundo plano...")
+            if st.button("Ver análisis actualizado", key="refrescar_analisis_ia"):
+                st.rerun()
+        if analisis_ia['error']:
+            st.warning(f"No se pudo actualizar el análisis: {analisis_ia['error']}")
+            if st.button("Reintentar análisis", key="reintentar_analisis_ia"):
+                reintentar_analisis(user_id, 'dashboard')
+                st.rerun()
     
     # ========== SECCIÓN 4: RECOMENDACIONES ACCIONABLES ==========
     st.header("💡 Recomendaciones Personalizadas")
@@ -385,10 +477,9 @@ def mostrar_dashboard_personalizado():
             st.warning("**Focus en calidad:** Tu win rate sugiere que necesitas mejorar la selección de operaciones")
         if metricas.get('max_drawdown', 0) < -500:
             st.error("**Gestión de riesgo:** El drawdown es elevado, considera reducir el tamaño de posición")
-        if 'emocion_antes' in df.columns:
-            emocion_peor = metricas.get('peor_emocion_emocion_antes', '')
-            if emocion_peor:
-                st.info(f"**Estado emocional:** Evita operar cuando te sientes {emocion_peor.lower()}")
+        emocion_peor = metricas.get('peor_emocion_emocion_antes', '')
+        if emocion_peor:
+            st.info(f"**Estado emocional:** Evita operar cuando te sientes {emocion_peor.lower()}")
     
     with rec_col2:
         st.subheader("✅ Para Mantener")
@@ -396,11 +487,20 @@ def mostrar_dashboard_personalizado():
             st.success("**Excelente consistencia:** Mantén tu estrategia actual")
         if metricas.get('profit_total', 0) > 0:
             st.success("**Rentabilidad positiva:** Sigue con tu enfoque actual")
-        if len(df) > 20 and metricas.get('win_rate', 0) > 55:
+        if metricas.get('total_operaciones', 0) > 20 and metricas.get('win_rate', 0) > 55:
             st.success("**Consistencia demostrada:** Tu método está funcionando")
     
-    # ========== SECCIÓN 5: DATOS CRUDOS ==========
-    with st.expander("📋 Ver Datos Detallados"):
+    # ========== SECCIÓN 5: CUMPLIMIENTO DEL PLAN ==========
+    mostrar_cumplimiento_plan(user_id, datos)
+    
+    # ========== SECCIÓN 6: PROYECCIÓN MONTE CARLO ==========
+    mostrar_montecarlo(user_id, datos, version, metricas.get('total_operaciones', 0))
+    
+    # ========== SECCIÓN 7: DATOS CRUDOS ==========
+    # Un expander ejecuta su contenido aunque esté cerrado: con un interruptor las filas solo se cargan al abrirlo
+    st.subheader("📋 Datos Detallados")
+    if st.toggle("Ver datos detallados", key="ver_datos_detallados"):
+        df = datos.df
         if df is not None:
             columnas_necesarias = ['fecha', 'activo', 'timeframe', 'resultado', 'profit_loss']
             columnas_presentes = [c for c in columnas_necesarias if c in df.columns]
@@ -410,13 +510,153 @@ def mostrar_dashboard_personalizado():
             else:
                 st.info("⚠️ Aún no tienes datos suficientes para mostrar columnas detalladas.")
         
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="📥 Descargar Datos CSV",
-                data=csv,
-                file_name="mis_operaciones_trading.csv",
-                mime="text/csv"
-            )
+            mostrar_exportacion(user_id, datos, version)
+
+def mostrar_cumplimiento_plan(user_id, datos):
+    """P&L cumpliendo vs sin cumplir el plan, leído de los buckets de los agregados (sin recorrer el historial)"""
+    st.header("📏 Cumplimiento del Plan")
+    try:
+        agregados = leer_documento('agregados', user_id, lambda: leer_agregados(user_id))
+    except Exception as e:
+        st.warning(f"No se pudo leer el cumplimiento del plan: {str(e)}")
+        return
+    if not agregados or agregados.get('version') != VERSION_AGREGADOS:
+        st.info("El resumen de cumplimiento estará disponible al actualizar las métricas")
+        return
+    
+    resumen = resumen_cumplimiento(agregados)
+    grupos = resumen['grupos']
+    etiquetas = {'cumple': "✅ Siguiendo el plan", 'incumple': "⚠️ Fuera del plan"}
+    columnas = st.columns(2)
+    for columna, (clave, titulo) in zip(columnas, etiquetas.items()):
+        grupo = grupos.get(clave, {'operaciones': 0, 'profit_total': 0.0, 'profit_promedio': 0.0, 'win_rate': 0.0})
+        with columna:
+            st.subheader(titulo)
+            st.metric("Operaciones", grupo['operaciones'])
+            st.metric("Profit Total", f"${grupo['profit_total']:,.2f}")
+            st.metric("Profit Promedio", f"${grupo['profit_promedio']:,.2f}")
+            st.metric("Win Rate", f"{grupo['win_rate']}%")
+    
+    if resumen['infracciones']:
+        infracciones = pd.DataFrame([
+            {'Regla': MOTIVOS.get(codigo, codigo), 'Operaciones': infraccion['operaciones'],
+             'Profit': infraccion['profit_total']}
+            for codigo, infraccion in resumen['infracciones'].items()
+        ])
+        fig = px.bar(infracciones, x='Regla', y='Profit', text='Operaciones', title="P&L por regla incumplida")
+        st.plotly_chart(fig, use_container_width=True)
+    
+    sin_evaluar = grupos.get('sin_evaluar', {}).get('operaciones', 0)
+    if sin_evaluar:
+        st.caption(f"{sin_evaluar} operaciones anteriores al control de cumplimiento aún no se han evaluado")
+        if st.button("📏 Evaluar con el plan actual", key="evaluar_cumplimiento"):
+            plan_compilado = obtener_plan_compilado(user_id, cargar_plan_trading(user_id))
+            if not plan_compilado:
+                st.warning("Crea un plan de trading para evaluar tus operaciones")
+                return
+            try:
+                with st.spinner("Evaluando operaciones..."):
+                    guardar_cumplimiento(user_id, evaluar_historial(datos.operaciones, plan_compilado))
+            except Exception as e:
+                st.error(f"Error al evaluar el cumplimiento: {str(e)}")
+                return
+            st.rerun()
+
+def obtener_montecarlo(user_id, datos, plan, meses, umbral_ruina, version):
+    """Resultado de la simulación memoizado por usuario, versión del dataset y parámetros
+
+    R-múltiplos y ritmo mensual salen del DataFrame, que solo se construye si no hay resultado
+    en caché. Devuelve None si no hay MIN_OPERACIONES operaciones con R-múltiplo.
+    """
+    parametros = (version, plan.get('capital'), plan.get('riesgo_por_operacion'), plan.get('objetivo_mensual'),
+                  plan.get('max_operaciones_dia'), meses, umbral_ruina)
+    clave = ('montecarlo', user_id)
+    guardado = cache.obtener(clave)
+    if guardado is not None and guardado[0] == parametros:
+        return guardado[1]
+    df = datos.df
+    r = r_multiples(df)
+    resultado = None
+    if len(r) >= MIN_OPERACIONES:
+        resultado = simular(r, float(plan['capital']), riesgo_monetario_plan(plan), float(plan['objetivo_mensual']),
+                            operaciones_por_mes(df, plan), meses=meses, umbral_ruina=umbral_ruina)
+    cache.guardar(clave, (parametros, resultado))
+    return resultado
+
+@trazar('grafico')
+def crear_grafico_montecarlo(resultado):
+    """Bandas de percentiles de la equity simulada (5-95 y 25-75) y la mediana"""
+    bandas = resultado['bandas']
+    meses = np.arange(1, bandas.shape[1] + 1) / resultado['operaciones_mes']
+    fig = go.Figure()
+    for inferior, superior, opacidad in ((0, 4, 0.15), (1, 3, 0.3)):
+        fig.add_trace(go.Scatter(x=meses, y=bandas[superior], mode='lines', line=dict(width=0), showlegend=False))
+        fig.add_trace(go.Scatter(x=meses, y=bandas[inferior], mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor=f'rgba(201, 163, 78, {opacidad})',
+                                 name=f"P{PERCENTILES_BANDAS[inferior]}-P{PERCENTILES_BANDAS[superior]}"))
+    fig.add_trace(go.Scatter(x=meses, y=bandas[2], mode='lines', name="Mediana", line=dict(color='#C9A34E')))
+    fig.update_layout(title="Equity simulada", xaxis_title="Meses", yaxis_title="Equity ($)")
+    return fig
+
+def mostrar_montecarlo(user_id, datos, version, total_operaciones):
+    """Riesgo de ruina, drawdowns esperables y tiempo hasta el objetivo mensual del plan"""
+    st.header("🎲 Proyección Monte Carlo")
+    plan = cargar_plan_trading(user_id)
+    if not plan or not plan.get('capital'):
+        st.info("Crea un plan de trading (capital, riesgo y objetivo mensual) para proyectar tu riesgo de ruina")
+        return
+    mensaje_insuficiente = f"Se necesitan al menos {MIN_OPERACIONES} operaciones con R-múltiplo para la simulación"
+    if total_operaciones < MIN_OPERACIONES:
+        st.info(mensaje_insuficiente)
+        return
+    
+    col_ruina, col_meses = st.columns(2)
+    umbral_ruina = col_ruina.slider("Ruina = perder (% del capital)", 10, 100, int(UMBRAL_RUINA * 100), 10,
+                                    key="mc_ruina") / 100
+    meses = col_meses.slider("Horizonte (meses)", 1, 24, MESES_HORIZONTE, key="mc_meses")
+    try:
+        resultado = obtener_montecarlo(user_id, datos, plan, meses, umbral_ruina, version)
+    except Exception as e:
+        st.error(f"Error en la simulación: {str(e)}")
+        return
+    if resultado is None:
+        st.info(mensaje_insuficiente)
+        return
+    
+    capital = float(plan['capital'])
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Riesgo de Ruina", f"{resultado['riesgo_ruina']}%")
+    drawdown_p95 = resultado['drawdown_percentiles'][95]
+    col2.metric("Drawdown P95", f"${drawdown_p95:,.0f}", f"{-drawdown_p95 / capital * 100:.1f}% del capital",
+                delta_color="off")
+    col3.metric(f"Objetivo {plan['objetivo_mensual']}% en 1 mes", f"{resultado['prob_objetivo_mes']}%")
+    mediana = resultado['meses_objetivo_p50']
+    col4.metric("Meses hasta el objetivo (mediana)", f"{mediana}" if mediana is not None else "Menos del 50% llega")
+    st.caption(f"{resultado['trayectorias']:,} trayectorias de {resultado['operaciones_horizonte']} operaciones "
+               f"(~{resultado['meses_horizonte']} meses a {resultado['operaciones_mes']} ops/mes) remuestreando "
+               f"tus {resultado['muestras']} R-múltiplos con ${riesgo_monetario_plan(plan):,.2f} por operación")
+    st.plotly_chart(crear_grafico_montecarlo(resultado), use_container_width=True)
+
+def mostrar_exportacion(user_id, datos, version):
+    """Descarga del journal: el fichero solo se genera al pulsar el botón y se reutiliza mientras no cambien los datos"""
+    nombres = {'parquet': "Parquet (tipado, recomendado)", 'csv': "CSV"}
+    col_formato, col_boton = st.columns([2, 1])
+    formato = col_formato.radio("Formato", formatos_disponibles(), format_func=nombres.get,
+                                horizontal=True, key="formato_exportacion")
+    fichero = obtener_exportacion(user_id, version, formato)
+    if fichero is None and col_boton.button("⚙️ Preparar exportación", key="preparar_exportacion"):
+        with st.spinner("Generando exportación..."):
+            try:
+                fichero = obtener_exportacion(user_id, version, formato, lambda: datos.df)
+            except Exception as e:
+                st.error(f"Error al generar la exportación: {str(e)}")
+    if fichero is not None:
+        st.download_button(
+            label=f"📥 Descargar Datos {formato.upper()}",
+            data=fichero,
+            file_name=f"mis_operaciones_trading.{FORMATOS[formato]['extension']}",
+            mime=FORMATOS[formato]['mime']
+        )
 
 
 # Ejecutar dashboard si se corre directamente
@@ -0,0 +1,60 @@
+# escrituras.py - AGRUPACIÓN DE ESCRITURAS DE UNA ACCIÓN EN UN ÚNICO WRITEBATCH ATÓMICO
+from firebase_config import db
+
+# ========== CONFIGURACIÓN ==========
+MAX_OPERACIONES_LOTE = 500  # límite de Firestore por batch/transacción
+
+# ========== LOTE ==========
+class LoteEscrituras:
+    """Acumula las escrituras de una acción de usuario y las confirma en un solo viaje de red
+
+    Se usa como context manager: al salir sin excepción hace commit del WriteBatch y
+    después ejecuta los callbacks registrados con al_confirmar (p. ej. actualizar la
+    caché); si hay excepción no se escribe nada. Expone set/update/delete con la firma
+    de WriteBatch, así que puede pasarse como `escritor` a las funciones que lo aceptan.
+    """
+
+    def __init__(self):
+        self.batch = db.batch()
+        self.operaciones = 0
+        self._callbacks = []
+
+    def _contar(self):
+        self.operaciones += 1
+        if self.operaciones > MAX_OPERACIONES_LOTE:
+            raise ValueError(f"Un lote admite como máximo {MAX_OPERACIONES_LOTE} escrituras")
+
+    def set(self, referencia, datos, merge=False):
+        self._contar()
+        self.batch.set(referencia, datos, merge=merge)
+        return self
+
+    def update(self, referencia, datos):
+        self._contar()
+        self.batch.update(referencia, datos)
+        return self
+
+    def delete(self, referencia):
+        self._contar()
+        self.batch.delete(referencia)
+        return self
+
+    def al_confirmar(self, callback):
+        """Registra una función que se ejecuta solo si el commit tiene éxito"""
+        self._callbacks.append(callback)
+        return self
+
+    def confirmar(self):
+        if self.operaciones:
+            self.batch.commit()
+        for callback in self._callbacks:
+            callback()
+        self._callbacks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo is None:
+            self.confirmar()
+        return False
@@ -1,38 +1,50 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
 from datetime import datetime, time
 import random
 from firebase_config import db
-import openai
-import os
+from cache_usuario import leer_documento, escribir_documento
+from escrituras import LoteEscrituras
+from cliente_llm import completar
+from sincronizacion_operaciones import obtener_operaciones
+from calculo_pl import completar_pl, riesgo_monetario_plan
+from motor_pl import persistir_pl
+from backtester import backtest_journal, backtest_ohlcv, cargar_ohlcv
+from analitica import indices_lttb
+from trazas import trazar
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-# Configuración segura de API key
-openai.api_key = st.secrets.get("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY"))
-
 # ========== SISTEMA DE ALMACENAMIENTO ==========
+def _leer_plan_trading(user_id):
+    doc_ref = db.collection('users').document(user_id).collection('trading_plan').document('plan_actual')
+    doc = doc_ref.get()
+    if doc.exists:
+        return doc.to_dict()
+    return None
+
 def cargar_plan_trading(user_id):
-    """Carga el plan de trading del usuario"""
+    """Carga el plan de trading del usuario (desde la caché compartida si está vigente)"""
     try:
-        doc_ref = db.collection('users').document(user_id).collection('trading_plan').document('plan_actual')
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()
-        return None
+        return leer_documento('plan', user_id, lambda: _leer_plan_trading(user_id))
     except Exception as e:
         st.error(f"Error al cargar plan: {str(e)}")
         return None
 
-def guardar_plan_trading(user_id, plan):
-    """Guarda el plan de trading del usuario"""
+def guardar_plan_trading(user_id, plan, en_historial=False):
+    """Guarda el plan de trading del usuario y, si se pide, una copia en el historial (mismo batch)"""
     try:
         doc_ref = db.collection('users').document(user_id).collection('trading_plan').document('plan_actual')
         plan['ultima_actualizacion'] = datetime.now().isoformat()
-        doc_ref.set(plan)
+        with LoteEscrituras() as lote:
+            lote.set(doc_ref, plan)
+            if en_historial:
+                lote.set(db.collection('users').document(user_id).collection('trading_plan_historial').document(), plan)
+            lote.al_confirmar(lambda: escribir_documento('plan', user_id, plan))
         return True
     except Exception as e:
         st.error(f"Error al guardar plan: {str(e)}")
@@ -106,6 +118,15 @@ def wizard_plan_trading():
             help="Límite para evitar overtrading"
         )
         
+        rr_minimo = st.slider(
+            "Ratio riesgo/beneficio mínimo (R:R):",
+            min_value=1.0,
+            max_value=5.0,
+            value=2.0,
+            step=0.5,
+            help="Solo entrar si el TP está al menos a esta distancia del SL"
+        )
+        
         # Paso 3: Horarios y mercados
         st.subheader("3. Horarios y Mercados Preferidos")
         
@@ -169,6 +190,7 @@ def wizard_plan_trading():
                 'capital': capital,
                 'riesgo_por_operacion': riesgo_por_operacion,
                 'max_operaciones_dia': max_operaciones_dia,
+                'rr_minimo': rr_minimo,
                 'hora_inicio': hora_inicio.strftime("%H:%M"),
                 'hora_fin': hora_fin.strftime("%H:%M"),
                 'mercados': mercados,
@@ -195,6 +217,7 @@ def generar_plan_inteligente(plan_base):
     CAPITAL: ${plan_base['capital']}
     RIESGO POR OPERACIÓN: {plan_base['riesgo_por_operacion']}%
     MÁXIMO OPERACIONES/DÍA: {plan_base['max_operaciones_dia']}
+    R:R MÍNIMO: {plan_base.get('rr_minimo', 2)}:1
     HORARIO: {plan_base['hora_inicio']} a {plan_base['hora_fin']}
     MERCADOS: {', '.join(plan_base['mercados'])}
     ACTIVOS FAVORITOS: {', '.join(plan_base['pares_favoritos'])}
@@ -224,17 +247,14 @@ def generar_plan_inteligente(plan_base):
     """
     
     try:
-        respuesta = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Eres un mentor de trading profesional que crea planes personalizados."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1500
-        )
+        mensajes = [
+            {"role": "system", "content": "Eres un mentor de trading profesional que crea planes personalizados."},
+            {"role": "user", "content": prompt}
+        ]
+        # Mismos datos del wizard => mismo plan; solo se cachean respuestas con JSON válido
+        contenido = completar(mensajes, temperature=0.7, max_tokens=1500, validar=json.loads)
         
-        plan_detallado = json.loads(respuesta["choices"][0]["message"]["content"])
+        plan_detallado = json.loads(contenido)
         plan_base.update(plan_detallado)
         return plan_base
         
@@ -253,7 +273,7 @@ def crear_plan_por_defecto(plan_base):
     ]
     
     plan_base['reglas_salida'] = [
-        "TP: 2:1 risk-reward ratio mínimo",
+        f"TP: {plan_base.get('rr_minimo', 2)}:1 risk-reward ratio mínimo",
         "SL: Nunca mover en contra de la operación",
         "Salir si el fundamento inicial cambia"
     ]
@@ -373,6 +393,65 @@ def mostrar_plan_visual(plan):
         else:
             st.info("Checklist no disponible para este plan")
 
+# ========== BACKTEST DEL PLAN ==========
+PUNTOS_MAXIMOS_BACKTEST = 2000
+
+@trazar('grafico')
+def _grafico_backtest(resultado):
+    """Curvas de equity sin plan y con plan, reducidas con LTTB"""
+    fig = go.Figure()
+    for clave, nombre, color in (('base', 'Sin plan', '#8C8C8C'), ('plan', 'Con plan', '#C9A34E')):
+        equity = resultado[clave]['equity']
+        indices = indices_lttb(np.arange(len(equity)), equity, PUNTOS_MAXIMOS_BACKTEST)
+        fig.add_trace(go.Scatter(x=indices + 1, y=equity[indices], mode='lines', name=nombre,
+                                 line=dict(color=color)))
+    fig.update_layout(title="Equity: real vs siguiendo el plan", xaxis_title="Operación", yaxis_title="P&L acumulado ($)")
+    return fig
+
+def mostrar_backtest_plan(user_id, plan):
+    """Backtest del horario, límite diario y riesgo del plan sobre el journal o un fichero OHLCV"""
+    st.header("🧪 Backtest del Plan")
+    st.caption(f"Horario {plan.get('hora_inicio')} - {plan.get('hora_fin')} · "
+               f"máx. {plan.get('max_operaciones_dia')} ops/día · ${riesgo_monetario_plan(plan):,.2f} por operación")
+
+    fuente = st.radio("Datos", ["Mi journal", "Archivo OHLCV"], horizontal=True, key="backtest_fuente")
+    fichero = None
+    if fuente == "Archivo OHLCV":
+        fichero = st.file_uploader("Barras OHLCV (CSV o Parquet con fecha, open, high, low, close)",
+                                   type=['csv', 'parquet'], key="backtest_ohlcv")
+        st.caption("Las reglas de entrada son texto libre: sobre las barras se usa un cruce de medias "
+                   "20/50 con SL a 1.5 ATR y TP 2R como regla de referencia.")
+
+    if st.button("▶️ Ejecutar backtest"):
+        try:
+            with st.spinner("Ejecutando backtest..."):
+                if fichero is not None:
+                    resultado = backtest_ohlcv(cargar_ohlcv(fichero, fichero.name), plan)
+                else:
+                    operaciones = obtener_operaciones(user_id)
+                    persistir_pl(user_id, completar_pl(operaciones, riesgo_monetario_plan(plan)))
+                    resultado = backtest_journal(operaciones, plan) if operaciones else None
+            st.session_state.backtest_plan = resultado
+        except Exception as e:
+            st.error(f"Error al ejecutar el backtest: {str(e)}")
+            st.session_state.pop('backtest_plan', None)
+
+    resultado = st.session_state.get('backtest_plan')
+    if not resultado:
+        if fuente == "Mi journal" and 'backtest_plan' in st.session_state:
+            st.info("No hay operaciones registradas para el backtest")
+        return
+
+    base, con_plan = resultado['base'], resultado['plan']
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Operaciones", con_plan['operaciones'], -resultado['descartadas'])
+    col2.metric("Profit Total", f"${con_plan['profit_total']:,.2f}", f"{resultado['diferencia_profit']:+,.2f}")
+    col3.metric("Max Drawdown", f"${con_plan['max_drawdown']:,.2f}", f"{resultado['diferencia_drawdown']:+,.2f}")
+    col4.metric("Win Rate", f"{con_plan['win_rate']:.1f}%", f"{con_plan['win_rate'] - base['win_rate']:+.1f}%")
+    if resultado.get('barras'):
+        st.caption(f"{resultado['barras']:,} barras · {base['operaciones']:,} señales de la regla de referencia")
+    st.plotly_chart(_grafico_backtest(resultado), use_container_width=True)
+
 # ========== INTERFAZ PRINCIPAL ==========
 def mostrar_estrategia_maestra():
     st.title("📑 Plan de Trading Maestro")
@@ -389,7 +468,7 @@ def mostrar_estrategia_maestra():
     historial_planes = cargar_historial_planes(user_id)
     
     # Pestañas principales
-    tab1, tab2, tab3 = st.tabs(["🎯 Mi Plan Actual", "🔄 Crear Nuevo Plan", "📊 Historial"])
+    tab1, tab2, tab3, tab4 = st.tabs(["🎯 Mi Plan Actual", "🔄 Crear Nuevo Plan", "📊 Historial", "🧪 Backtest"])
     
     with tab1:
         if plan_actual:
@@ -435,17 +514,10 @@ def mostrar_estrategia_maestra():
             with st.spinner("Generando plan personalizado con IA..."):
                 plan_completo = generar_plan_inteligente(plan_nuevo)
                 
-                if guardar_plan_trading(user_id, plan_completo):
+                if guardar_plan_trading(user_id, plan_completo, en_historial=True):
                     st.success("🎉 ¡Plan de trading creado exitosamente!")
                     st.balloons()
                     
-                    # Guardar en historial
-                    try:
-                        historial_ref = db.collection('users').document(user_id).collection('trading_plan_historial').document()
-                        historial_ref.set(plan_completo)
-                    except Exception as e:
-                        st.error(f"Error al guardar en historial: {str(e)}")
-                    
                     # Mostrar resumen
                     with st.expander("Ver resumen del plan"):
                         mostrar_plan_visual(plan_completo)
@@ -469,6 +541,12 @@ def mostrar_estrategia_maestra():
                             st.rerun()
         else:
             st.info("No hay planes históricos guardados")
+    
+    with tab4:
+        if plan_actual:
+            mostrar_backtest_plan(user_id, plan_actual)
+        else:
+            st.info("Crea un plan de trading para poder hacer su backtest")
 
 # Ejecutar si se corre directamente
 if __name__ == "__main__":
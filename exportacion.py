@@ -0,0 +1,90 @@
+# exportacion.py - EXPORTACIÓN DEL JOURNAL A PARQUET/CSV CON COLUMNAS TIPADAS, BAJO DEMANDA Y CACHEADA
+import io
+import pandas as pd
+from cache_usuario import cache
+from trazas import trazar
+
+try:
+    import pyarrow  # noqa: F401  (motor de Parquet de pandas)
+except ImportError:
+    pyarrow = None
+
+# ========== CONFIGURACIÓN ==========
+# Columna -> tipo de la exportación; el resto de columnas no se exportan (imágenes, timestamps internos...)
+ESQUEMA_EXPORTACION = {
+    'id': 'string',
+    'fecha': 'datetime64[ns]',
+    'activo': 'string',
+    'timeframe': 'category',
+    'tipo': 'category',
+    'resultado': 'category',
+    'precio_entrada': 'float64',
+    'stop_loss': 'float64',
+    'take_profit': 'float64',
+    'risk_reward_ratio': 'float64',
+    'profit_loss': 'float64',
+    'r_multiple': 'float64',
+    'riesgo_monetario': 'float64',
+    'tamano_posicion': 'float64',
+    'comision': 'float64',
+    'equity_curve': 'float64',
+    'volumen': 'float64',
+    'precio_cierre': 'float64',
+    'fecha_cierre': 'datetime64[ns]',
+    'profit_real': 'float64',
+    'emocion_antes': 'category',
+    'emocion_durante': 'category',
+    'emocion_despues': 'category',
+    'resumen': 'string',
+    'leccion_aprendida': 'string',
+    'ticket': 'string',
+    'origen': 'category',
+}
+
+FORMATOS = {
+    'parquet': {'extension': 'parquet', 'mime': 'application/vnd.apache.parquet'},
+    'csv': {'extension': 'csv', 'mime': 'text/csv'},
+}
+
+def formatos_disponibles():
+    return [f for f in FORMATOS if f != 'parquet' or pyarrow is not None]
+
+# ========== DATASET ==========
+def preparar_exportacion(df):
+    """DataFrame con solo las columnas del esquema, en su orden y con su tipo"""
+    columnas = [c for c in ESQUEMA_EXPORTACION if c in df.columns]
+    exportable = df[columnas].copy()
+    for columna in columnas:
+        tipo = ESQUEMA_EXPORTACION[columna]
+        if tipo.startswith('datetime'):
+            exportable[columna] = pd.to_datetime(exportable[columna], format='ISO8601', errors='coerce')
+        elif tipo == 'float64':
+            exportable[columna] = pd.to_numeric(exportable[columna], errors='coerce')
+        else:
+            exportable[columna] = exportable[columna].astype(tipo)
+    return exportable.reset_index(drop=True)
+
+@trazar('calculo')
+def serializar(exportable, formato):
+    if formato == 'parquet':
+        buffer = io.BytesIO()
+        exportable.to_parquet(buffer, index=False, compression='zstd')
+        return buffer.getvalue()
+    return exportable.to_csv(index=False).encode('utf-8')
+
+# ========== API PÚBLICA ==========
+def obtener_exportacion(user_id, version, formato, obtener_df=None):
+    """Bytes de la exportación para la versión actual del dataset
+
+    Se cachean por (usuario, versión, formato). Sin obtener_df solo se devuelve lo ya
+    cacheado (o None), de modo que la página no paga la serialización ni el DataFrame en cada render.
+    """
+    clave = ('exportacion', user_id, formato)
+    guardado = cache.obtener(clave)
+    if guardado is not None and guardado[0] == version:
+        return guardado[1]
+    if obtener_df is None:
+        return None
+    datos = serializar(preparar_exportacion(obtener_df()), formato)
+    cache.guardar(clave, (version, datos))
+    return datos
@@ -2,6 +2,7 @@
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
+from trazas import instrumentar_firestore
 
 # Inicializar Firebase de forma segura
 def initialize_firebase():
@@ -42,6 +43,7 @@ firebase_initialized = initialize_firebase()
 if firebase_initialized:
     try:
         db = firestore.client()
+        instrumentar_firestore()
         auth_instance = auth
     except Exception as e:
         st.error(f"❌ Error obteniendo instancias de Firebase: {str(e)}")
@@ -49,8 +51,4 @@ if firebase_initialized:
         auth_instance = None
 else:
     db = None
-<<<<<<< HEAD
     auth_instance = None
-=======
-    auth_instance = None
->>>>>>> c9cd1037d16daa551adcdb469c53400330b52390
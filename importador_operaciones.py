@@ -0,0 +1,352 @@
+# importador_operaciones.py - IMPORTACIÓN MASIVA DE OPERACIONES DESDE CSV DEL BROKER E INFORMES HTML DE MT4/MT5
+import bisect
+import codecs
+import csv
+import hashlib
+import io
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+from html.parser import HTMLParser
+from firebase_admin import firestore
+from firebase_config import db
+from sincronizacion_operaciones import notificar_escritura
+from metricas_incrementales import agregados_ref
+from cache_usuario import invalidar_documento
+from calculo_pl import calcular_pl_operacion
+
+# ========== CONFIGURACIÓN ==========
+TAMANO_LOTE = 500               # escrituras por WriteBatch (límite de Firestore)
+TAMANO_BLOQUE = 64 * 1024       # bytes leídos por iteración del parser HTML
+INTERVALO_PROGRESO = 1000       # filas entre avisos de progreso
+TIMEFRAME_IMPORTADO = "N/A"     # los extractos no incluyen el timeframe del análisis
+EMOCION_IMPORTADA = "Neutral"
+
+# Cabeceras normalizadas (minúsculas, sin espacios ni signos) -> campo interno.
+# En los informes de MT4/MT5 'time' y 'price' aparecen dos veces: apertura y cierre.
+ALIAS_COLUMNAS = {
+    'ticket': 'ticket', 'order': 'ticket', 'orden': 'ticket', 'position': 'ticket', 'posicion': 'ticket',
+    'deal': 'ticket', 'id': 'ticket',
+    'opentime': 'fecha', 'time': 'fecha', 'fecha': 'fecha', 'date': 'fecha', 'fechaapertura': 'fecha',
+    'type': 'tipo', 'tipo': 'tipo', 'side': 'tipo', 'direction': 'tipo', 'direccion': 'tipo',
+    'symbol': 'activo', 'item': 'activo', 'simbolo': 'activo', 'instrument': 'activo', 'activo': 'activo',
+    'size': 'volumen', 'volume': 'volumen', 'lots': 'volumen', 'lotes': 'volumen', 'volumen': 'volumen',
+    'price': 'precio_entrada', 'openprice': 'precio_entrada', 'entryprice': 'precio_entrada',
+    'precio': 'precio_entrada', 'precioentrada': 'precio_entrada',
+    'sl': 'stop_loss', 'stoploss': 'stop_loss',
+    'tp': 'take_profit', 'takeprofit': 'take_profit',
+    'closetime': 'fecha_cierre', 'fechacierre': 'fecha_cierre',
+    'closeprice': 'precio_cierre', 'exitprice': 'precio_cierre', 'preciocierre': 'precio_cierre',
+    'commission': 'comision', 'comision': 'comision',
+    'swap': 'swap',
+    'profit': 'profit', 'beneficio': 'profit', 'pnl': 'profit',
+    'resultado': 'resultado', 'timeframe': 'timeframe',
+    # Tablas que no son operaciones cerradas (libro de deals, órdenes): se ignoran
+    'balance': 'ignorar', 'state': 'ignorar', 'estado': 'ignorar',
+}
+SEGUNDA_APARICION = {'fecha': 'fecha_cierre', 'precio_entrada': 'precio_cierre'}
+
+TIPOS_LARGO = {'buy', 'compra', 'long', 'largo'}
+TIPOS_CORTO = {'sell', 'venta', 'short', 'corto'}
+
+FORMATOS_FECHA = ['%Y.%m.%d %H:%M:%S', '%Y.%m.%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M',
+                  '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y.%m.%d', '%Y-%m-%d', '%d/%m/%Y']
+
+# ========== LECTURA EN STREAMING ==========
+class _LectorContado(io.RawIOBase):
+    """Envuelve un fichero binario contando los bytes leídos (para el progreso)"""
+
+    def __init__(self, fichero):
+        self.fichero = fichero
+        self.leidos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        datos = self.fichero.read(len(buffer))
+        buffer[:len(datos)] = datos
+        self.leidos += len(datos)
+        return len(datos)
+
+class _FilasHTML(HTMLParser):
+    """Extrae las filas de las tablas de un informe HTML conservando solo la fila en curso"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.filas = []
+        self._fila = None
+        self._celda = None
+        self._relleno = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._fila = []
+        elif tag in ('td', 'th') and self._fila is not None:
+            self._celda = []
+            # colspan desplaza las columnas siguientes: se rellena con celdas vacías
+            colspan = dict(attrs).get('colspan')
+            self._relleno = int(colspan) - 1 if colspan and colspan.isdigit() else 0
+
+    def handle_data(self, datos):
+        if self._celda is not None:
+            self._celda.append(datos)
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th') and self._celda is not None:
+            self._fila.append(' '.join(''.join(self._celda).split()))
+            self._fila.extend([''] * self._relleno)
+            self._celda = None
+        elif tag == 'tr' and self._fila is not None:
+            self.filas.append(self._fila)
+            self._fila = None
+
+def _codificacion(inicio):
+    """MT5 exporta en UTF-16 con BOM; el resto de extractos suele venir en UTF-8"""
+    if inicio.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    return 'utf-8-sig'
+
+def _filas_csv(lector):
+    binario = io.BufferedReader(lector, buffer_size=TAMANO_BLOQUE)
+    inicio = binario.peek(4096)
+    codificacion = _codificacion(inicio)
+    texto = io.TextIOWrapper(binario, encoding=codificacion, errors='replace', newline='')
+    try:
+        muestra = inicio.decode(codificacion, errors='ignore')
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    yield from csv.reader(texto, dialecto)
+
+def _filas_html(lector):
+    parser = _FilasHTML()
+    decodificador = None
+    while True:
+        bloque = lector.read(TAMANO_BLOQUE)
+        if not bloque:
+            break
+        if decodificador is None:
+            decodificador = codecs.getincrementaldecoder(_codificacion(bloque))(errors='replace')
+        parser.feed(decodificador.decode(bloque))
+        yield from parser.filas
+        parser.filas.clear()
+    parser.close()
+    yield from parser.filas
+
+# ========== NORMALIZACIÓN ==========
+def _normalizar_cabecera(texto):
+    return re.sub(r'[^a-z]', '', texto.lower().replace('ó', 'o').replace('í', 'i'))
+
+def detectar_columnas(fila):
+    """Índice de cada campo interno si la fila es una cabecera reconocible; None en otro caso"""
+    columnas = {}
+    for indice, celda in enumerate(fila):
+        campo = ALIAS_COLUMNAS.get(_normalizar_cabecera(celda))
+        if campo is None:
+            continue
+        if campo in columnas:
+            campo = SEGUNDA_APARICION.get(campo)
+            if campo is None or campo in columnas:
+                continue
+        columnas[campo] = indice
+    if {'activo', 'tipo', 'precio_entrada'} <= columnas.keys():
+        # Un dict vacío marca una tabla reconocida pero no importable
+        return {} if 'ignorar' in columnas else columnas
+    return None
+
+def _numero(texto):
+    """'1,234.56', '1.234,56', '1 234,56' y '0,5' -> float; el último separador es el decimal"""
+    texto = (texto or '').replace(' ', '').replace('\xa0', '')
+    decimal = max(('.', ','), key=texto.rfind)
+    miles = ',' if decimal == '.' else '.'
+    if texto.count(decimal) > 1:
+        # '1.234.567' o '1,234,567': separador repetido, solo puede ser de miles
+        miles, decimal = decimal, None
+    texto = texto.replace(miles, '')
+    if decimal:
+        texto = texto.replace(decimal, '.')
+    try:
+        return float(texto)
+    except ValueError:
+        return None
+
+# Formato habitual de MT4/MT5 y de la mayoría de brokers, sin pasar por strptime
+PATRON_FECHA = re.compile(r'^(\d{4})[.\-/](\d{2})[.\-/](\d{2})(?:[ T](\d{2}):(\d{2})(?::(\d{2}))?)?$')
+
+def fecha_iso(fecha):
+    """'fecha' de una operación: ISO 8601 con microsegundos y sin zona, igual en el formulario y en la importación"""
+    return fecha.replace(tzinfo=None).isoformat(timespec='microseconds')
+
+def _fecha(texto):
+    texto = (texto or '').strip()
+    if not texto:
+        return None
+    coincidencia = PATRON_FECHA.match(texto)
+    if coincidencia:
+        try:
+            return fecha_iso(datetime(*(int(parte or 0) for parte in coincidencia.groups())))
+        except ValueError:
+            return None
+    for formato in FORMATOS_FECHA:
+        try:
+            return fecha_iso(datetime.strptime(texto, formato))
+        except ValueError:
+            continue
+    try:
+        return fecha_iso(datetime.fromisoformat(texto))
+    except ValueError:
+        return None
+
+def convertir_fila(fila, columnas):
+    """Fila del extracto -> operación con el esquema de 'operaciones'; None si no es una operación"""
+    def celda(campo):
+        indice = columnas.get(campo)
+        return fila[indice].strip() if indice is not None and indice < len(fila) else ''
+
+    tipo = celda('tipo').lower()
+    if tipo in TIPOS_LARGO:
+        direccion = 'Largo'
+    elif tipo in TIPOS_CORTO:
+        direccion = 'Corto'
+    else:
+        return None  # balance, depósitos, órdenes limitadas o stop...
+
+    precio_entrada = _numero(celda('precio_entrada'))
+    fecha = _fecha(celda('fecha'))
+    activo = celda('activo').upper()
+    if precio_entrada is None or fecha is None or not activo:
+        return None
+
+    profit = _numero(celda('profit'))
+    neto = (profit or 0.0) + (_numero(celda('comision')) or 0.0) + (_numero(celda('swap')) or 0.0)
+    operacion = {
+        'fecha': fecha,
+        'activo': activo,
+        'timeframe': celda('timeframe') or TIMEFRAME_IMPORTADO,
+        'tipo': direccion,
+        'precio_entrada': precio_entrada,
+        'stop_loss': _numero(celda('stop_loss')) or 0.0,
+        'take_profit': _numero(celda('take_profit')) or 0.0,
+        'resultado': celda('resultado') if celda('resultado') in ('Ganadora', 'Perdedora')
+                     else ('Ganadora' if neto > 0 else 'Perdedora'),
+        'resumen': '',
+        'leccion_aprendida': '',
+        'emocion_antes': EMOCION_IMPORTADA,
+        'emocion_durante': EMOCION_IMPORTADA,
+        'emocion_despues': EMOCION_IMPORTADA,
+        'origen': 'importacion',
+    }
+    opcionales = {
+        'ticket': celda('ticket') or None,
+        'volumen': _numero(celda('volumen')),
+        'precio_cierre': _numero(celda('precio_cierre')),
+        'fecha_cierre': _fecha(celda('fecha_cierre')),
+        'profit_real': round(neto, 2) if profit is not None else None,
+    }
+    operacion.update({k: v for k, v in opcionales.items() if v is not None})
+    return operacion
+
+def _fecha_clave(fecha):
+    # Los IDs se calcularon con isoformat() sin microsegundos a 0: reimportar no debe duplicar
+    fecha = str(fecha or '')
+    return fecha[:-len('.000000')] if fecha.endswith('.000000') else fecha
+
+def id_operacion(operacion):
+    """ID determinista: el ticket del broker o, si no hay, los datos que identifican la operación"""
+    if operacion.get('ticket'):
+        base = f"ticket|{operacion['activo']}|{operacion['ticket']}"
+    else:
+        campos = {**operacion, 'fecha': _fecha_clave(operacion.get('fecha'))}
+        base = '|'.join(str(campos.get(c, '')) for c in ('fecha', 'activo', 'tipo', 'precio_entrada', 'volumen'))
+    return 'imp_' + hashlib.sha1(base.encode('utf-8')).hexdigest()[:24]
+
+# ========== IMPORTACIÓN ==========
+def _escribir_lote(user_id, lote):
+    """Escribe las operaciones del lote que aún no existen; devuelve cuántas se escribieron"""
+    operaciones_ref = db.collection('users').document(user_id).collection('operaciones')
+    referencias = [operaciones_ref.document(doc_id) for doc_id, _ in lote]
+    existentes = {snapshot.id for snapshot in db.get_all(referencias) if snapshot.exists}
+    batch = db.batch()
+    escritas = 0
+    for referencia, (doc_id, operacion) in zip(referencias, lote):
+        if doc_id in existentes:
+            continue
+        batch.set(referencia, {**operacion, 'timestamp': firestore.SERVER_TIMESTAMP})
+        escritas += 1
+    if escritas:
+        batch.commit()
+    return escritas
+
+def importar_operaciones(user_id, fichero, nombre, tamano_total=None, progreso=None, riesgo_monetario=None,
+                         plan_compilado=None, operaciones_existentes=None):
+    """Importa un extracto CSV o HTML fila a fila, en lotes de TAMANO_LOTE escrituras
+
+    Memoria acotada: solo se mantiene el lote en curso y el conjunto de IDs vistos.
+    Las operaciones ya existentes (mismo ID determinista) se omiten, así que reimportar
+    el mismo extracto no crea duplicados. `progreso(fraccion, resumen)` se llama cada
+    INTERVALO_PROGRESO filas. El P&L de cada operación se calcula con calculo_pl y
+    `riesgo_monetario` y, con `plan_compilado`, su cumplimiento del plan: el límite diario
+    cuenta las `operaciones_existentes` anteriores del mismo día y las nuevas del propio
+    extracto en el orden en que aparecen. Devuelve el resumen final.
+    """
+    lector = _LectorContado(fichero)
+    es_html = nombre.lower().endswith(('.htm', '.html'))
+    filas = _filas_html(lector) if es_html else _filas_csv(lector)
+
+    resumen = {'filas': 0, 'importadas': 0, 'duplicadas': 0, 'descartadas': 0}
+    columnas, lote, vistos = None, [], set()
+    por_dia = Counter()
+    # Operaciones ya guardadas (manuales o de importaciones anteriores) por día, en orden cronológico
+    ids_existentes = {op.get('id') for op in operaciones_existentes or []}
+    fechas_existentes = defaultdict(list)
+    for op in operaciones_existentes or []:
+        fechas_existentes[str(op.get('fecha', ''))[:10]].append(str(op.get('fecha', '')))
+    for fechas in fechas_existentes.values():
+        fechas.sort()
+
+    def _volcar():
+        escritas = _escribir_lote(user_id, lote)
+        resumen['importadas'] += escritas
+        resumen['duplicadas'] += len(lote) - escritas
+        lote.clear()
+
+    for fila in filas:
+        resumen['filas'] += 1
+        cabecera = detectar_columnas(fila)
+        if cabecera is not None:
+            columnas = cabecera
+            continue
+        operacion = convertir_fila(fila, columnas) if columnas else None
+        if operacion is None:
+            resumen['descartadas'] += 1
+        else:
+            doc_id = id_operacion(operacion)
+            if doc_id in vistos:
+                resumen['duplicadas'] += 1
+            else:
+                vistos.add(doc_id)
+                operacion.update(calcular_pl_operacion(operacion, riesgo_monetario))
+                if plan_compilado:
+                    dia = str(operacion.get('fecha', ''))[:10]
+                    previas = bisect.bisect_left(fechas_existentes[dia], str(operacion['fecha'])) + por_dia[dia]
+                    operacion.update(plan_compilado.evaluar(operacion, previas))
+                    if doc_id not in ids_existentes:
+                        # Una reimportada ya cuenta entre las existentes
+                        por_dia[dia] += 1
+                lote.append((doc_id, operacion))
+                if len(lote) >= TAMANO_LOTE:
+                    _volcar()
+        if progreso and resumen['filas'] % INTERVALO_PROGRESO == 0:
+            progreso(min(1.0, lector.leidos / tamano_total) if tamano_total else 0.0, resumen)
+
+    if lote:
+        _volcar()
+    if resumen['importadas']:
+        # Los agregados incrementales ya no cuadran: se eliminan y el dashboard los reconstruye
+        agregados_ref(user_id).delete()
+        invalidar_documento('agregados', user_id)
+        notificar_escritura(user_id)
+    if progreso:
+        progreso(1.0, resumen)
+    return resumen
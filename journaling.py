@@ -2,31 +2,28 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import openai
-from datetime import datetime
+from datetime import datetime, timedelta
 import base64
 import binascii
 from firebase_config import db
-import os
+from sincronizacion_operaciones import obtener_operaciones, registrar_eliminacion, notificar_escritura
+from almacen_imagenes import cargar_imagen
+from procesamiento_imagenes import encolar_imagen
+from metricas_incrementales import leer_agregados, registrar_en_transaccion
+from cache_usuario import invalidar_documento
+from analitica import calcular_kpis, extremos_grupo
+from trabajos_ia import obtener_analisis, calcular_huella, reintentar_analisis
+from cliente_llm import completar
+from importador_operaciones import importar_operaciones, fecha_iso, TIMEFRAME_IMPORTADO
+from calculo_pl import calcular_pl_operacion, riesgo_monetario_plan, parsear_salidas
+from estrategia_maestra import cargar_plan_trading
+from trazas import trazar
+from cumplimiento_plan import obtener_plan_compilado, operaciones_previas_dia
 import firebase_admin
 from firebase_admin import credentials, firestore
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# Cargar variables de entorno desde .env
-load_dotenv()
-
-# Configuración segura de API key (debes configurarla como variable de entorno)
-openai.api_key = st.secrets.get("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY"))
-
-# Obtener API Key desde .env o secrets
-api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-
-if not api_key:
-    raise ValueError("⚠️ No se encontró la API key. Define OPENAI_API_KEY en tu .env o en secrets.toml")
-
-# Inicializa el cliente de OpenAI
-client = OpenAI(api_key=api_key)
+# Las operaciones importadas llevan TIMEFRAME_IMPORTADO: el historial debe poder filtrarlas
+TIMEFRAMES = ["1m", "5m", "15m", "30m", "1H", "4H", "1D", TIMEFRAME_IMPORTADO]
 
 # Initialize Firebase app if not already initialized
 if not firebase_admin._apps:
@@ -34,26 +31,62 @@ if not firebase_admin._apps:
     firebase_admin.initialize_app(cred)
 
 # ========== FUNCIONES MEJORADAS DE FIREBASE ==========
-def guardar_operacion_firebase(user_id, operacion):
-    """Guarda operación en Firestore con estructura mejorada"""
+def guardar_operacion_firebase(user_id, operacion, operacion_id=None):
+    """Guarda operación en Firestore con estructura mejorada (actualiza si se indica operacion_id)"""
     try:
-        # Convertir imagen a string si está presente
-        if "imagen" in operacion and operacion["imagen"]:
-            if hasattr(operacion["imagen"], 'read'):  # Es un file uploader
-                operacion["imagen"] = base64.b64encode(operacion["imagen"].read()).decode('utf-8')
-            elif isinstance(operacion["imagen"], bytes):
-                operacion["imagen"] = base64.b64encode(operacion["imagen"]).decode('utf-8')
+        # La imagen se procesa en segundo plano; en la operación solo quedan referencias y una miniatura
+        imagen = operacion.pop("imagen", None)
+        datos_imagen, tipo_contenido = None, "image/png"
+        if imagen:
+            if hasattr(imagen, 'read'):  # Es un file uploader
+                datos_imagen = imagen.read()
+                tipo_contenido = getattr(imagen, 'type', None) or tipo_contenido
+            elif isinstance(imagen, bytes):
+                datos_imagen = imagen
+        if datos_imagen:
+            operacion["imagen_estado"] = "procesando"
         
         # Asegurar campos numéricos
         for field in ["precio_entrada", "stop_loss", "take_profit"]:
             if field in operacion:
                 operacion[field] = float(operacion[field])
+        plan = cargar_plan_trading(user_id)
+        riesgo_plan = riesgo_monetario_plan(plan)
+        plan_compilado = obtener_plan_compilado(user_id, plan)
+        previas_dia = 0
+        if plan_compilado:
+            previas_dia = operaciones_previas_dia(obtener_operaciones(user_id), operacion, operacion_id)
         
-        # Guardar con timestamp
+        # Guardar con timestamp (también en ediciones, para que la sincronización incremental las detecte)
         operacion["timestamp"] = firestore.SERVER_TIMESTAMP
         
-        doc_ref = db.collection('users').document(user_id).collection('operaciones').document()
-        doc_ref.set(operacion)
+        operaciones_ref = db.collection('users').document(user_id).collection('operaciones')
+        doc_ref = operaciones_ref.document(operacion_id) if operacion_id else operaciones_ref.document()
+        
+        # Operación y agregados del dashboard se escriben en la misma transacción
+        @firestore.transactional
+        def _guardar(transaccion):
+            anterior = None
+            if operacion_id:
+                snapshot = doc_ref.get(transaction=transaccion)
+                anterior = snapshot.to_dict() if snapshot.exists else None
+            agregados = leer_agregados(user_id, transaccion)
+            
+            # P&L calculado una sola vez y guardado; una edición mantiene el riesgo con el que se abrió
+            riesgo = (anterior or {}).get('riesgo_monetario') or riesgo_plan
+            operacion.update(calcular_pl_operacion({**(anterior or {}), **operacion}, riesgo))
+            # Cumplimiento del plan vigente, guardado en la operación para agregarlo sin reescanear
+            if plan_compilado:
+                operacion.update(plan_compilado.evaluar({**(anterior or {}), **operacion}, previas_dia))
+            # En una edición sin nueva captura se conserva la imagen existente (merge)
+            transaccion.set(doc_ref, operacion, merge=bool(operacion_id))
+            registrar_en_transaccion(transaccion, user_id, agregados, anterior, {**(anterior or {}), **operacion})
+        
+        _guardar(db.transaction())
+        invalidar_documento('agregados', user_id)
+        if datos_imagen:
+            encolar_imagen(user_id, doc_ref.id, datos_imagen, tipo_contenido)
+        notificar_escritura(user_id)
         st.success("Operación guardada en la nube ✅")
         return True
     except Exception as e:
@@ -61,14 +94,10 @@ def guardar_operacion_firebase(user_id, operacion):
         return False
 
 def cargar_operaciones_firebase(user_id):
-    """Carga operaciones con mejor manejo de errores"""
+    """Carga operaciones desde el almacén local sincronizado de forma incremental"""
     try:
         operaciones = []
-        docs = db.collection('users').document(user_id).collection('operaciones').order_by('timestamp', direction='DESCENDING').stream()
-        
-        for doc in docs:
-            operacion = doc.to_dict()
-            operacion["id"] = doc.id
+        for operacion in obtener_operaciones(user_id):
             # Asegurar tipos de datos
             for field in ["precio_entrada", "stop_loss", "take_profit"]:
                 if field in operacion:
@@ -83,14 +112,63 @@ def cargar_operaciones_firebase(user_id):
 def eliminar_operacion_firebase(user_id, operacion_id):
     """Elimina una operación de Firestore por su ID"""
     try:
-        doc_ref = firestore.client().collection("usuarios").document(user_id).collection("operaciones").document(operacion_id)
-        doc_ref.delete()
+        doc_ref = db.collection('users').document(user_id).collection('operaciones').document(operacion_id)
+        
+        @firestore.transactional
+        def _eliminar(transaccion):
+            snapshot = doc_ref.get(transaction=transaccion)
+            agregados = leer_agregados(user_id, transaccion)
+            registrar_eliminacion(user_id, operacion_id, transaccion)
+            if snapshot.exists:
+                registrar_en_transaccion(transaccion, user_id, agregados, anterior=snapshot.to_dict())
+        
+        _eliminar(db.transaction())
+        notificar_escritura(user_id)
+        invalidar_documento('agregados', user_id)
         return True
     except Exception as e:
         # Puedes registrar el error si lo deseas
         return False
 
+TAMANO_PAGINA = 20
+
+def cargar_pagina_operaciones(user_id, filtros, cursor=None, tamano=TAMANO_PAGINA):
+    """Carga una página del historial filtrado en el servidor, paginando con start_after"""
+    try:
+        consulta = db.collection('users').document(user_id).collection('operaciones')
+        for campo in ["activo", "timeframe", "resultado"]:
+            if filtros.get(campo):
+                consulta = consulta.where(campo, '==', filtros[campo])
+        # 'fecha' es ISO 8601, así que el orden lexicográfico coincide con el cronológico
+        if filtros.get("desde"):
+            consulta = consulta.where('fecha', '>=', filtros["desde"].isoformat())
+        if filtros.get("hasta"):
+            consulta = consulta.where('fecha', '<', (filtros["hasta"] + timedelta(days=1)).isoformat())
+        consulta = consulta.order_by('fecha', direction='DESCENDING')
+        if cursor is not None:
+            consulta = consulta.start_after(cursor)
+        
+        # Se pide un documento extra solo para saber si hay página siguiente
+        docs = list(consulta.limit(tamano + 1).stream())
+        hay_mas = len(docs) > tamano
+        docs = docs[:tamano]
+        
+        operaciones = []
+        for doc in docs:
+            operacion = doc.to_dict()
+            operacion["id"] = doc.id
+            for field in ["precio_entrada", "stop_loss", "take_profit"]:
+                if field in operacion:
+                    operacion[field] = float(operacion[field])
+            operaciones.append(operacion)
+        
+        return operaciones, (docs[-1] if docs else None), hay_mas
+    except Exception as e:
+        st.error(f"Error al cargar historial: {str(e)}")
+        return [], None, False
+
 # ========== ANÁLISIS MEJORADO CON IA ==========
+@trazar('dataframe')
 def analizar_operaciones_avanzado(operaciones):
     """Análisis más completo de las operaciones"""
     if not operaciones:
@@ -99,26 +177,22 @@ def analizar_operaciones_avanzado(operaciones):
     try:
         df = pd.DataFrame(operaciones)
         
-        # Calcular métricas básicas
-        total_ops = len(df)
-        ganadoras = len(df[df["resultado"] == "Ganadora"])
-        perdedoras = total_ops - ganadoras
-        win_rate = (ganadoras / total_ops * 100) if total_ops > 0 else 0
+        # Todas las métricas en una sola pasada vectorizada
+        kpis = calcular_kpis(df)
+        ganadoras = kpis["ganadoras"]
+        perdedoras = kpis["perdedoras"]
+        mejor_activo, peor_activo = extremos_grupo(kpis, "activo", "resultado_sum")
+        mejor_timeframe, _ = extremos_grupo(kpis, "timeframe", "resultado_sum")
         
-        # Calcular profit factor y otras métricas
-        if "resultado_num" not in df.columns:
-            df["resultado_num"] = df["resultado"].apply(lambda x: 1 if x == "Ganadora" else -1)
-        
-        # Métricas adicionales
         analisis = {
-            "operaciones_totales": total_ops,
+            "operaciones_totales": kpis["total"],
             "operaciones_ganadoras": ganadoras,
             "operaciones_perdedoras": perdedoras,
-            "win_rate": round(win_rate, 2),
+            "win_rate": kpis["win_rate"],
             "ratio_ganancia_perdida": ganadoras / perdedoras if perdedoras > 0 else float('inf'),
-            "mejor_activo": df.groupby("activo")["resultado_num"].sum().idxmax() if not df.empty else "N/A",
-            "peor_activo": df.groupby("activo")["resultado_num"].sum().idxmin() if not df.empty else "N/A",
-            "mejor_timeframe": df.groupby("timeframe")["resultado_num"].sum().idxmax() if not df.empty else "N/A",
+            "mejor_activo": mejor_activo if mejor_activo is not None else "N/A",
+            "peor_activo": peor_activo if peor_activo is not None else "N/A",
+            "mejor_timeframe": mejor_timeframe if mejor_timeframe is not None else "N/A",
         }
         
         return analisis
@@ -127,17 +201,12 @@ def analizar_operaciones_avanzado(operaciones):
         st.error(f"Error en análisis avanzado: {str(e)}")
         return None
 
-def generar_retroalimentacion_avanzada(operaciones, analisis):
-    """Genera retroalimentación más detallada con IA"""
-    if not operaciones or not analisis:
-        return "No hay suficientes datos para análisis."
+def construir_prompt_retroalimentacion(operaciones, analisis):
+    """Construye el prompt de retroalimentación con las métricas y las últimas operaciones"""
+    resumen_ops = "\n".join([f"{op.get('fecha', '')} - {op.get('activo', '')} - {op.get('resultado', '')} - {op.get('resumen', '')}" 
+                           for op in operaciones[:10]])  # Limitar a 10 operaciones
     
-    try:
-        # Preparar resumen para IA
-        resumen_ops = "\n".join([f"{op.get('fecha', '')} - {op.get('activo', '')} - {op.get('resultado', '')} - {op.get('resumen', '')}" 
-                               for op in operaciones[:10]])  # Limitar a 10 operaciones
-        
-        prompt = f"""
+    return f"""
         Como mentor experto en trading, analiza estas operaciones y métricas:
         
         MÉTRICAS:
@@ -161,19 +230,22 @@ def generar_retroalimentacion_avanzada(operaciones, analisis):
         
         Responde en español con un tono profesional pero cercano.
         """
-        
-        respuesta = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Eres un mentor de trading profesional con expertise en psicología del trading"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=800
-        )
-        
-        return respuesta.choices[0].message.content
+
+def consultar_retroalimentacion(prompt):
+    """Llama al modelo con el prompt de retroalimentación (lanza excepción si falla)"""
+    mensajes = [
+        {"role": "system", "content": "Eres un mentor de trading profesional con expertise en psicología del trading"},
+        {"role": "user", "content": prompt}
+    ]
+    return completar(mensajes, temperature=0.7, max_tokens=800)
+
+def generar_retroalimentacion_avanzada(operaciones, analisis):
+    """Genera retroalimentación más detallada con IA (llamada síncrona)"""
+    if not operaciones or not analisis:
+        return "No hay suficientes datos para análisis."
     
+    try:
+        return consultar_retroalimentacion(construir_prompt_retroalimentacion(operaciones, analisis))
     except Exception as e:
         return f"Error al generar retroalimentación: {str(e)}"
 
@@ -184,6 +256,7 @@ def formulario_operacion_mejorado(operacion=None):
         "activo": "", "timeframe": "15m", "zona_interes": "",
         "precio_entrada": 0.0, "stop_loss": 0.0, "take_profit": 0.0,
         "resultado": "Ganadora", "resumen": "", "tipo": "Largo",  # 👈 Cambié "Compra" por "Largo"
+        "precio_cierre": 0.0, "comision": 0.0, "salidas": [],
         "emocion_antes": "Neutral", "emocion_durante": "Neutral", 
         "emocion_despues": "Neutral", "leccion_aprendida": ""
     }
@@ -198,8 +271,8 @@ def formulario_operacion_mejorado(operacion=None):
         
         col1, col2 = st.columns(2)
         activo = col1.text_input("Par (Ej: EUR/USD)", value=valores_default["activo"]).upper()
-        timeframe = col2.selectbox("Timeframe", ["1m", "5m", "15m", "30m", "1H", "4H", "1D"], 
-                                 index=["1m", "5m", "15m", "30m", "1H", "4H", "1D"].index(valores_default["timeframe"]))
+        timeframe = col2.selectbox("Timeframe", TIMEFRAMES,
+                                 index=TIMEFRAMES.index(valores_default["timeframe"]) if valores_default["timeframe"] in TIMEFRAMES else 0)
         
         col3, col4, col5 = st.columns(3)
         precio_entrada = col3.number_input("Precio Entrada", value=valores_default["precio_entrada"], format="%.5f")
@@ -212,6 +285,18 @@ def formulario_operacion_mejorado(operacion=None):
         tipo = col7.selectbox("Dirección", ["Largo", "Corto"], 
                             index=["Largo", "Corto"].index(valores_default["tipo"]))  # 👈 ahora siempre será válido
         
+        with st.expander("⚙️ Ejecución real (opcional)"):
+            col8, col9 = st.columns(2)
+            precio_cierre = col8.number_input("Precio de salida (0 = TP/SL según resultado)",
+                                              value=float(valores_default["precio_cierre"] or 0.0), format="%.5f")
+            comision = col9.number_input("Comisiones ($)", value=float(valores_default["comision"] or 0.0),
+                                         min_value=0.0, format="%.2f")
+            salidas_texto = st.text_input(
+                "Salidas parciales (precio:% separadas por comas)",
+                value=", ".join(f"{s['precio']}:{s['fraccion'] * 100:g}" for s in valores_default["salidas"] or []),
+                placeholder="Ej: 1.10500:50, 1.11000:25 (el resto sale en el precio de salida)"
+            )
+        
         # Campos emocionales nuevos
         st.subheader("🧠 Estado Emocional")
         emocion_cols = st.columns(3)
@@ -238,9 +323,14 @@ def formulario_operacion_mejorado(operacion=None):
             if not activo:
                 st.error("Debes especificar un par de trading")
                 return None
+            try:
+                salidas = parsear_salidas(salidas_texto)
+            except ValueError as e:
+                st.error(f"Salidas parciales no válidas: {str(e)}")
+                return None
                 
             nueva_operacion = {
-                "fecha": datetime.now().isoformat(),
+                "fecha": fecha_iso(datetime.now()),
                 "activo": activo,
                 "timeframe": timeframe,
                 "precio_entrada": precio_entrada,
@@ -248,6 +338,9 @@ def formulario_operacion_mejorado(operacion=None):
                 "take_profit": tp,
                 "resultado": resultado,
                 "tipo": tipo,
+                "precio_cierre": precio_cierre if precio_cierre > 0 else None,
+                "comision": comision,
+                "salidas": salidas,
                 "resumen": resumen,
                 "leccion_aprendida": leccion_aprendida,
                 "emocion_antes": emocion_antes,
@@ -261,7 +354,7 @@ def formulario_operacion_mejorado(operacion=None):
     return None
 
 # ========== DASHBOARD INTEGRADO ==========
-def mostrar_dashboard(operaciones):
+def mostrar_dashboard(operaciones, user_id=None):
     """Muestra dashboard con métricas y gráficos"""
     if not operaciones:
         st.info("Agrega operaciones para ver tu dashboard")
@@ -293,7 +386,7 @@ def mostrar_dashboard(operaciones):
         
         # Gráfico de evolución temporal
         if not df.empty and 'fecha' in df.columns:
-            df['fecha_dt'] = pd.to_datetime(df['fecha'])
+            df['fecha_dt'] = pd.to_datetime(df['fecha'], format='ISO8601')
             df_fechas = df.groupby([df['fecha_dt'].dt.date, 'resultado']).size().unstack(fill_value=0)
             df_fechas['total'] = df_fechas.sum(axis=1)
             fig_evolucion = px.line(df_fechas, y='total', title='Operaciones por Día')
@@ -304,9 +397,27 @@ def mostrar_dashboard(operaciones):
     
     # Retroalimentación IA
     st.subheader("🧠 Retroalimentación Inteligente")
-    retro = generar_retroalimentacion_avanzada(operaciones, analisis)
-    st.markdown(f"<div style='background-color:#2E2E2E; padding:15px; border-radius:10px;'>{retro}</div>", 
-                unsafe_allow_html=True)
+    if user_id is None:
+        retro = generar_retroalimentacion_avanzada(operaciones, analisis)
+        st.markdown(f"<div style='background-color:#2E2E2E; padding:15px; border-radius:10px;'>{retro}</div>", 
+                    unsafe_allow_html=True)
+        return
+    
+    # Se muestra al instante la última retroalimentación; se regenera en segundo plano si cambian los datos
+    prompt = construir_prompt_retroalimentacion(operaciones, analisis)
+    retro = obtener_analisis(user_id, 'journaling', calcular_huella(prompt), lambda: consultar_retroalimentacion(prompt))
+    if retro['texto']:
+        st.markdown(f"<div style='background-color:#2E2E2E; padding:15px; border-radius:10px;'>{retro['texto']}</div>", 
+                    unsafe_allow_html=True)
+    if retro['estado'] == 'actualizando':
+        st.caption("🔄 Actualizando la retroalimentación en segundo plano...")
+        if st.button("Ver retroalimentación actualizada", key="refrescar_retro"):
+            st.rerun()
+    if retro['error']:
+        st.warning(f"No se pudo actualizar la retroalimentación: {retro['error']}")
+        if st.button("Reintentar", key="reintentar_retro"):
+            reintentar_analisis(user_id, 'journaling')
+            st.rerun()
 
 # ========== INTERFAZ PRINCIPAL MEJORADA ==========
 def mostrar_journaling_inteligente():
@@ -328,13 +439,18 @@ def mostrar_journaling_inteligente():
         operaciones = cargar_operaciones_firebase(user_id)
     
     # Pestañas para organización
-    tab1, tab2, tab3 = st.tabs(["➕ Nueva Operación", "📋 Historial", "📊 Dashboard"])
+    tab1, tab2, tab3, tab4 = st.tabs(["➕ Nueva Operación", "📋 Historial", "📊 Dashboard", "📥 Importar"])
     
     with tab1:
         st.header("Registrar Nueva Operación")
-        nueva_op = formulario_operacion_mejorado(st.session_state.editar_operacion)
+        operacion_editada = st.session_state.editar_operacion
+        nueva_op = formulario_operacion_mejorado(operacion_editada)
         if nueva_op:
-            if guardar_operacion_firebase(user_id, nueva_op):
+            operacion_id = None
+            if operacion_editada:
+                operacion_id = operacion_editada['id']
+                nueva_op['fecha'] = operacion_editada.get('fecha', nueva_op['fecha'])
+            if guardar_operacion_firebase(user_id, nueva_op, operacion_id):
                 st.session_state.editar_operacion = None
                 st.rerun()
     
@@ -343,33 +459,127 @@ def mostrar_journaling_inteligente():
         if not operaciones:
             st.info("No hay operaciones registradas aún")
         else:
-            for operacion in operaciones:
-                with st.expander(f"{operacion.get('activo', 'N/A')} - {operacion.get('timeframe', 'N/A')} ({operacion.get('resultado', 'N/A')})"):
-                    mostrar_operacion(operacion)
-                    col1, col2 = st.columns(2)
-                    if col1.button("✏️ Editar", key=f"edit_{operacion['id']}"):
-                        st.session_state.editar_operacion = operacion
-                        st.rerun()
-                    if col2.button("🗑️ Eliminar", key=f"del_{operacion['id']}"):
-                        if eliminar_operacion_firebase(user_id, operacion['id']):
-                            st.rerun()
+            mostrar_historial_paginado(user_id, operaciones)
     
     with tab3:
-        mostrar_dashboard(operaciones)
+        mostrar_dashboard(operaciones, user_id)
+    
+    with tab4:
+        mostrar_importador(user_id)
+
+def mostrar_importador(user_id):
+    """Importación masiva desde el extracto del broker (CSV) o el informe HTML de MT4/MT5"""
+    st.header("Importar Operaciones")
+    st.caption("Acepta extractos CSV del broker e informes HTML de MetaTrader 4/5. "
+               "Las operaciones ya importadas se detectan y no se duplican.")
+    archivo = st.file_uploader("Extracto de operaciones", type=["csv", "htm", "html"], key="importar_extracto")
+    if archivo is None or not st.button("📥 Importar operaciones", key="importar_boton"):
+        return
+    
+    barra = st.progress(0.0, text="Leyendo extracto...")
+    def _progreso(fraccion, resumen):
+        barra.progress(fraccion, text=f"{resumen['filas']:,} filas leídas • {resumen['importadas']:,} importadas")
+    
+    try:
+        plan = cargar_plan_trading(user_id)
+        resumen = importar_operaciones(user_id, archivo, archivo.name, archivo.size, _progreso,
+                                       riesgo_monetario_plan(plan), obtener_plan_compilado(user_id, plan),
+                                       obtener_operaciones(user_id))
+    except Exception as e:
+        st.error(f"Error al importar: {str(e)}")
+        return
+    if resumen['importadas']:
+        st.success(f"✅ {resumen['importadas']:,} operaciones importadas")
+    else:
+        st.warning("No se encontraron operaciones nuevas en el extracto")
+    st.caption(f"Duplicadas omitidas: {resumen['duplicadas']:,} • Filas descartadas: {resumen['descartadas']:,}")
+
+def mostrar_historial_paginado(user_id, operaciones):
+    """Historial con filtros y paginación en servidor: solo se consulta y renderiza una página"""
+    # Filtros
+    activos = sorted({op.get('activo') for op in operaciones if op.get('activo')})
+    fcols = st.columns(4)
+    activo = fcols[0].selectbox("Activo", ["Todos"] + activos, key="hist_activo")
+    timeframe = fcols[1].selectbox("Timeframe", ["Todos"] + TIMEFRAMES, key="hist_timeframe")
+    resultado = fcols[2].selectbox("Resultado", ["Todos", "Ganadora", "Perdedora"], key="hist_resultado")
+    rango = fcols[3].date_input("Rango de fechas", value=(), key="hist_rango")
+    
+    filtros = {
+        "activo": None if activo == "Todos" else activo,
+        "timeframe": None if timeframe == "Todos" else timeframe,
+        "resultado": None if resultado == "Todos" else resultado,
+        "desde": rango[0] if len(rango) > 0 else None,
+        "hasta": rango[1] if len(rango) > 1 else (rango[0] if len(rango) > 0 else None),
+    }
+    
+    # Si cambian los filtros se vuelve a la primera página
+    clave_filtros = tuple(sorted((k, str(v)) for k, v in filtros.items()))
+    if st.session_state.get("hist_filtros") != clave_filtros:
+        st.session_state.hist_filtros = clave_filtros
+        st.session_state.hist_cursores = [None]  # cursor de inicio de cada página visitada
+    
+    cursores = st.session_state.hist_cursores
+    pagina = len(cursores) - 1
+    pagina_ops, ultimo_doc, hay_mas = cargar_pagina_operaciones(user_id, filtros, cursores[-1])
+    
+    if not pagina_ops:
+        st.info("No hay operaciones que coincidan con los filtros")
+    
+    for operacion in pagina_ops:
+        with st.expander(f"{operacion.get('activo', 'N/A')} - {operacion.get('timeframe', 'N/A')} ({operacion.get('resultado', 'N/A')})"):
+            mostrar_operacion(operacion)
+            col1, col2 = st.columns(2)
+            if col1.button("✏️ Editar", key=f"edit_{operacion['id']}"):
+                st.session_state.editar_operacion = operacion
+                st.rerun()
+            if col2.button("🗑️ Eliminar", key=f"del_{operacion['id']}"):
+                if eliminar_operacion_firebase(user_id, operacion['id']):
+                    st.rerun()
+    
+    # Navegación
+    nav1, nav2, nav3 = st.columns([1, 2, 1])
+    if nav1.button("⬅️ Anterior", disabled=pagina == 0, key="hist_anterior"):
+        cursores.pop()
+        st.rerun()
+    nav2.caption(f"Página {pagina + 1}")
+    if nav3.button("Siguiente ➡️", disabled=not hay_mas, key="hist_siguiente"):
+        cursores.append(ultimo_doc)
+        st.rerun()
 
 # Función para mostrar operación (mejorada)
 def mostrar_operacion(operacion):
     """Muestra los detalles completos de una operación"""
     st.subheader(f"{operacion.get('activo', '')} - {operacion.get('timeframe', '')}")
     
-    # Mostrar imagen si existe
-    if "imagen" in operacion and operacion["imagen"]:
+    # Mostrar miniatura y cargar la imagen completa solo bajo demanda
+    if operacion.get("imagen_miniatura"):
+        try:
+            st.image(base64.b64decode(operacion["imagen_miniatura"]), caption="Gráfico del Trade")
+        except (binascii.Error, TypeError):
+            st.warning("Formato de miniatura inválido")
+    
+    if operacion.get("imagen_estado") == "procesando":
+        st.caption("⏳ Procesando la captura del gráfico...")
+    elif operacion.get("imagen_estado") == "error":
+        st.caption("⚠️ No se pudo procesar la captura del gráfico")
+    
+    tiene_imagen = operacion.get("imagen_ref") or operacion.get("imagen_original_ref") or operacion.get("imagen")
+    if tiene_imagen and st.checkbox("🖼️ Ver gráfico completo", key=f"img_{operacion.get('id', '')}"):
         try:
-            if isinstance(operacion["imagen"], str):
+            if operacion.get("imagen_ref"):
+                # La previsualización comprimida basta para el historial
+                imagen_bytes = cargar_imagen(operacion.get("imagen_preview_ref") or operacion["imagen_ref"])
+            elif operacion.get("imagen_original_ref"):
+                # El procesado falló: se muestra la subida original que se conservó
+                imagen_bytes = cargar_imagen(operacion["imagen_original_ref"])
+            else:
+                # Operaciones antiguas con la imagen en base64 dentro del documento
                 imagen_bytes = base64.b64decode(operacion["imagen"])
-                st.image(imagen_bytes, caption="Gráfico del Trade", use_container_width=True)
+            st.image(imagen_bytes, caption="Gráfico del Trade", use_container_width=True)
         except (binascii.Error, TypeError):
             st.warning("Formato de imagen inválido")
+        except Exception as e:
+            st.warning(f"No se pudo cargar la imagen: {str(e)}")
     
     # Detalles técnicos
     cols = st.columns(4)
@@ -377,6 +587,8 @@ def mostrar_operacion(operacion):
     cols[1].metric("SL", f"{operacion.get('stop_loss', 'N/A')}")
     cols[2].metric("TP", f"{operacion.get('take_profit', 'N/A')}")
     cols[3].metric("Resultado", operacion.get('resultado', 'N/A'))
+    if operacion.get('cumple_plan') is False:
+        st.warning(f"📏 Fuera del plan: {operacion.get('motivo_incumplimiento')}")
     
     # Emociones
     if any(key in operacion for key in ["emocion_antes", "emocion_durante", "emocion_despues"]):
@@ -0,0 +1,181 @@
+# metricas_incrementales.py - AGREGADOS PERSISTENTES DE KPIs ACTUALIZADOS EN O(1) POR OPERACIÓN
+import os
+from firebase_config import db
+from calculo_pl import pl_operacion
+
+# ========== CONFIGURACIÓN ==========
+CAMPOS_EMOCIONES = ['emocion_antes', 'emocion_durante', 'emocion_despues']
+VERSION_AGREGADOS = 5  # 2: P&L del motor (motor_pl); 3: cumplimiento del plan; 4: revisión; 5: VERSION_PL 2
+
+def agregados_ref(user_id):
+    return db.collection('users').document(user_id).collection('estadisticas').document('agregados')
+
+# ========== AGREGADOS ==========
+def nueva_revision():
+    return os.urandom(8).hex()
+
+def agregados_vacios():
+    return {
+        'version': VERSION_AGREGADOS,
+        # Cambia con cada escritura: versiona las cachés del dashboard sin leer el historial
+        'revision': nueva_revision(),
+        'total': 0,
+        'ganadoras': 0,
+        'profit_total': 0.0,
+        'profit_maximo': None,
+        'profit_minimo': None,
+        'equity': 0.0,
+        'equity_pico': None,  # como np.maximum.accumulate, el pico arranca en la primera operación
+        'max_drawdown': 0.0,
+        'ultima_fecha': '',
+        'activos': {},
+        'emociones': {campo: {} for campo in CAMPOS_EMOCIONES},
+        'cumplimiento': {},  # 'cumple' / 'incumple' / 'sin_evaluar'
+        'infracciones': {},  # código de regla incumplida
+        # Máximo/mínimo y drawdown dependen del orden completo de la curva: una baja o una
+        # inserción fuera de orden los invalida y el dashboard los recalcula desde el historial
+        'exacto': True,
+    }
+
+def _clave(valor):
+    return str(valor) if valor not in (None, '') else 'N/A'
+
+def _clave_cumplimiento(operacion):
+    if 'cumple_plan' not in operacion:
+        return 'sin_evaluar'
+    return 'cumple' if operacion['cumple_plan'] else 'incumple'
+
+def _sumar_bucket(buckets, clave, signo, ganadora, pl):
+    bucket = buckets.setdefault(clave, {'n': 0, 'ganadoras': 0, 'profit': 0.0})
+    bucket['n'] += signo
+    bucket['ganadoras'] += signo * ganadora
+    bucket['profit'] += signo * pl
+    if bucket['n'] <= 0:
+        buckets.pop(clave)
+
+def _acumular(agregados, operacion, signo):
+    """Suma (signo=1) o resta (signo=-1) una operación de contadores y buckets"""
+    pl = pl_operacion(operacion)
+    ganadora = 1 if operacion.get('resultado') == 'Ganadora' else 0
+
+    agregados['total'] += signo
+    agregados['ganadoras'] += signo * ganadora
+    agregados['profit_total'] += signo * pl
+
+    _sumar_bucket(agregados['activos'], _clave(operacion.get('activo')), signo, ganadora, pl)
+    _sumar_bucket(agregados['cumplimiento'], _clave_cumplimiento(operacion), signo, ganadora, pl)
+    for codigo in operacion.get('infracciones') or []:
+        _sumar_bucket(agregados['infracciones'], codigo, signo, ganadora, pl)
+
+    for campo in CAMPOS_EMOCIONES:
+        if campo not in operacion:
+            continue
+        emociones = agregados['emociones'].setdefault(campo, {})
+        bucket = emociones.setdefault(_clave(operacion.get(campo)), {'n': 0, 'ganadoras': 0})
+        bucket['n'] += signo
+        bucket['ganadoras'] += signo * ganadora
+        if bucket['n'] <= 0:
+            emociones.pop(_clave(operacion.get(campo)))
+    return pl
+
+def _avanzar_equity(agregados, pl):
+    agregados['equity'] += pl
+    if agregados['equity_pico'] is None:
+        agregados['equity_pico'] = agregados['equity']
+    agregados['equity_pico'] = max(agregados['equity_pico'], agregados['equity'])
+    agregados['max_drawdown'] = min(agregados['max_drawdown'], agregados['equity'] - agregados['equity_pico'])
+    agregados['profit_maximo'] = pl if agregados['profit_maximo'] is None else max(agregados['profit_maximo'], pl)
+    agregados['profit_minimo'] = pl if agregados['profit_minimo'] is None else min(agregados['profit_minimo'], pl)
+
+def actualizar_agregados(agregados, anterior=None, nueva=None):
+    """Aplica un alta (nueva), una baja (anterior) o una edición (ambas) sobre los agregados"""
+    pl_anterior = _acumular(agregados, anterior, -1) if anterior else None
+    pl_nuevo = _acumular(agregados, nueva, 1) if nueva else None
+
+    if anterior is None and nueva is not None:
+        fecha = str(nueva.get('fecha', ''))
+        if fecha < agregados.get('ultima_fecha', ''):
+            agregados['exacto'] = False
+        agregados['ultima_fecha'] = max(fecha, agregados.get('ultima_fecha', ''))
+        _avanzar_equity(agregados, pl_nuevo)
+    elif pl_anterior != pl_nuevo:
+        # Una baja o un cambio de P&L altera la curva en mitad del historial
+        agregados['equity'] += (pl_nuevo or 0.0) - pl_anterior
+        agregados['exacto'] = False
+    return agregados
+
+def reconstruir_agregados(operaciones):
+    """Construye los agregados desde cero a partir del historial completo (orden cronológico)"""
+    agregados = agregados_vacios()
+    for operacion in sorted(operaciones, key=lambda op: str(op.get('fecha', ''))):
+        actualizar_agregados(agregados, nueva=operacion)
+    agregados['exacto'] = True
+    return agregados
+
+# ========== PERSISTENCIA ==========
+def leer_agregados(user_id, transaccion=None):
+    """Lee el documento de agregados (None si aún no existe)"""
+    doc = agregados_ref(user_id).get(transaction=transaccion)
+    return doc.to_dict() if doc.exists else None
+
+def registrar_en_transaccion(transaccion, user_id, agregados, anterior=None, nueva=None):
+    """Escribe en la transacción los agregados actualizados; leer_agregados debe haberse llamado antes"""
+    # Sin documento previo no hay base fiable: el dashboard lo reconstruirá desde el historial
+    if agregados is None or agregados.get('version') != VERSION_AGREGADOS:
+        return
+    agregados = actualizar_agregados(agregados, anterior, nueva)
+    agregados['revision'] = nueva_revision()
+    transaccion.set(agregados_ref(user_id), agregados)
+
+def guardar_agregados(user_id, agregados):
+    agregados_ref(user_id).set(agregados)
+
+# ========== MÉTRICAS ==========
+def metricas_desde_agregados(agregados):
+    """Traduce los agregados al mismo diccionario que devuelve calcular_metricas_avanzadas"""
+    total = agregados['total']
+    if total <= 0:
+        return {}
+
+    ganadoras = agregados['ganadoras']
+    metricas = {
+        'total_operaciones': total,
+        'operaciones_ganadoras': ganadoras,
+        'operaciones_perdedoras': total - ganadoras,
+        'win_rate': round(ganadoras / total * 100, 2),
+        'profit_total': round(agregados['profit_total'], 2),
+        'profit_promedio': round(agregados['profit_total'] / total, 2),
+        'profit_maximo': round(agregados['profit_maximo'] or 0, 2),
+        'profit_minimo': round(agregados['profit_minimo'] or 0, 2),
+        'max_drawdown': round(agregados['max_drawdown'], 2),
+        'drawdown_actual': round(min(0.0, agregados['equity'] - (agregados['equity_pico'] or 0.0)), 2),
+    }
+
+    if agregados['activos']:
+        profit_activos = {activo: b['profit'] for activo, b in agregados['activos'].items()}
+        metricas['mejor_activo'] = max(profit_activos, key=profit_activos.get)
+        metricas['peor_activo'] = min(profit_activos, key=profit_activos.get)
+
+    for campo, buckets in agregados['emociones'].items():
+        if buckets:
+            # Media de resultado_num (+1/-1) en porcentaje, como en calcular_metricas_avanzadas
+            tasas = {emocion: (2 * b['ganadoras'] - b['n']) / b['n'] * 100 for emocion, b in buckets.items()}
+            metricas[f'mejor_emocion_{campo}'] = max(tasas, key=tasas.get)
+            metricas[f'peor_emocion_{campo}'] = min(tasas, key=tasas.get)
+
+    return metricas
+
+def resumen_cumplimiento(agregados):
+    """P&L, operaciones y win rate cumpliendo y sin cumplir el plan, y el impacto de cada regla"""
+    def _resumir(bucket):
+        n = bucket['n']
+        return {
+            'operaciones': n,
+            'profit_total': round(bucket['profit'], 2),
+            'profit_promedio': round(bucket['profit'] / n, 2) if n else 0.0,
+            'win_rate': round(bucket['ganadoras'] / n * 100, 2) if n else 0.0,
+        }
+    return {
+        'grupos': {clave: _resumir(b) for clave, b in (agregados or {}).get('cumplimiento', {}).items()},
+        'infracciones': {codigo: _resumir(b) for codigo, b in (agregados or {}).get('infracciones', {}).items()},
+    }
@@ -0,0 +1,154 @@
+# montecarlo.py - SIMULACIÓN MONTE CARLO DEL RIESGO DE RUINA SOBRE LA DISTRIBUCIÓN DE R-MÚLTIPLOS DEL USUARIO
+import math
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from trazas import trazar
+
+# ========== CONFIGURACIÓN ==========
+TRAYECTORIAS = 100_000
+BLOQUE_TRAYECTORIAS = 10_000        # trayectorias por bloque (memoria acotada: bloque x horizonte float32)
+MESES_HORIZONTE = 12
+MAX_OPERACIONES_HORIZONTE = 300    # acota la latencia (~0.5 s con 100k trayectorias); siempre cubre un mes
+UMBRAL_RUINA = 0.5                  # ruina = perder este porcentaje del capital inicial
+MIN_OPERACIONES = 10                # por debajo la distribución empírica no es representativa
+DIAS_HABILES_MES = 21
+SEMILLA = 20240601
+PERCENTILES_DRAWDOWN = [50, 90, 95, 99]
+PERCENTILES_BANDAS = [5, 25, 50, 75, 95]
+MUESTRA_BANDAS = 2_000              # trayectorias usadas para las bandas de equity del gráfico
+
+_pool = None
+_procesos_pool = 0
+_lock = threading.Lock()
+
+def _obtener_pool(procesos):
+    """Pool de procesos compartido, creado la primera vez que se pide paralelismo"""
+    global _pool, _procesos_pool
+    with _lock:
+        if _pool is None or _procesos_pool != procesos:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=procesos)
+            _procesos_pool = procesos
+        return _pool
+
+# ========== DATOS DE ENTRADA ==========
+def r_multiples(df):
+    """R-múltiplos de las operaciones de procesar_datos_operaciones; sin R se usa P&L / riesgo"""
+    if df is None or df.empty:
+        return np.empty(0)
+    r = pd.to_numeric(df['r_multiple'], errors='coerce') if 'r_multiple' in df.columns \
+        else pd.Series(np.nan, index=df.index)
+    if 'profit_loss' in df.columns and 'riesgo_monetario' in df.columns:
+        riesgo = pd.to_numeric(df['riesgo_monetario'], errors='coerce')
+        r = r.fillna(df['profit_loss'] / riesgo.where(riesgo > 0))
+    r = r.to_numpy(dtype=np.float64)
+    return r[np.isfinite(r)]
+
+def operaciones_por_mes(df, plan=None):
+    """Ritmo observado de operaciones al mes; sin historial suficiente, el máximo diario del plan"""
+    if df is not None and len(df) > 1 and 'fecha' in df.columns:
+        fechas = pd.to_datetime(df['fecha'], format='ISO8601', errors='coerce').dropna()
+        if len(fechas) > 1:
+            meses = (fechas.max() - fechas.min()).days / 30.44
+            if meses >= 1:
+                return len(fechas) / meses
+    maximo_dia = (plan or {}).get('max_operaciones_dia') or 1
+    return float(maximo_dia * DIAS_HABILES_MES)
+
+# ========== SIMULACIÓN ==========
+def _simular_bloque(r, n_trayectorias, n_operaciones, capital, riesgo, nivel_ruina, nivel_objetivo, semilla, bandas):
+    """Simula un bloque de trayectorias por remuestreo (bootstrap) de los R-múltiplos
+
+    Riesgo monetario fijo por operación, como el motor de P&L. Devuelve por trayectoria
+    el drawdown máximo, si cae en ruina, la operación en que alcanza el objetivo (-1 si
+    no lo alcanza antes del final o de la ruina) y la equity final.
+    """
+    rng = np.random.default_rng(semilla)
+    indices = rng.integers(0, len(r), size=(n_trayectorias, n_operaciones), dtype=np.int32)
+    equity = (r * riesgo).astype(np.float32)[indices]
+    np.cumsum(equity, axis=1, out=equity)
+    equity += np.float32(capital)
+
+    # Drawdown en el buffer de índices reinterpretado como float32 (evita otra matriz del mismo tamaño)
+    pico = indices.view(np.float32)
+    np.maximum.accumulate(equity, axis=1, out=pico)
+    np.maximum(pico, np.float32(capital), out=pico)
+    np.subtract(pico, equity, out=pico)
+    drawdown = pico.max(axis=1)
+
+    en_ruina = equity <= nivel_ruina
+    ruina = en_ruina.any(axis=1)
+    paso_ruina = np.where(ruina, en_ruina.argmax(axis=1), n_operaciones)
+    en_objetivo = equity >= nivel_objetivo
+    paso_objetivo = np.where(en_objetivo.any(axis=1), en_objetivo.argmax(axis=1), -1)
+    paso_objetivo[paso_objetivo >= paso_ruina] = -1
+
+    resultado = {
+        'drawdown': drawdown,
+        'ruina': ruina,
+        'paso_objetivo': paso_objetivo.astype(np.int32),
+        'equity_final': equity[:, -1].copy(),
+    }
+    if bandas:
+        resultado['bandas'] = np.percentile(equity[:MUESTRA_BANDAS], PERCENTILES_BANDAS, axis=0)
+    return resultado
+
+def _percentil_finito(valores, percentil):
+    """Percentil sobre todas las trayectorias; None si cae en las que no alcanzan el objetivo (inf)"""
+    valor = np.percentile(valores, percentil, method='inverted_cdf')
+    return round(float(valor), 1) if np.isfinite(valor) else None
+
+@trazar('calculo')
+def simular(r, capital, riesgo, objetivo_mensual, ops_mes, meses=MESES_HORIZONTE, trayectorias=TRAYECTORIAS,
+            umbral_ruina=UMBRAL_RUINA, procesos=1, semilla=SEMILLA):
+    """Riesgo de ruina, percentiles de drawdown y tiempo hasta el objetivo mensual del plan
+
+    `r` son los R-múltiplos observados, `riesgo` el importe por R y `objetivo_mensual` el %
+    del capital que el plan quiere ganar al mes. Las trayectorias se reparten en bloques
+    independientes (cada uno con su semilla), que con procesos > 1 se ejecutan en un pool
+    de procesos. Las bandas de equity se calculan sobre una muestra del primer bloque.
+    """
+    r = np.asarray(r, dtype=np.float64)
+    ops_mes = max(float(ops_mes), 1.0)
+    n_operaciones = min(math.ceil(ops_mes * meses), max(MAX_OPERACIONES_HORIZONTE, math.ceil(ops_mes)))
+    nivel_ruina = capital * (1 - umbral_ruina)
+    nivel_objetivo = capital * (1 + objetivo_mensual / 100)
+
+    tamanos = [min(BLOQUE_TRAYECTORIAS, trayectorias - inicio) for inicio in range(0, trayectorias, BLOQUE_TRAYECTORIAS)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+    argumentos = [(r, tamano, n_operaciones, capital, riesgo, nivel_ruina, nivel_objetivo, s, i == 0)
+                  for i, (tamano, s) in enumerate(zip(tamanos, semillas))]
+    if procesos > 1 and len(argumentos) > 1:
+        pool = _obtener_pool(procesos)
+        bloques = list(pool.map(_simular_bloque, *zip(*argumentos)))
+    else:
+        bloques = [_simular_bloque(*args) for args in argumentos]
+
+    drawdown = np.concatenate([b['drawdown'] for b in bloques])
+    ruina = np.concatenate([b['ruina'] for b in bloques])
+    paso_objetivo = np.concatenate([b['paso_objetivo'] for b in bloques])
+    equity_final = np.concatenate([b['equity_final'] for b in bloques])
+
+    alcanzado = paso_objetivo >= 0
+    # Las trayectorias que no llegan cuentan como "nunca": la mediana solo existe si llega al menos la mitad
+    meses_objetivo = np.where(alcanzado, (paso_objetivo + 1) / ops_mes, np.inf)
+    return {
+        'trayectorias': int(trayectorias),
+        'muestras': int(len(r)),
+        'operaciones_horizonte': n_operaciones,
+        'operaciones_mes': round(ops_mes, 1),
+        'meses_horizonte': round(n_operaciones / ops_mes, 1),
+        'riesgo_ruina': round(float(ruina.mean()) * 100, 2),
+        'drawdown_percentiles': {p: round(float(v), 2) for p, v in
+                                 zip(PERCENTILES_DRAWDOWN, np.percentile(drawdown, PERCENTILES_DRAWDOWN))},
+        'prob_objetivo_mes': round(float((alcanzado & (paso_objetivo < math.floor(ops_mes))).mean()) * 100, 2),
+        'prob_objetivo_horizonte': round(float(alcanzado.mean()) * 100, 2),
+        'meses_objetivo_p50': _percentil_finito(meses_objetivo, 50),
+        'meses_objetivo_p90': _percentil_finito(meses_objetivo, 90),
+        'equity_final_percentiles': {p: round(float(v), 2) for p, v in
+                                     zip(PERCENTILES_BANDAS, np.percentile(equity_final, PERCENTILES_BANDAS))},
+        'bandas': bloques[0]['bandas'],
+    }
@@ -0,0 +1,36 @@
+# motor_pl.py - MOTOR DE P&L: PERSISTENCIA EN SEGUNDO PLANO DEL P&L CALCULADO CON calculo_pl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import firestore
+from firebase_config import db
+from escrituras import LoteEscrituras, MAX_OPERACIONES_LOTE
+from sincronizacion_operaciones import notificar_escritura
+
+# ========== CONFIGURACIÓN ==========
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistir_pl")
+_en_curso = set()
+_lock = threading.Lock()
+
+# ========== PERSISTENCIA ==========
+def _persistir(user_id, pendientes):
+    try:
+        operaciones_ref = db.collection('users').document(user_id).collection('operaciones')
+        for inicio in range(0, len(pendientes), MAX_OPERACIONES_LOTE):
+            with LoteEscrituras() as lote:
+                for operacion_id, campos in pendientes[inicio:inicio + MAX_OPERACIONES_LOTE]:
+                    lote.update(operaciones_ref.document(operacion_id),
+                                {**campos, 'timestamp': firestore.SERVER_TIMESTAMP})
+        notificar_escritura(user_id)
+    finally:
+        with _lock:
+            _en_curso.discard(user_id)
+
+def persistir_pl(user_id, pendientes):
+    """Guarda en segundo plano el P&L calculado para operaciones antiguas (una sola vez por operación)"""
+    if not pendientes:
+        return
+    with _lock:
+        if user_id in _en_curso:
+            return
+        _en_curso.add(user_id)
+    _ejecutor.submit(_persistir, user_id, pendientes)
@@ -0,0 +1,105 @@
+# panel_rendimiento.py - PANEL DE ADMINISTRACIÓN "PERFORMANCE": LATENCIAS POR OPERACIÓN A PARTIR DE LAS TRAZAS
+import streamlit as st
+import pandas as pd
+from trazas import buffer, resumen_por_operacion, exportar_json, exportar_otlp, CATEGORIAS
+from cliente_llm import metricas as metricas_llm
+from cache_usuario import cache
+
+# ========== CONFIGURACIÓN ==========
+RERUNS_RECIENTES = 20
+FORMATOS_TRAZAS = {
+    'json': ("JSON", exportar_json, 'trazas.json'),
+    'otlp': ("OpenTelemetry (OTLP JSON)", exportar_otlp, 'trazas.otlp.json'),
+}
+
+def es_administrador(usuario):
+    return (usuario or {}).get('role') == 'admin'
+
+# ========== DATOS ==========
+def desglose_reruns(spans, limite=RERUNS_RECIENTES):
+    """Últimos reruns con su duración total y el tiempo sumado de los spans de cada categoría"""
+    df = pd.DataFrame(spans)
+    renders = df[df['categoria'] == 'render'].sort_values('inicio_ns', ascending=False).head(limite)
+    if renders.empty:
+        return renders
+    por_categoria = (df[df['traza'].isin(renders['traza']) & (df['categoria'] != 'render')]
+                     .pivot_table(index='traza', columns='categoria', values='duracion_ms', aggfunc='sum'))
+    desglose = renders[['traza', 'pagina', 'usuario', 'inicio_ns', 'duracion_ms']].join(por_categoria, on='traza')
+    desglose['inicio'] = pd.to_datetime(desglose['inicio_ns'], unit='ns')
+    tiempos = ['duracion_ms'] + [c for c in CATEGORIAS if c in desglose.columns]
+    desglose[tiempos] = desglose[tiempos].fillna(0).round(1)
+    return desglose[['inicio', 'pagina', 'usuario'] + tiempos]
+
+# ========== INTERFAZ ==========
+def mostrar_panel_rendimiento():
+    st.title("⚙️ Performance")
+    if not es_administrador(st.session_state.get('user')):
+        st.warning("🔒 Solo los administradores pueden ver el panel de rendimiento")
+        return
+
+    spans = buffer.todos()
+    if not spans:
+        st.info("Aún no hay trazas registradas en este proceso")
+        return
+
+    # Filtros
+    paginas = sorted({s['pagina'] for s in spans})
+    col_pagina, col_categoria = st.columns(2)
+    seleccion_paginas = col_pagina.multiselect("Páginas", paginas, default=paginas, key="perf_paginas")
+    categorias = [c for c in CATEGORIAS if any(s['categoria'] == c for s in spans)]
+    seleccion_categorias = col_categoria.multiselect("Operaciones", categorias, default=categorias, key="perf_categorias")
+    filtrados = [s for s in spans if s['pagina'] in seleccion_paginas and s['categoria'] in seleccion_categorias]
+
+    st.caption(f"{len(spans):,} spans en memoria (máx. {buffer.spans.maxlen:,}) · {len(filtrados):,} tras filtrar")
+
+    # ========== LATENCIAS POR OPERACIÓN ==========
+    st.header("⏱️ Latencia por operación")
+    resumen = resumen_por_operacion(filtrados)
+    if resumen:
+        st.dataframe(pd.DataFrame(resumen), use_container_width=True, hide_index=True)
+
+    # ========== RERUNS RECIENTES ==========
+    st.header("🔁 Reruns recientes")
+    reruns = desglose_reruns(spans)
+    if reruns.empty:
+        st.info("No hay reruns completos registrados")
+    else:
+        st.dataframe(reruns, use_container_width=True, hide_index=True)
+        st.caption("Tiempo por categoría en ms; las llamadas en streaming y los trabajos en segundo plano se solapan con el render")
+
+    # ========== LLM Y CACHÉ ==========
+    col_llm, col_cache = st.columns(2)
+    with col_llm:
+        st.subheader("🤖 Cliente LLM")
+        st.json(metricas_llm.resumen())
+    with col_cache:
+        st.subheader("🗄️ Caché compartida")
+        st.json(cache.estadisticas())
+
+    # ========== EXPORTACIÓN ==========
+    st.header("📤 Exportar trazas")
+    col_formato, col_boton, col_vaciar = st.columns([2, 1, 1])
+    formato = col_formato.radio("Formato", list(FORMATOS_TRAZAS), format_func=lambda f: FORMATOS_TRAZAS[f][0],
+                                horizontal=True, key="perf_formato")
+    _, exportar, nombre = FORMATOS_TRAZAS[formato]
+    # Serializar hasta todo el buffer es caro: solo se hace a petición y se guarda la instantánea en la sesión
+    preparada = st.session_state.get('perf_exportacion')
+    if preparada is not None and preparada[0] != formato:
+        preparada = None
+    if preparada is None and col_boton.button("⚙️ Preparar exportación", key="perf_preparar"):
+        with st.spinner("Generando exportación..."):
+            try:
+                preparada = (formato, exportar(filtrados), len(filtrados))
+                st.session_state['perf_exportacion'] = preparada
+            except Exception as e:
+                st.error(f"Error al generar la exportación: {str(e)}")
+    if preparada is not None:
+        col_boton.download_button("⬇️ Descargar", preparada[1], file_name=nombre, mime='application/json')
+        st.caption(f"Instantánea de {preparada[2]:,} spans; vuelve a prepararla para incluir los nuevos")
+        if st.button("🔄 Preparar de nuevo", key="perf_descartar"):
+            st.session_state.pop('perf_exportacion', None)
+            st.rerun()
+    if col_vaciar.button("🗑️ Vaciar buffer"):
+        buffer.vaciar()
+        st.session_state.pop('perf_exportacion', None)
+        st.rerun()
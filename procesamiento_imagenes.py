@@ -0,0 +1,102 @@
+# procesamiento_imagenes.py - INGESTA DE CAPTURAS: NORMALIZACIÓN, REESCALADO Y MINIATURAS
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+from firebase_config import db
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+from almacen_imagenes import obtener_almacen_blobs
+from sincronizacion_operaciones import notificar_escritura
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+# ========== CONFIGURACIÓN ==========
+LADO_MAXIMO = 1920          # Resolución máxima de la imagen completa
+LADO_PREVISUALIZACION = 960  # Previsualización comprimida para el historial
+LADO_MINIATURA = 240        # Miniatura incrustada en el documento de la operación
+CALIDAD_COMPLETA = 85
+CALIDAD_PREVISUALIZACION = 70
+CALIDAD_MINIATURA = 60
+
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingesta_imagenes")
+
+# ========== PIPELINE ==========
+def _formato_salida():
+    """WebP si Pillow lo soporta (bastante más compacto para capturas), JPEG si no"""
+    if features.check("webp"):
+        return "WEBP", "image/webp"
+    return "JPEG", "image/jpeg"
+
+def _codificar(imagen, lado, calidad, formato):
+    copia = imagen.copy()
+    copia.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+    salida = io.BytesIO()
+    # Al volver a codificar sin pasar exif/info se descartan todos los metadatos
+    copia.save(salida, format=formato, quality=calidad, optimize=True)
+    return salida.getvalue()
+
+def normalizar_imagen(datos):
+    """Abre la imagen, aplica la orientación EXIF y la deja en RGB sin metadatos"""
+    imagen = Image.open(io.BytesIO(datos))
+    imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode != "RGB":
+        fondo = Image.new("RGB", imagen.size, (255, 255, 255))
+        if imagen.mode in ("RGBA", "LA") or (imagen.mode == "P" and "transparency" in imagen.info):
+            imagen = imagen.convert("RGBA")
+            fondo.paste(imagen, mask=imagen.split()[-1])
+        else:
+            fondo.paste(imagen.convert("RGB"))
+        imagen = fondo
+    return imagen
+
+def procesar_imagen(datos):
+    """Genera imagen completa (acotada), previsualización y miniatura a partir de los bytes subidos"""
+    formato, tipo_contenido = _formato_salida()
+    imagen = normalizar_imagen(datos)
+    return {
+        "completa": _codificar(imagen, LADO_MAXIMO, CALIDAD_COMPLETA, formato),
+        "previsualizacion": _codificar(imagen, LADO_PREVISUALIZACION, CALIDAD_PREVISUALIZACION, formato),
+        "miniatura": _codificar(imagen, LADO_MINIATURA, CALIDAD_MINIATURA, "JPEG"),
+        "tipo_contenido": tipo_contenido,
+    }
+
+def _ingestar(almacen, user_id, operacion_id, datos, tipo_contenido):
+    """Trabajo en segundo plano: procesa, guarda los blobs y completa la operación"""
+    doc_ref = db.collection('users').document(user_id).collection('operaciones').document(operacion_id)
+    original = None
+    try:
+        # El original se guarda primero para no perder la subida si el procesado falla. No se borra
+        # después: el almacén deduplica por hash y otras operaciones pueden compartir ese blob
+        original = almacen.guardar(datos, tipo_contenido)
+        if Image is None:
+            # Sin Pillow se guarda el original tal cual
+            campos = {"imagen_ref": original}
+        else:
+            resultado = procesar_imagen(datos)
+            campos = {
+                "imagen_ref": almacen.guardar(resultado["completa"], resultado["tipo_contenido"]),
+                "imagen_preview_ref": almacen.guardar(resultado["previsualizacion"], resultado["tipo_contenido"]),
+                "imagen_miniatura": base64.b64encode(resultado["miniatura"]).decode('utf-8'),
+            }
+        campos["imagen_estado"] = "lista"
+    except Exception as e:
+        campos = {"imagen_estado": "error", "imagen_error": str(e)}
+        if original:
+            campos["imagen_original_ref"] = original
+
+    campos["timestamp"] = firestore.SERVER_TIMESTAMP
+    try:
+        doc_ref.update(campos)
+    except NotFound:
+        # La operación se eliminó mientras se procesaba la captura
+        return
+    notificar_escritura(user_id)
+
+def encolar_imagen(user_id, operacion_id, datos, tipo_contenido="image/png"):
+    """Encola la ingesta de la imagen; la operación ya guardada se actualiza al terminar"""
+    # El backend se resuelve en el hilo de la página (lee st.secrets)
+    almacen = obtener_almacen_blobs()
+    return _ejecutor.submit(_ingestar, almacen, user_id, operacion_id, datos, tipo_contenido)
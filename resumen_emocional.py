@@ -0,0 +1,120 @@
+# resumen_emocional.py - CONTEOS DIARIOS Y SEMANALES DE EMOCIONES DEL CHAT, ACTUALIZADOS EN CADA MENSAJE
+from collections import Counter
+from datetime import datetime, timezone
+from firebase_admin import firestore
+from firebase_config import db
+from cache_usuario import leer_documento, escribir_documento, invalidar_documento
+from escrituras import LoteEscrituras, MAX_OPERACIONES_LOTE
+
+# ========== CONFIGURACIÓN ==========
+COLECCION_DIARIA = 'emociones_diarias'     # documento por día: 'AAAA-MM-DD'
+COLECCION_SEMANAL = 'emociones_semanales'  # documento por semana ISO: 'AAAA-Www'
+DIAS_RESUMEN = 30
+SEMANAS_RESUMEN = 26
+
+# Los periodos se calculan en UTC: 'creado' vuelve de Firestore en UTC y el día de un mensaje
+# no debe depender de si se contó al guardarlo o al reconstruir
+def ahora_utc():
+    return datetime.now(timezone.utc)
+
+def _en_utc(fecha):
+    return fecha.replace(tzinfo=timezone.utc) if fecha.tzinfo is None else fecha.astimezone(timezone.utc)
+
+def clave_dia(fecha):
+    return fecha.strftime('%Y-%m-%d')
+
+def clave_semana(fecha):
+    anio, semana, _ = fecha.isocalendar()
+    return f"{anio}-W{semana:02d}"
+
+def _rollup_ref(user_id, coleccion, periodo):
+    return db.collection('users').document(user_id).collection(coleccion).document(periodo)
+
+def _marcador_ref(user_id):
+    return db.collection('users').document(user_id).collection('chatbot').document('resumen_emocional')
+
+# ========== ESCRITURA ==========
+def registrar_emocion(user_id, emocion, fecha=None, escritor=None):
+    """Suma un mensaje a los conteos del día y de la semana con incrementos atómicos
+
+    Con `escritor` (batch, transacción o LoteEscrituras) las escrituras se añaden a él;
+    el llamador hace el commit y después invalida 'resumen_emocional' en la caché.
+    """
+    fecha = _en_utc(fecha or ahora_utc())
+    emocion = emocion or 'neutral'
+    propio = escritor is None
+    escritor = escritor or db.batch()
+    for coleccion, periodo in ((COLECCION_DIARIA, clave_dia(fecha)), (COLECCION_SEMANAL, clave_semana(fecha))):
+        escritor.set(_rollup_ref(user_id, coleccion, periodo), {
+            'periodo': periodo,
+            'total': firestore.Increment(1),
+            'conteos': {emocion: firestore.Increment(1)},
+        }, merge=True)
+    if propio:
+        escritor.commit()
+        invalidar_documento('resumen_emocional', user_id)
+
+def reconstruir_resumen(user_id, mensajes):
+    """Recalcula todos los conteos a partir de los mensajes del usuario y marca el resumen como reconstruido
+
+    Sobrescribe los periodos (incluidos los que ya se contaron al chatear) en lotes de
+    MAX_OPERACIONES_LOTE escrituras; el marcador va en el último, así que si algo falla a
+    mitad la reconstrucción se repite entera la próxima vez.
+    """
+    diarios, semanales = {}, {}
+    for mensaje in mensajes:
+        if mensaje.get('tipo') != 'usuario' or not isinstance(mensaje.get('creado'), datetime):
+            continue
+        emocion = mensaje.get('emocion') or 'neutral'
+        creado = _en_utc(mensaje['creado'])
+        for conteos, periodo in ((diarios, clave_dia(creado)), (semanales, clave_semana(creado))):
+            conteos.setdefault(periodo, Counter())[emocion] += 1
+
+    escrituras = [
+        (_rollup_ref(user_id, coleccion, periodo), {
+            'periodo': periodo,
+            'total': sum(conteos.values()),
+            'conteos': dict(conteos),
+        })
+        for coleccion, periodos in ((COLECCION_DIARIA, diarios), (COLECCION_SEMANAL, semanales))
+        for periodo, conteos in periodos.items()
+    ]
+    escrituras.append((_marcador_ref(user_id), {'reconstruido': True, 'fecha': firestore.SERVER_TIMESTAMP}))
+    for inicio in range(0, len(escrituras), MAX_OPERACIONES_LOTE):
+        with LoteEscrituras() as lote:
+            for referencia, datos in escrituras[inicio:inicio + MAX_OPERACIONES_LOTE]:
+                lote.set(referencia, datos)
+    escribir_documento('resumen_reconstruido', user_id, True)
+    invalidar_documento('resumen_emocional', user_id)
+
+def resumen_reconstruido(user_id):
+    """True si los conteos ya incluyen los mensajes anteriores al resumen incremental"""
+    def _leer():
+        doc = _marcador_ref(user_id).get()
+        return bool(doc.exists and doc.to_dict().get('reconstruido'))
+    return leer_documento('resumen_reconstruido', user_id, _leer)
+
+# ========== LECTURA ==========
+def _leer_periodos(user_id, coleccion, limite):
+    consulta = (db.collection('users').document(user_id).collection(coleccion)
+                .order_by('periodo', direction='DESCENDING').limit(limite))
+    periodos = [doc.to_dict() for doc in consulta.stream()]
+    periodos.reverse()
+    return periodos
+
+def _leer_resumen(user_id):
+    return {
+        'diario': _leer_periodos(user_id, COLECCION_DIARIA, DIAS_RESUMEN),
+        'semanal': _leer_periodos(user_id, COLECCION_SEMANAL, SEMANAS_RESUMEN),
+    }
+
+def cargar_resumen_emocional(user_id):
+    """Conteos de los últimos DIAS_RESUMEN días y SEMANAS_RESUMEN semanas, en orden cronológico"""
+    return leer_documento('resumen_emocional', user_id, lambda: _leer_resumen(user_id))
+
+def conteos_totales(periodos):
+    """Counter de emociones sumando una lista de periodos"""
+    total = Counter()
+    for periodo in periodos:
+        total.update(periodo.get('conteos', {}))
+    return total
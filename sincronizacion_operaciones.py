@@ -0,0 +1,206 @@
+# sincronizacion_operaciones.py - ALMACÉN LOCAL DE OPERACIONES CON SINCRONIZACIÓN INCREMENTAL
+import threading
+import time
+import streamlit as st
+from firebase_config import db
+from firebase_admin import firestore
+from cache_usuario import cache, estimar_tamano
+
+# ========== CONFIGURACIÓN ==========
+COLECCION_OPERACIONES = 'operaciones'
+COLECCION_ELIMINADAS = 'operaciones_eliminadas'
+INTERVALO_SINCRONIZACION = 30  # segundos sin consultar Firestore si no hubo escrituras locales
+
+# ========== ALMACÉN POR USUARIO ==========
+class AlmacenOperaciones:
+    """Copia local de las operaciones de un usuario que se sincroniza por cursor de timestamp"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.operaciones = {}
+        self.cursor = None
+        self.cursor_eliminadas = None
+        self.inicializado = False
+        self.version = 0
+        self.ultima_sincronizacion = 0.0
+        self.pendiente = False
+        self._tamano = 0
+        self._lock = threading.Lock()
+
+    def _usuario_ref(self):
+        return db.collection('users').document(self.user_id)
+
+    def _registrar_cursor(self, timestamp):
+        if timestamp is not None and (self.cursor is None or timestamp > self.cursor):
+            self.cursor = timestamp
+
+    def _registrar_cursor_eliminadas(self, timestamp):
+        if timestamp is not None and (self.cursor_eliminadas is None or timestamp > self.cursor_eliminadas):
+            self.cursor_eliminadas = timestamp
+
+    def _fusionar(self, doc):
+        """Guarda el documento en el almacén; devuelve True si no estaba o ha cambiado"""
+        operacion = doc.to_dict()
+        operacion['id'] = doc.id
+        anterior = self.operaciones.get(doc.id)
+        self.operaciones[doc.id] = operacion
+        self._registrar_cursor(operacion.get('timestamp'))
+        return anterior != operacion
+
+    def _carga_completa(self):
+        """Primera carga: descarga toda la colección y fija los cursores"""
+        self.operaciones = {}
+        for doc in self._usuario_ref().collection(COLECCION_OPERACIONES).stream():
+            self._fusionar(doc)
+
+        # Las lápidas anteriores a la carga no aportan nada, solo necesitamos el cursor
+        ultimas = self._usuario_ref().collection(COLECCION_ELIMINADAS) \
+            .order_by('timestamp', direction='DESCENDING').limit(1).stream()
+        for doc in ultimas:
+            self._registrar_cursor_eliminadas(doc.to_dict().get('timestamp'))
+
+        self.inicializado = True
+        self.version += 1
+
+    def _carga_incremental(self):
+        """Descarga solo los documentos nuevos o modificados y aplica las lápidas"""
+        cambios = 0
+
+        consulta = self._usuario_ref().collection(COLECCION_OPERACIONES)
+        if self.cursor is not None:
+            # '>=' para no perder escrituras con el mismo timestamp que el cursor; la fusión es idempotente
+            # y los documentos que vuelven sin cambios no cuentan, así la versión solo sube con cambios reales
+            consulta = consulta.where('timestamp', '>=', self.cursor)
+        for doc in consulta.stream():
+            cambios += self._fusionar(doc)
+
+        consulta = self._usuario_ref().collection(COLECCION_ELIMINADAS)
+        if self.cursor_eliminadas is not None:
+            consulta = consulta.where('timestamp', '>=', self.cursor_eliminadas)
+        for doc in consulta.stream():
+            lapida = doc.to_dict()
+            eliminada = self.operaciones.pop(doc.id, None)
+            # Una operación reescrita después de su lápida sigue viva
+            if eliminada is not None and eliminada.get('timestamp') and lapida.get('timestamp') \
+                    and eliminada['timestamp'] > lapida['timestamp']:
+                self.operaciones[doc.id] = eliminada
+            elif eliminada is not None:
+                cambios += 1
+            self._registrar_cursor_eliminadas(lapida.get('timestamp'))
+
+        if cambios:
+            self.version += 1
+
+    def sincronizar(self, forzar=False):
+        """Sincroniza el almacén con Firestore (completa la primera vez, incremental después)"""
+        with self._lock:
+            version = self.version
+            if not self.inicializado:
+                self._carga_completa()
+            elif forzar or self.pendiente or time.monotonic() - self.ultima_sincronizacion >= INTERVALO_SINCRONIZACION:
+                self._carga_incremental()
+            else:
+                return False
+            self.pendiente = False
+            self.ultima_sincronizacion = time.monotonic()
+            if self.version != version:
+                self._tamano = estimar_tamano(self.operaciones)
+            return self.version != version
+
+    def marcar_pendiente(self):
+        """Fuerza una sincronización en la próxima lectura (tras una escritura local)"""
+        self.pendiente = True
+
+    def descartar(self, operacion_id):
+        with self._lock:
+            if self.operaciones.pop(operacion_id, None) is not None:
+                self.version += 1
+
+    def estimar_tamano(self):
+        return self._tamano
+
+    def contar(self):
+        with self._lock:
+            return len(self.operaciones)
+
+    def listar(self):
+        """Devuelve copias de las operaciones, más recientes primero"""
+        with self._lock:
+            operaciones = [dict(op) for op in self.operaciones.values()]
+        return sorted(operaciones, key=lambda op: (op.get('timestamp') is not None, op.get('timestamp') or 0), reverse=True)
+
+_almacenes_lock = threading.Lock()
+
+def obtener_almacen(user_id):
+    """Obtiene (o crea) el almacén local del usuario; vive en la caché compartida del proceso"""
+    with _almacenes_lock:
+        almacen = cache.obtener(('operaciones', user_id))
+        if almacen is None:
+            almacen = AlmacenOperaciones(user_id)
+            cache.guardar(('operaciones', user_id), almacen)
+        return almacen
+
+# ========== API PÚBLICA ==========
+def obtener_operaciones(user_id):
+    """Devuelve las operaciones del usuario leyendo de Firestore solo lo que cambió desde la última vez"""
+    if db is None:
+        return []
+    try:
+        almacen = obtener_almacen(user_id)
+        if almacen.sincronizar():
+            # Reinsertar para que la caché recalcule el tamaño ocupado
+            cache.guardar(('operaciones', user_id), almacen)
+        return almacen.listar()
+    except Exception as e:
+        st.error(f"Error al sincronizar operaciones: {str(e)}")
+        return []
+
+def contar_operaciones(user_id):
+    """Número de operaciones según el almacén local ya cargado; None si este proceso aún no lo tiene
+
+    No dispara la carga completa: solo la sincronización incremental de un almacén existente.
+    """
+    if db is None:
+        return None
+    almacen = cache.obtener(('operaciones', user_id))
+    if almacen is None or not almacen.inicializado:
+        return None
+    try:
+        if almacen.sincronizar():
+            cache.guardar(('operaciones', user_id), almacen)
+    except Exception:
+        return None
+    return almacen.contar()
+
+def registrar_eliminacion(user_id, operacion_id, escritor=None):
+    """Elimina una operación dejando una lápida para que los demás almacenes la descarten
+
+    Si se pasa un escritor (WriteBatch o Transaction) las escrituras se añaden a él y es el
+    llamador quien confirma y después llama a notificar_escritura.
+    """
+    usuario_ref = db.collection('users').document(user_id)
+    propio = escritor is None
+    if propio:
+        escritor = db.batch()
+    escritor.delete(usuario_ref.collection(COLECCION_OPERACIONES).document(operacion_id))
+    escritor.set(usuario_ref.collection(COLECCION_ELIMINADAS).document(operacion_id), {
+        'timestamp': firestore.SERVER_TIMESTAMP
+    })
+    if not propio:
+        return
+    escritor.commit()
+
+    almacen = cache.obtener(('operaciones', user_id))
+    if almacen is not None:
+        almacen.descartar(operacion_id)
+        almacen.marcar_pendiente()
+
+def notificar_escritura(user_id):
+    """Invalida la vista local tras guardar una operación para que la próxima lectura la incluya"""
+    almacen = cache.obtener(('operaciones', user_id))
+    if almacen is not None:
+        almacen.marcar_pendiente()
+
+def descartar_almacen(user_id):
+    """Olvida el almacén local del usuario (la próxima lectura hará una carga completa)"""
+    cache.invalidar(('operaciones', user_id))
@@ -6,6 +6,8 @@ from journaling import mostrar_journaling_inteligente
 from chatbot import mostrar_chatbot_trading
 from estrategia_maestra import mostrar_estrategia_maestra
 from analisis_mercado import mostrar_proximamente
+from panel_rendimiento import mostrar_panel_rendimiento, es_administrador
+from trazas import rerun
 
 # ========== CONFIGURACIÓN INICIAL ==========
 COLOR_PRIMARY = "#4A5A3D"
@@ -221,6 +223,8 @@ def sidebar():
         "Planificador de Trading",
         "🚀 Próximamente"
     ]
+    if es_administrador(st.session_state.user):
+        opciones.append("⚙️ Performance")
     
     return st.sidebar.radio("Menú", opciones)
 
@@ -228,16 +232,20 @@ def sidebar():
 def main():
     opcion = sidebar()
     
-    if opcion == "Dashboard":
-        mostrar_dashboard_personalizado()
-    elif opcion == "Journaling Inteligente":
-        mostrar_journaling_inteligente()
-    elif opcion == "Apoyo Psicológico":
-        mostrar_chatbot_trading()
-    elif opcion == "Planificador de Trading":
-        mostrar_estrategia_maestra()
-    elif opcion == "🚀 Próximamente":
-        mostrar_proximamente()
+    # Cada rerun es una traza: los spans de Firestore, LLM, DataFrames y gráficos llevan página y usuario
+    with rerun(opcion, st.session_state.user['uid']):
+        if opcion == "Dashboard":
+            mostrar_dashboard_personalizado()
+        elif opcion == "Journaling Inteligente":
+            mostrar_journaling_inteligente()
+        elif opcion == "Apoyo Psicológico":
+            mostrar_chatbot_trading()
+        elif opcion == "Planificador de Trading":
+            mostrar_estrategia_maestra()
+        elif opcion == "🚀 Próximamente":
+            mostrar_proximamente()
+        elif opcion == "⚙️ Performance":
+            mostrar_panel_rendimiento()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,88 @@
+# trabajos_ia.py - ANÁLISIS CON IA EN SEGUNDO PLANO, CACHEADOS POR HUELLA DE LOS DATOS
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from firebase_config import db
+from cache_usuario import leer_documento, escribir_documento
+
+# ========== CONFIGURACIÓN ==========
+MAX_TRABAJOS_CONCURRENTES = 4
+
+_ejecutor = ThreadPoolExecutor(max_workers=MAX_TRABAJOS_CONCURRENTES, thread_name_prefix="analisis_ia")
+_pendientes = {}  # (user_id, tipo) -> (huella, future)
+_errores = {}     # (user_id, tipo) -> (huella, mensaje)
+_lock = threading.Lock()
+
+# ========== HUELLAS ==========
+def calcular_huella(*partes):
+    """Hash estable de los datos de entrada de un análisis"""
+    serializado = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+# ========== PERSISTENCIA ==========
+def _analisis_ref(user_id, tipo):
+    return db.collection('users').document(user_id).collection('analisis_ia').document(tipo)
+
+def _leer_analisis(user_id, tipo):
+    doc = _analisis_ref(user_id, tipo).get()
+    return doc.to_dict() if doc.exists else None
+
+def _ejecutar(user_id, tipo, huella, generar):
+    """Trabajo en segundo plano: genera el texto y lo guarda junto a la huella que lo originó"""
+    clave = (user_id, tipo)
+    try:
+        texto = generar()
+        analisis = {
+            'texto': texto,
+            'huella': huella,
+            'actualizado': datetime.now().isoformat(),
+        }
+        _analisis_ref(user_id, tipo).set(analisis)
+        escribir_documento(f'analisis_{tipo}', user_id, analisis)
+        with _lock:
+            _errores.pop(clave, None)
+    except Exception as e:
+        with _lock:
+            _errores[clave] = (huella, str(e))
+    finally:
+        with _lock:
+            if _pendientes.get(clave, (None,))[0] == huella:
+                _pendientes.pop(clave, None)
+
+# ========== API PÚBLICA ==========
+def obtener_analisis(user_id, tipo, huella, generar):
+    """Devuelve al instante el último análisis guardado y, si los datos cambiaron, encola uno nuevo
+
+    `generar` se ejecuta en un hilo del pool: debe ser autocontenido (sin llamadas a st.*)
+    y lanzar una excepción si falla, para no guardar mensajes de error como análisis.
+    Devuelve {'texto', 'actualizado', 'estado', 'error'} con estado 'vigente' o 'actualizando'.
+    """
+    clave = (user_id, tipo)
+    guardado = leer_documento(f'analisis_{tipo}', user_id, lambda: _leer_analisis(user_id, tipo)) or {}
+    resultado = {
+        'texto': guardado.get('texto'),
+        'actualizado': guardado.get('actualizado'),
+        'estado': 'vigente',
+        'error': None,
+    }
+    if guardado.get('huella') == huella:
+        return resultado
+
+    with _lock:
+        error = _errores.get(clave)
+        if error and error[0] == huella:
+            # Ya falló con estos mismos datos: no reintentar en cada rerun
+            resultado['error'] = error[1]
+            return resultado
+        pendiente = _pendientes.get(clave)
+        if pendiente is None or pendiente[0] != huella:
+            _pendientes[clave] = (huella, _ejecutor.submit(_ejecutar, user_id, tipo, huella, generar))
+    resultado['estado'] = 'actualizando'
+    return resultado
+
+def reintentar_analisis(user_id, tipo):
+    """Olvida el último error para que la próxima lectura vuelva a encolar el análisis"""
+    with _lock:
+        _errores.pop((user_id, tipo), None)
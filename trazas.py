@@ -0,0 +1,238 @@
+# trazas.py - TRAZAS LIGERAS POR RERUN: SPANS DE FIRESTORE, LLM, DATAFRAMES Y GRÁFICOS EN UN BUFFER CIRCULAR
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+
+# ========== CONFIGURACIÓN ==========
+MAX_SPANS = 20_000
+NOMBRE_SERVICIO = "trading-yeah"
+CATEGORIAS = ['render', 'firestore', 'llm', 'dataframe', 'grafico', 'calculo']
+
+# Contexto del rerun en curso (página, usuario, traza) y span activo; cada sesión de
+# Streamlit ejecuta su script en su propio hilo, así que no se mezclan entre usuarios
+_rerun = ContextVar('rerun', default=None)
+_span_activo = ContextVar('span_activo', default=None)
+
+# ========== BUFFER ==========
+class BufferSpans:
+    """Últimos MAX_SPANS spans en memoria (los más antiguos se descartan)"""
+
+    def __init__(self, maximo=MAX_SPANS):
+        self.spans = deque(maxlen=maximo)
+        self._lock = threading.Lock()
+
+    def registrar(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def todos(self):
+        with self._lock:
+            return list(self.spans)
+
+    def vaciar(self):
+        with self._lock:
+            self.spans.clear()
+
+buffer = BufferSpans()
+
+def _nuevo_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+# ========== SPANS ==========
+@contextmanager
+def rerun(pagina, usuario=None):
+    """Abre la traza de un rerun: todos los spans de dentro llevan su página y usuario"""
+    token = _rerun.set({'traza': _nuevo_id(16), 'pagina': pagina, 'usuario': usuario})
+    try:
+        with span(f"render:{pagina}", 'render'):
+            yield
+    finally:
+        _rerun.reset(token)
+
+@contextmanager
+def span(nombre, categoria, anidar=True, **atributos):
+    """Mide el bloque y lo registra como span hijo del span activo
+
+    Con anidar=False el span no pasa a ser el activo (para generadores, que ceden el
+    control al consumidor entre fragmentos).
+    """
+    contexto = _rerun.get() or {'traza': None, 'pagina': None, 'usuario': None}
+    padre = _span_activo.get()
+    actual = {'id': _nuevo_id(8), 'categoria': categoria}
+    token = _span_activo.set(actual) if anidar else None
+    inicio_ns, inicio = time.time_ns(), time.perf_counter()
+    ok = True
+    try:
+        yield atributos
+    except BaseException as e:
+        # st.rerun/st.stop se implementan con excepciones de control: no son errores
+        ok = not isinstance(e, Exception)
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        if token is not None:
+            _span_activo.reset(token)
+        buffer.registrar({
+            'traza': contexto['traza'] or _nuevo_id(16),
+            'span': actual['id'],
+            'padre': padre['id'] if padre else None,
+            'nombre': nombre,
+            'categoria': categoria,
+            'pagina': contexto['pagina'] or 'segundo_plano',
+            'usuario': contexto['usuario'],
+            'inicio_ns': inicio_ns,
+            'duracion_ms': round(duracion * 1000, 3),
+            'ok': ok,
+            'atributos': atributos,
+        })
+
+def trazar(categoria, nombre=None):
+    """Decorador: registra cada llamada como un span (en generadores, hasta agotarlos)"""
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+        if inspect.isgeneratorfunction(funcion):
+            @functools.wraps(funcion)
+            def envoltura_generador(*args, **kwargs):
+                with span(etiqueta, categoria, anidar=False):
+                    yield from funcion(*args, **kwargs)
+            return envoltura_generador
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with span(etiqueta, categoria):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+# ========== FIRESTORE ==========
+_instrumentado = False
+
+def _envolver_firestore(clase, metodo):
+    original = getattr(clase, metodo, None)
+    if original is None:
+        return
+    nombre = f"{clase.__name__}.{metodo.lstrip('_')}"
+    generador = inspect.isgeneratorfunction(original)
+
+    @functools.wraps(original)
+    def envoltura(self, *args, **kwargs):
+        # Query.get llama a stream, Client.get_all a la API...: solo se mide la llamada más externa
+        activo = _span_activo.get()
+        if activo and activo['categoria'] == 'firestore':
+            return original(self, *args, **kwargs)
+        ruta = getattr(self, 'path', None) or getattr(getattr(self, '_parent', None), 'id', None)
+        if generador:
+            return _stream_trazado(original, nombre, ruta, self, args, kwargs)
+        with span(nombre, 'firestore', ruta=ruta):
+            return original(self, *args, **kwargs)
+
+    setattr(clase, metodo, envoltura)
+
+def _stream_trazado(original, nombre, ruta, objeto, args, kwargs):
+    with span(nombre, 'firestore', anidar=False, ruta=ruta) as atributos:
+        documentos = 0
+        for documento in original(objeto, *args, **kwargs):
+            documentos += 1
+            yield documento
+        atributos['documentos'] = documentos
+
+def instrumentar_firestore():
+    """Registra un span por cada lectura, escritura o commit del cliente de Firestore (una sola vez)"""
+    global _instrumentado
+    if _instrumentado:
+        return
+    try:
+        from google.cloud.firestore_v1 import batch, client, collection, document, query, transaction
+    except ImportError:
+        return
+    for clase, metodos in (
+        (document.DocumentReference, ['get', 'set', 'update', 'delete', 'create']),
+        (query.Query, ['get', 'stream']),
+        (collection.CollectionReference, ['add']),  # get/stream delegan en Query
+        (batch.WriteBatch, ['commit']),
+        (transaction.Transaction, ['_commit']),
+        (client.Client, ['get_all']),
+    ):
+        for metodo in metodos:
+            _envolver_firestore(clase, metodo)
+    _instrumentado = True
+
+# ========== RESUMEN ==========
+def resumen_por_operacion(spans=None):
+    """Llamadas, p50, p95 y máximo (ms) por categoría y nombre, de más a menos tiempo total"""
+    spans = buffer.todos() if spans is None else spans
+    grupos = {}
+    for s in spans:
+        grupos.setdefault((s['categoria'], s['nombre']), []).append(s['duracion_ms'])
+    filas = []
+    for (categoria, nombre), duraciones in grupos.items():
+        duraciones = np.asarray(duraciones)
+        p50, p95 = np.percentile(duraciones, [50, 95])
+        filas.append({
+            'categoria': categoria,
+            'operacion': nombre,
+            'llamadas': len(duraciones),
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'max_ms': round(float(duraciones.max()), 2),
+            'total_ms': round(float(duraciones.sum()), 1),
+        })
+    return sorted(filas, key=lambda f: f['total_ms'], reverse=True)
+
+# ========== EXPORTACIÓN ==========
+def exportar_json(spans=None):
+    spans = buffer.todos() if spans is None else spans
+    return json.dumps(spans, ensure_ascii=False, default=str).encode('utf-8')
+
+def _atributo_otlp(clave, valor):
+    if isinstance(valor, bool):
+        return {'key': clave, 'value': {'boolValue': valor}}
+    if isinstance(valor, int):
+        return {'key': clave, 'value': {'intValue': str(valor)}}
+    if isinstance(valor, float):
+        return {'key': clave, 'value': {'doubleValue': valor}}
+    return {'key': clave, 'value': {'stringValue': str(valor)}}
+
+def exportar_otlp(spans=None):
+    """Spans en el formato JSON de OTLP (ExportTraceServiceRequest), importable por collectors y Jaeger"""
+    spans = buffer.todos() if spans is None else spans
+    otlp = []
+    for s in spans:
+        atributos = {'app.categoria': s['categoria'], 'app.pagina': s['pagina']}
+        if s['usuario']:
+            atributos['enduser.id'] = s['usuario']
+        atributos.update({f"app.{k}": v for k, v in s['atributos'].items() if v is not None})
+        fin_ns = s['inicio_ns'] + int(s['duracion_ms'] * 1_000_000)
+        span_otlp = {
+            'traceId': s['traza'],
+            'spanId': s['span'],
+            'name': s['nombre'],
+            'kind': 3 if s['categoria'] in ('firestore', 'llm') else 1,  # CLIENT / INTERNAL
+            'startTimeUnixNano': str(s['inicio_ns']),
+            'endTimeUnixNano': str(fin_ns),
+            'attributes': [_atributo_otlp(k, v) for k, v in atributos.items()],
+            'status': {'code': 1 if s['ok'] else 2},  # OK / ERROR
+        }
+        if s['padre']:
+            span_otlp['parentSpanId'] = s['padre']
+        otlp.append(span_otlp)
+    documento = {'resourceSpans': [{
+        'resource': {'attributes': [_atributo_otlp('service.name', NOMBRE_SERVICIO)]},
+        'scopeSpans': [{'scope': {'name': 'trazas'}, 'spans': otlp}],
+    }]}
+    return json.dumps(documento).encode('utf-8')
+
+def guardar_trazas(ruta, formato='json'):
+    """Escribe el buffer en un fichero ('json' propio u 'otlp') y devuelve cuántos spans se guardaron"""
+    spans = buffer.todos()
+    datos = exportar_otlp(spans) if formato == 'otlp' else exportar_json(spans)
+    with open(ruta, 'wb') as fichero:
+        fichero.write(datos)
+    return len(spans)